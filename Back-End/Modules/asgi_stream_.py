@@ -0,0 +1,358 @@
+# Modules/asgi_stream_.py
+import os
+import sys
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+
+from asgiref.sync import AsyncToSync, sync_to_async
+from werkzeug.exceptions import ClientDisconnected
+
+# Cabeçalho injetado pelo middleware na requisição: avisa o Flask que o corpo pode ser delegado
+OFFLOAD_REQUEST_HEADER = b"x-docsphere-offload"
+OFFLOAD_ENVIRON_KEY = "HTTP_X_DOCSPHERE_OFFLOAD"
+# Cabeçalhos internos da resposta (removidos antes de chegar ao cliente)
+FILE_HEADER = "X-Docsphere-File"
+FILE_RANGE_HEADER = "X-Docsphere-File-Range"
+EVENTS_HEADER = "X-Docsphere-Events"
+EVENTS_LAST_ID_HEADER = "X-Docsphere-Events-Last-Id"
+
+
+def offload_headers(full_path, offset, count):
+    """Cabeçalhos internos que pedem ao middleware para enviar count bytes de full_path a partir de offset."""
+    return {
+        FILE_HEADER: quote(os.path.abspath(full_path)),
+        FILE_RANGE_HEADER: f"{offset}-{count}",
+    }
+
+
+def events_offload_headers(user_key, last_event_id=None):
+    """Cabeçalhos internos que pedem ao middleware para manter a resposta aberta como stream SSE do usuário."""
+    headers = {EVENTS_HEADER: quote(user_key)}
+    if last_event_id:
+        headers[EVENTS_LAST_ID_HEADER] = quote(last_event_id)
+    return headers
+
+
+class MediaStreamMiddleware:
+    """
+    Middleware ASGI na frente do WsgiToAsgi(app).
+
+    O Flask continua decidindo autenticação, caminho, Range e cabeçalhos, mas para arquivos grandes
+    devolve só os cabeçalhos internos de offload com corpo vazio. Assim a thread do WsgiToAsgi é
+    liberada logo e o corpo é enviado aqui, no event loop:
+      - via extensão "http.response.zerocopysend" (o servidor usa os.sendfile) quando disponível;
+      - via "http.response.pathsend" para o arquivo inteiro, quando disponível;
+      - senão, leitura em blocos de chunk_size com os.pread num executor (fallback).
+
+    Do mesmo jeito, respostas com os cabeçalhos internos de eventos viram um stream SSE servido
+    por events.serve() no event loop: conexões abertas não ocupam threads do WsgiToAsgi.
+    """
+
+    def __init__(self, app, chunk_size=1024 * 1024, events=None, events_heartbeat=15):
+        self.app = app
+        self.chunk_size = chunk_size
+        self.events = events
+        self.events_heartbeat = events_heartbeat
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # Nunca confia no cabeçalho de offload vindo do cliente
+        scope = dict(scope)
+        scope["headers"] = [
+            (name, value) for name, value in scope.get("headers", [])
+            if name.lower() != OFFLOAD_REQUEST_HEADER
+        ] + [(OFFLOAD_REQUEST_HEADER, b"1")]
+
+        pending = {}
+        file_header = FILE_HEADER.lower().encode("latin-1")
+        range_header = FILE_RANGE_HEADER.lower().encode("latin-1")
+        events_header = EVENTS_HEADER.lower().encode("latin-1")
+        events_last_header = EVENTS_LAST_ID_HEADER.lower().encode("latin-1")
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                headers = []
+                for name, value in message.get("headers", []):
+                    lname = name.lower()
+                    if lname == file_header:
+                        pending["path"] = unquote(value.decode("latin-1"))
+                    elif lname == range_header:
+                        offset, _, count = value.decode("latin-1").partition("-")
+                        pending["offset"], pending["count"] = int(offset), int(count)
+                    elif lname == events_header and self.events is not None:
+                        pending["events"] = unquote(value.decode("latin-1"))
+                    elif lname == events_last_header:
+                        pending["last_event_id"] = unquote(value.decode("latin-1"))
+                    else:
+                        headers.append((name, value))
+                if "events" in pending:
+                    # stream sem fim: o Content-Length do corpo vazio do Flask não vale
+                    headers = [(name, value) for name, value in headers if name.lower() != b"content-length"]
+                if "path" in pending or "events" in pending:
+                    message = dict(message, headers=headers)
+                await send(message)
+                return
+            if message["type"] == "http.response.body" and ("path" in pending or "events" in pending):
+                # corpo do Flask é vazio; o arquivo/stream é enviado depois que o app retornar
+                return
+            await send(message)
+
+        await self.app(scope, receive, wrapped_send)
+
+        if "path" in pending:
+            await self._send_file(scope, receive, send, pending["path"],
+                                  pending.get("offset", 0), pending.get("count"))
+        elif "events" in pending:
+            await self.events.serve(pending["events"], pending.get("last_event_id"), receive, send,
+                                    heartbeat=self.events_heartbeat)
+
+    async def _send_file(self, scope, receive, send, path, offset, count):
+        if count is None:
+            count = os.path.getsize(path) - offset
+        if scope.get("method") == "HEAD" or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.pathsend" in extensions and offset == 0 and count == os.path.getsize(path):
+            await send({"type": "http.response.pathsend", "path": path})
+            return
+
+        with open(path, "rb") as f:
+            if "http.response.zerocopysend" in extensions:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": offset,
+                    "count": count,
+                    "more_body": False,
+                })
+                return
+
+            loop = asyncio.get_running_loop()
+            disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+            try:
+                fd = f.fileno()
+                remaining = count
+                while remaining > 0 and not disconnected.done():
+                    chunk = await loop.run_in_executor(None, os.pread, fd, min(self.chunk_size, remaining), offset)
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0 and not disconnected.done():
+                    # arquivo encolheu durante o envio: encerra a resposta
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+            finally:
+                disconnected.cancel()
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+
+class ReceiveStream:
+    """
+    wsgi.input que entrega o corpo da requisição conforme as mensagens http.request chegam,
+    sem bufferizar o corpo inteiro. Cada read() devolve no máximo o que já chegou.
+    """
+
+    def __init__(self, receive_sync):
+        self._receive = receive_sync
+        self._buffer = bytearray()
+        self._done = False
+
+    def _fill(self):
+        message = self._receive()
+        if message["type"] == "http.disconnect":
+            self._done = True
+            raise ClientDisconnected()
+        self._buffer += message.get("body", b"")
+        if not message.get("more_body", False):
+            self._done = True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while not self._done:
+                self._fill()
+            size = len(self._buffer)
+        while not self._buffer and not self._done:
+            self._fill()
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readline(self, size=-1):
+        while b"\n" not in self._buffer and not self._done and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        end = self._buffer.find(b"\n") + 1 or len(self._buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+
+class StreamingWsgiToAsgiInstance:
+    """
+    Uma requisição HTTP atravessando a ponte ASGI -> WSGI. Toda a chamada WSGI (environ,
+    start_response e envio da resposta) é feita aqui; do asgiref só se usa a API pública de
+    asgiref.sync, então a ponte não depende de detalhes internos do asgiref.wsgi.
+    """
+
+    def __init__(self, wsgi_application, duplicate_header_limit, executor):
+        self.wsgi_application = wsgi_application
+        self.duplicate_header_limit = duplicate_header_limit
+        self.executor = executor
+        self.response_start = None
+        self.response_started = False
+        self.response_content_length = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            raise ValueError("WSGI wrapper received a non-HTTP scope")
+        self.scope = scope
+        self.sync_send = AsyncToSync(send)
+        body = ReceiveStream(AsyncToSync(receive))
+        await sync_to_async(self._run_wsgi_app, thread_sensitive=False, executor=self.executor)(body)
+
+    def build_environ(self, scope, body):
+        """Environ WSGI (PEP 3333) do scope ASGI; ValueError se um cabeçalho se repete demais."""
+        script_name = scope.get("root_path", "").encode("utf8").decode("latin1")
+        path_info = scope["path"].encode("utf8").decode("latin1")
+        if path_info.startswith(script_name):
+            path_info = path_info[len(script_name):]
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": script_name,
+            "PATH_INFO": path_info,
+            "QUERY_STRING": scope["query_string"].decode("ascii"),
+            "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            # o corpo termina quando o ASGI sinaliza more_body=False (vale também para chunked)
+            "wsgi.input_terminated": True,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        server = scope.get("server") or ("localhost", 80)
+        environ["SERVER_NAME"] = server[0]
+        environ["SERVER_PORT"] = str(server[1])
+        if scope.get("client") is not None:
+            environ["REMOTE_ADDR"] = scope["client"][0]
+
+        headers = defaultdict(list)
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin1").lower()
+            if name == "content-length":
+                key = "CONTENT_LENGTH"
+            elif name == "content-type":
+                key = "CONTENT_TYPE"
+            else:
+                key = "HTTP_" + name.upper().replace("-", "_")
+            if self.duplicate_header_limit and len(headers[key]) >= self.duplicate_header_limit:
+                raise ValueError(f"Too many duplicate headers: {key} exceeds limit of {self.duplicate_header_limit}")
+            headers[key].append(value.decode("latin1"))
+        for key, values in headers.items():
+            environ[key] = ",".join(values)
+        return environ
+
+    def start_response(self, status, response_headers, exc_info=None):
+        """start_response do WSGI: guarda o http.response.start, enviado junto com o primeiro bloco."""
+        if exc_info is not None:
+            try:
+                if self.response_started:
+                    # cabeçalhos já foram para o cliente: só resta propagar o erro
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self.response_start is not None:
+            raise ValueError("You cannot call start_response a second time without exc_info")
+        status_code = int(status.split(" ", 1)[0])
+        self.response_content_length = None
+        headers = []
+        for name, value in response_headers:
+            if name.lower() == "content-length":
+                self.response_content_length = int(value)
+            headers.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+        self.response_start = {"type": "http.response.start", "status": status_code, "headers": headers}
+        return self._write
+
+    def _write(self, data):
+        """write() legado do start_response (PEP 3333): envia data na hora."""
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        if data:
+            self.sync_send({"type": "http.response.body", "body": data, "more_body": True})
+
+    def _run_wsgi_app(self, body):
+        """Executa o app WSGI na thread do pool e repassa a resposta ao ASGI."""
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            # limite de cabeçalhos repetidos excedido
+            self.sync_send({"type": "http.response.start", "status": 400,
+                            "headers": [(b"content-type", b"text/plain")]})
+            self.sync_send({"type": "http.response.body", "body": b"Bad Request: Too many duplicate headers"})
+            return
+        bytes_sent = 0
+        response = self.wsgi_application(environ, self.start_response)
+        try:
+            for output in response:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                # nunca mais bytes que o Content-Length declarado pelo app
+                if self.response_content_length is not None:
+                    output = output[:self.response_content_length - bytes_sent]
+                self.sync_send({"type": "http.response.body", "body": output, "more_body": True})
+                bytes_sent += len(output)
+                if bytes_sent == self.response_content_length:
+                    break
+        finally:
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({"type": "http.response.body"})
+
+
+class StreamingWsgiToAsgi:
+    """
+    Ponte ASGI -> WSGI no lugar do WsgiToAsgi do asgiref, que:
+      - não grava o corpo inteiro num SpooledTemporaryFile antes de chamar o Flask; o app lê
+        o corpo em streaming (uploads vão direto para o destino final);
+      - executa cada requisição num pool de max_threads threads, em vez da thread única
+        compartilhada que o sync_to_async usa por padrão (que serializava as requisições do worker).
+    """
+
+    def __init__(self, wsgi_application, duplicate_header_limit=100, max_threads=64):
+        self.wsgi_application = wsgi_application
+        self.duplicate_header_limit = duplicate_header_limit
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        await StreamingWsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit, self.executor)(
+            scope, receive, send
+        )
@@ -0,0 +1,214 @@
+# Modules/blob_store_.py
+import os
+import time
+import errno
+import sqlite3
+import hashlib
+import threading
+
+
+class HashingWriter:
+    """Arquivo de escrita que calcula o SHA-256 e o tamanho do que passa por ele."""
+
+    def __init__(self, f):
+        self._f = f
+        self._hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hasher.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def hexdigest(self):
+        return self._hasher.hexdigest()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """SHA-256 de um arquivo já gravado (usado quando os bytes chegaram fora de ordem)."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class BlobStore:
+    """
+    Armazenamento endereçado por conteúdo em {base_dir}/ab/cd/{sha256}.
+
+    O arquivo do projeto continua em {usuario}/{projeto}/{video_id}_{nome} (serverFilePath não
+    muda), mas passa a ser um hardlink do blob: conteúdo repetido ocupa disco e page cache uma
+    única vez. As referências (usuario, projeto, video_id) -> hash e a contagem por blob ficam em
+    SQLite (WAL, compartilhado entre os workers); o blob só é apagado quando a última referência sai.
+    """
+
+    def __init__(self, base_dir, db_path=None):
+        self.base_dir = base_dir
+        self.db_path = db_path or os.path.join(base_dir, "blobs.sqlite3")
+        self._local = threading.local()
+        os.makedirs(base_dir, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " hash TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " refcount INTEGER NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS blob_refs ("
+            " user TEXT NOT NULL,"
+            " project TEXT NOT NULL,"
+            " video_id TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " PRIMARY KEY (user, project, video_id))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS blob_refs_hash ON blob_refs(hash)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def blob_path(self, content_hash):
+        return os.path.join(self.base_dir, content_hash[:2], content_hash[2:4], content_hash)
+
+    def adopt(self, file_path, content_hash, ref):
+        """
+        Registra o arquivo recém-gravado file_path (conteúdo content_hash) para a referência
+        ref = (usuario, projeto, video_id). Se o blob já existe, file_path é trocado por um
+        hardlink dele (a cópia recém-enviada é descartada); senão o próprio arquivo vira o blob.
+        Retorna True se o conteúdo já existia (deduplicado).
+        """
+        blob = self.blob_path(content_hash)
+        size = os.path.getsize(file_path)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT size FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+            deduplicated = row is not None and os.path.exists(blob)
+            if deduplicated:
+                tmp_link = f"{file_path}.{os.getpid()}.link"
+                try:
+                    os.link(blob, tmp_link)
+                except OSError as e:
+                    if e.errno != errno.EMLINK:
+                        raise
+                    # limite de hardlinks do blob: mantém esta cópia fora da deduplicação
+                    conn.execute("ROLLBACK")
+                    return False
+                os.replace(tmp_link, file_path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                if os.path.exists(blob):
+                    os.remove(blob)
+                os.link(file_path, blob)
+                # linha sem arquivo (blob removido manualmente): mantém a contagem existente
+                conn.execute(
+                    "INSERT INTO blobs (hash, size, refcount, created_at) VALUES (?, ?, 0, ?) "
+                    "ON CONFLICT(hash) DO UPDATE SET size = excluded.size",
+                    (content_hash, size, time.time()),
+                )
+            previous = conn.execute(
+                "SELECT hash FROM blob_refs WHERE user = ? AND project = ? AND video_id = ?", ref
+            ).fetchone()
+            if previous is not None:
+                self._decref(conn, previous[0])
+            conn.execute(
+                "INSERT OR REPLACE INTO blob_refs (user, project, video_id, hash) VALUES (?, ?, ?, ?)",
+                (*ref, content_hash),
+            )
+            conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (content_hash,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return deduplicated
+
+    def size_for_user(self, user, content_hash):
+        """Tamanho do blob se o usuário já tem alguma referência a ele (e o arquivo existe), senão None."""
+        row = self._conn().execute(
+            "SELECT b.size FROM blobs b JOIN blob_refs r ON r.hash = b.hash "
+            "WHERE r.user = ? AND b.hash = ? LIMIT 1",
+            (user, content_hash),
+        ).fetchone()
+        if row is None or not os.path.exists(self.blob_path(content_hash)):
+            return None
+        return row[0]
+
+    def link(self, content_hash, dest_path):
+        """Cria dest_path como hardlink do blob (sem copiar bytes). False se o blob sumiu nesse meio tempo."""
+        try:
+            os.link(self.blob_path(content_hash), dest_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, refs):
+        """Remove as referências [(usuario, projeto, video_id)]; apaga os blobs que ficarem sem nenhuma."""
+        return self._release("SELECT hash, user, project, video_id FROM blob_refs "
+                             "WHERE user = ? AND project = ? AND video_id = ?", list(refs))
+
+    def release_project(self, user, project):
+        """Remove todas as referências de um projeto."""
+        return self._release("SELECT hash, user, project, video_id FROM blob_refs "
+                             "WHERE user = ? AND project = ?", [(user, project)])
+
+    def _release(self, query, params_list):
+        conn = self._conn()
+        removed = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for params in params_list:
+                for content_hash, user, project, video_id in conn.execute(query, params).fetchall():
+                    conn.execute(
+                        "DELETE FROM blob_refs WHERE user = ? AND project = ? AND video_id = ?",
+                        (user, project, video_id),
+                    )
+                    removed += self._decref(conn, content_hash)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def _decref(self, conn, content_hash):
+        conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (content_hash,))
+        row = conn.execute("SELECT refcount FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+        if row is None or row[0] > 0:
+            return 0
+        conn.execute("DELETE FROM blobs WHERE hash = ?", (content_hash,))
+        try:
+            os.remove(self.blob_path(content_hash))
+        except FileNotFoundError:
+            pass
+        return 1
+
+    def stats(self):
+        blobs, refs, stored, logical = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(refcount), 0), COALESCE(SUM(size), 0), "
+            "COALESCE(SUM(size * refcount), 0) FROM blobs"
+        ).fetchone()
+        return {
+            "blobs": blobs,
+            "references": refs,
+            "bytes_stored": stored,
+            "bytes_saved": logical - stored,
+        }
@@ -0,0 +1,121 @@
+# Modules/cache_.py
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUTTLCache:
+    """
+    Cache em memória limitado (por número de entradas e, opcionalmente, por bytes),
+    com expiração por TTL, despejo LRU e acesso protegido por lock.
+
+    Cada entrada pode pertencer a um grupo (ex.: (usuario, projeto)); o índice secundário
+    de grupos permite invalidar todas as entradas de um grupo em O(entradas do grupo).
+    """
+
+    def __init__(self, max_entries=10000, ttl=300, max_bytes=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (value, expires_at, group, size)
+        self._groups = {}           # group -> set(keys)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        value, expires_at, group, size = self._data.pop(key)
+        self._bytes -= size
+        if group is not None:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+
+    def _evict_if_needed(self):
+        while self._data and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            oldest_key = next(iter(self._data))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            if item[1] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, group=None, ttl=None, size=None):
+        if size is None:
+            size = sys.getsizeof(value) if self.max_bytes is not None else 0
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, group, size)
+            self._bytes += size
+            if group is not None:
+                self._groups.setdefault(group, set()).add(key)
+            self._evict_if_needed()
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+                self.invalidations += 1
+                return True
+            return False
+
+    def invalidate_group(self, group):
+        """Remove todas as entradas de um grupo. Retorna quantas foram removidas."""
+        with self._lock:
+            keys = list(self._groups.get(group, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._groups.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,182 @@
+# Modules/expiry_reaper_.py
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryReaper:
+    """
+    Remove os projetos vencidos (delete_after) em segundo plano, a partir de um índice ordenado
+    por data de expiração: cada volta lê só as entradas já vencidas, em lotes, sem varrer a
+    árvore de projetos.
+
+    - fetch_due(after_key, limit) -> [(chave, entrada)] vencidas com chave > after_key, em ordem
+    - reap(entrada, dry_run) -> (status, bytes); status: "reaped", "stale" (o projeto não existe
+      mais ou tem outro delete_after) ou "skipped" (mantém a entrada para a próxima volta)
+    - drop(chaves) remove as entradas do índice já tratadas (uma atualização por lote)
+
+    Só um processo por vez executa uma volta (flock em lock_path). Com dry_run, nada é removido:
+    as entradas e os bytes que seriam recuperados aparecem só nos logs e nas métricas.
+
+    Projetos criados antes do índice entram por uma carga única: com backfill(usuario) -> entradas
+    gravadas e list_users(), cada volta indexa no máximo backfill_users_per_run usuários antes de
+    buscar os vencidos; os usuários concluídos ficam em backfill_state_path até a carga terminar.
+    """
+
+    def __init__(self, fetch_due, reap, drop, lock_path, interval=300, batch_size=50,
+                 max_per_run=200, dry_run=False, start_delay=30, backfill=None, list_users=None,
+                 backfill_state_path=None, backfill_users_per_run=50):
+        self._fetch_due = fetch_due
+        self._reap = reap
+        self._drop = drop
+        self._backfill = backfill
+        self._list_users = list_users
+        self.lock_path = lock_path
+        self.backfill_state_path = backfill_state_path or os.path.join(os.path.dirname(lock_path),
+                                                                       "expiry_backfill.json")
+        self.backfill_users_per_run = backfill_users_per_run
+        self.backfill_finished = backfill is None
+        self.backfilled = 0
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_per_run = max_per_run
+        self.dry_run = dry_run
+        self.start_delay = start_delay
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.runs = 0
+        self.last_run_at = None
+        self.reaped = 0
+        self.stale = 0
+        self.errors = 0
+        self.bytes_reclaimed = 0
+        self.last_run = None
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+
+    def start(self):
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="expiry-reaper", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        # a primeira volta espera a subida do worker terminar
+        time.sleep(self.start_delay)
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"[EXPIRY] Erro na remoção de projetos vencidos: {e}", exc_info=True)
+            time.sleep(self.interval)
+
+    def run_once(self):
+        """Uma volta do reaper. Retorna o resumo da volta, ou None se outro processo está nela."""
+        with open(self.lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            if not self.backfill_finished:
+                self._run_backfill()
+            summary = {"dry_run": self.dry_run, "reaped": 0, "stale": 0, "skipped": 0, "bytes": 0,
+                       "projects": []}
+            after_key = None
+            processed = 0
+            while processed < self.max_per_run:
+                due = self._fetch_due(after_key, min(self.batch_size, self.max_per_run - processed))
+                if not due:
+                    break
+                done = []
+                for key, entry in due:
+                    after_key = key
+                    processed += 1
+                    try:
+                        status, nbytes = self._reap(entry, self.dry_run)
+                    except Exception as e:
+                        self.errors += 1
+                        status, nbytes = "skipped", 0
+                        logger.error(f"[EXPIRY] Falha ao remover {entry.get('user')}/{entry.get('project')}: {e}",
+                                     exc_info=True)
+                    summary[status] += 1
+                    if status == "reaped":
+                        summary["bytes"] += nbytes
+                        summary["projects"].append(f"{entry.get('user')}/{entry.get('project')}")
+                    if status != "skipped":
+                        done.append(key)
+                if done and not self.dry_run:
+                    self._drop(done)
+                if len(due) < self.batch_size:
+                    break
+
+            self.runs += 1
+            self.last_run_at = time.time()
+            self.last_run = {k: v for k, v in summary.items() if k != "projects"}
+            if not self.dry_run:
+                self.reaped += summary["reaped"]
+                self.stale += summary["stale"]
+                self.bytes_reclaimed += summary["bytes"]
+            if summary["reaped"] or summary["stale"]:
+                prefix = "[EXPIRY][DRY-RUN] Seriam removidos" if self.dry_run else "[EXPIRY] Removidos"
+                logger.info(f"{prefix} {summary['reaped']} projeto(s) vencido(s), {summary['bytes']} bytes "
+                            f"({summary['stale']} entrada(s) obsoleta(s) no índice)")
+            return summary
+
+    def _load_backfill_state(self):
+        try:
+            with open(self.backfill_state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"done_users": [], "finished": False}
+
+    def _save_backfill_state(self, state):
+        tmp_path = f"{self.backfill_state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.backfill_state_path)
+
+    def _run_backfill(self):
+        """Indexa os projetos existentes de até backfill_users_per_run usuários ainda não carregados."""
+        state = self._load_backfill_state()
+        if state.get("finished"):
+            self.backfill_finished = True
+            return
+        done = set(state.get("done_users") or [])
+        pending = sorted(user for user in self._list_users() if user not in done)
+        for user in pending[:self.backfill_users_per_run]:
+            try:
+                self.backfilled += self._backfill(user)
+            except Exception as e:
+                # o usuário fica para a próxima volta
+                self.errors += 1
+                logger.warning(f"[EXPIRY] Falha ao indexar projetos existentes de {user}: {e}")
+                return
+            done.add(user)
+            state["done_users"] = sorted(done)
+            self._save_backfill_state(state)
+        if len(pending) <= self.backfill_users_per_run:
+            self._save_backfill_state({"finished": True, "finished_at": time.time()})
+            self.backfill_finished = True
+            logger.info(f"[EXPIRY] Índice project_expiry carregado com os projetos existentes "
+                        f"({self.backfilled} entrada(s) neste processo)")
+
+    def stats(self):
+        return {
+            "dry_run": self.dry_run,
+            "backfill_finished": self.backfill_finished,
+            "backfilled": self.backfilled,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "runs": self.runs,
+            "last_run_at": self.last_run_at,
+            "last_run": self.last_run,
+            "projects_reaped": self.reaped,
+            "stale_entries": self.stale,
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "errors": self.errors,
+        }
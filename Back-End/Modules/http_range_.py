@@ -0,0 +1,223 @@
+# Modules/http_range_.py
+import os
+import uuid
+import mimetypes
+import unicodedata
+from urllib.parse import quote
+
+from flask import Response
+from werkzeug.http import http_date, parse_date, parse_etags
+
+from Modules.asgi_stream_ import offload_headers
+
+# Acima disso o cabeçalho Range é ignorado (resposta 200 completa), como permite a RFC 7233
+MAX_RANGES = 16
+
+
+def file_etag(st):
+    """ETag forte derivado da identidade do arquivo (inode, tamanho e mtime em ns)."""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def parse_range_header(value, size):
+    """
+    Interpreta um cabeçalho Range de bytes (RFC 7233).
+    Retorna:
+      - None se o cabeçalho estiver ausente, for inválido ou tiver intervalos demais (serve 200)
+      - [] se nenhum intervalo for satisfatível (responde 416), inclusive qualquer Range num
+        arquivo vazio
+      - lista de (inicio, fim) inclusivos, ordenada e com sobreposições unidas
+    """
+    if not value:
+        return None
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    parts = spec.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+    for part in parts:
+        part = part.strip()
+        if "-" not in part:
+            return None
+        first, _, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        try:
+            if first == "":
+                # sufixo: últimos N bytes
+                suffix = int(last)
+                if suffix <= 0 or size == 0:
+                    # sufixo de um arquivo vazio não tem nenhum byte: insatisfatível
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                start = int(first)
+                if last and int(last) < start:
+                    return None
+                end = min(int(last), size - 1) if last else size - 1
+        except ValueError:
+            return None
+        if start < 0:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, end))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def is_not_modified(headers, etag, mtime):
+    """Avalia If-None-Match (comparação fraca) e, na ausência dele, If-Modified-Since."""
+    if_none_match = headers.get("If-None-Match")
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return etags.star_tag or etags.contains_weak(etag.strip('"'))
+    if_modified_since = parse_date(headers.get("If-Modified-Since"))
+    if if_modified_since is not None:
+        return int(mtime) <= int(if_modified_since.timestamp())
+    return False
+
+
+def if_range_allows(headers, etag, mtime):
+    """If-Range: o Range só vale se o validador (ETag forte ou data) ainda corresponder ao arquivo."""
+    value = headers.get("If-Range")
+    if not value:
+        return True
+    value = value.strip()
+    if value.startswith('"') or value.startswith("W/"):
+        return value == etag
+    date = parse_date(value)
+    return date is not None and int(mtime) == int(date.timestamp())
+
+
+def _content_disposition(download_name, as_attachment):
+    kind = "attachment" if as_attachment else "inline"
+    if not download_name:
+        return kind
+    try:
+        download_name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name).encode("ascii", "ignore").decode("ascii")
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        return f"{kind}; filename=\"{simple}\"; filename*=UTF-8''{quoted}"
+    escaped = download_name.replace("\\", "\\\\").replace('"', '\\"')
+    return f'{kind}; filename="{escaped}"'
+
+
+def _read_ranges(path, ranges, chunk_size, on_bytes=None, pieces=None):
+    """Gera os bytes dos intervalos pedidos, lendo o arquivo em blocos de chunk_size."""
+    with open(path, "rb") as f:
+        for index, (start, end) in enumerate(ranges):
+            if pieces:
+                yield pieces[index]
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                if on_bytes:
+                    on_bytes(len(chunk))
+                yield chunk
+        if pieces and len(pieces) > len(ranges):
+            yield pieces[-1]
+
+
+def send_file_ranged(full_path, request_headers, download_name=None, as_attachment=True,
+                     mimetype=None, chunk_size=1024 * 1024, st=None, on_event=None, offload=False):
+    """
+    Envia um arquivo com suporte a GET condicional (ETag forte, If-None-Match,
+    If-Modified-Since -> 304 sem abrir o arquivo) e a Range de um ou vários intervalos
+    (206 simples ou multipart/byteranges, 416 quando insatisfatível).
+
+    Com offload=True (requisição atendida pelo MediaStreamMiddleware), respostas 200 e 206 de um
+    intervalo saem com corpo vazio e cabeçalhos internos; o middleware envia o arquivo.
+
+    on_event(nome, quantidade) é chamado para alimentar métricas: "status_200", "status_206",
+    "status_206_multi", "status_304", "status_416" e "bytes_sent".
+    """
+    def emit(name, amount=1):
+        if on_event:
+            on_event(name, amount)
+
+    st = st or os.stat(full_path)
+    size = st.st_size
+    etag = file_etag(st)
+    mimetype = mimetype or mimetypes.guess_type(download_name or full_path)[0] or "application/octet-stream"
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(st.st_mtime),
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": _content_disposition(download_name, as_attachment),
+    }
+
+    if is_not_modified(request_headers, etag, st.st_mtime):
+        emit("status_304")
+        headers.pop("Content-Disposition")
+        return Response(status=304, headers=headers)
+
+    ranges = None
+    if if_range_allows(request_headers, etag, st.st_mtime):
+        ranges = parse_range_header(request_headers.get("Range"), size)
+
+    if ranges == []:
+        emit("status_416")
+        headers["Content-Range"] = f"bytes */{size}"
+        headers.pop("Content-Disposition")
+        return Response(status=416, headers=headers)
+
+    on_bytes = lambda n: emit("bytes_sent", n)
+
+    if ranges is None:
+        emit("status_200")
+        headers["Content-Length"] = str(size)
+        if offload:
+            emit("bytes_sent", size)
+            headers.update(offload_headers(full_path, 0, size))
+            return Response(status=200, headers=headers, mimetype=mimetype)
+        body = _read_ranges(full_path, [(0, size - 1)] if size else [], chunk_size, on_bytes)
+        return Response(body, status=200, headers=headers, mimetype=mimetype, direct_passthrough=True)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        emit("status_206")
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        if offload:
+            emit("bytes_sent", end - start + 1)
+            headers.update(offload_headers(full_path, start, end - start + 1))
+            return Response(status=206, headers=headers, mimetype=mimetype)
+        body = _read_ranges(full_path, ranges, chunk_size, on_bytes)
+        return Response(body, status=206, headers=headers, mimetype=mimetype, direct_passthrough=True)
+
+    # Vários intervalos: multipart/byteranges
+    boundary = uuid.uuid4().hex
+    pieces = [
+        (
+            ("\r\n" if i else "")
+            + f"--{boundary}\r\n"
+            + f"Content-Type: {mimetype}\r\n"
+            + f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("ascii")
+        for i, (start, end) in enumerate(ranges)
+    ]
+    pieces.append(f"\r\n--{boundary}--\r\n".encode("ascii"))
+    content_length = sum(len(p) for p in pieces) + sum(end - start + 1 for start, end in ranges)
+
+    emit("status_206_multi")
+    headers["Content-Length"] = str(content_length)
+    body = _read_ranges(full_path, ranges, chunk_size, on_bytes, pieces)
+    response = Response(body, status=206, headers=headers, direct_passthrough=True)
+    response.headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    return response
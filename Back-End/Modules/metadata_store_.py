@@ -0,0 +1,399 @@
+# Modules/metadata_store_.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+def _split(path):
+    return [part for part in (path or "").split("/") if part]
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _set_nested(node, parts, value):
+    """Grava value em node[parts...] como o Firebase faria (None remove; nós vazios somem)."""
+    if not parts:
+        return value
+    node = dict(node) if isinstance(node, dict) else {}
+    child = _set_nested(node.get(parts[0]), parts[1:], value)
+    if child is None or child == {}:
+        node.pop(parts[0], None)
+    else:
+        node[parts[0]] = child
+    return node
+
+
+class MetadataStore:
+    """
+    Espelho local (SQLite WAL, compartilhado entre os workers) dos nós projects/{usuario} e
+    user_settings/{usuario} do Firebase, que continua sendo a fonte da verdade.
+
+    - Escrita: as rotas gravam no Firebase e repetem a mesma atualização multi-caminho aqui
+      (apply_updates). Os listeners do Firebase (um por usuário em uso) aplicam as alterações
+      feitas por outros processos (apply_event); o estado inicial de cada listener recarrega só
+      aquele usuário.
+    - Leitura: só para usuários já sincronizados (is_synced); os demais são carregados do
+      Firebase na primeira leitura (load_user). Escritas de usuários não sincronizados são
+      ignoradas: o próximo load_user traz o estado completo.
+
+    Cada projeto é uma linha (campos do nó sem "videos") e cada item de projects/.../videos é
+    outra, indexada por (usuario, video_id) para as rotas que só recebem o id.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS projects ("
+            " user TEXT NOT NULL,"
+            " project TEXT NOT NULL,"
+            " created_at TEXT,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (user, project))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS videos ("
+            " user TEXT NOT NULL,"
+            " project TEXT NOT NULL,"
+            " video_id TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (user, project, video_id))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS videos_by_id ON videos(user, video_id)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS settings ("
+            " user TEXT PRIMARY KEY,"
+            " data TEXT)"  # NULL: usuário sem configurações no Firebase
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS synced_users ("
+            " user TEXT PRIMARY KEY,"
+            " synced_at REAL NOT NULL,"
+            " read_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- sincronização ------------------------------------------------------------
+
+    def is_synced(self, user):
+        return self._conn().execute("SELECT 1 FROM synced_users WHERE user = ?", (user,)).fetchone() is not None
+
+    def touch(self, user):
+        """Registra uma leitura do usuário (usada pela reconciliação). Retorna is_synced(user)."""
+        cur = self._conn().execute(
+            "UPDATE synced_users SET read_at = ? WHERE user = ? AND read_at < ?",
+            (time.time(), user, time.time() - 60),
+        )
+        return cur.rowcount > 0 or self.is_synced(user)
+
+    def load_user(self, user, projects_tree, synced_at=None):
+        """Substitui os projetos do usuário pelo estado lido do Firebase e o marca como sincronizado."""
+        with self._transaction() as conn:
+            self._replace_user(conn, user, projects_tree)
+            self._mark_synced(conn, user, synced_at)
+
+    def forget(self, user):
+        """Descarta o usuário do espelho: a próxima leitura recarrega do Firebase."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM projects WHERE user = ?", (user,))
+            conn.execute("DELETE FROM videos WHERE user = ?", (user,))
+            conn.execute("DELETE FROM settings WHERE user = ?", (user,))
+            conn.execute("DELETE FROM synced_users WHERE user = ?", (user,))
+
+    def claim_reconcile(self, max_age, limit=50):
+        """
+        Usuários lidos desde a última sincronização e sincronizados há mais de max_age segundos.
+        O synced_at é adiantado na mesma transação, então cada usuário é entregue a um só worker.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            users = [row[0] for row in conn.execute(
+                "SELECT user FROM synced_users WHERE synced_at < ? AND read_at >= synced_at "
+                "ORDER BY synced_at LIMIT ?", (now - max_age, limit))]
+            conn.executemany("UPDATE synced_users SET synced_at = ? WHERE user = ?", [(now, user) for user in users])
+        return users
+
+    def _mark_synced(self, conn, user, synced_at=None):
+        now = synced_at or time.time()
+        conn.execute(
+            "INSERT INTO synced_users (user, synced_at, read_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user) DO UPDATE SET synced_at = excluded.synced_at",
+            (user, now, now),
+        )
+
+    def _replace_user(self, conn, user, projects_tree):
+        conn.execute("DELETE FROM projects WHERE user = ?", (user,))
+        conn.execute("DELETE FROM videos WHERE user = ?", (user,))
+        for project, details in (projects_tree or {}).items():
+            if isinstance(details, dict):
+                self._put_project(conn, user, project, details)
+
+    def _put_project(self, conn, user, project, details):
+        conn.execute("DELETE FROM videos WHERE user = ? AND project = ?", (user, project))
+        fields = {k: v for k, v in details.items() if k != "videos"}
+        self._save_project_fields(conn, user, project, fields)
+        for video_id, video in (details.get("videos") or {}).items():
+            if isinstance(video, dict):
+                self._save_video(conn, user, project, video_id, video)
+
+    def _save_project_fields(self, conn, user, project, fields):
+        created_at = fields.get("createdAt")
+        conn.execute(
+            "INSERT OR REPLACE INTO projects (user, project, created_at, data) VALUES (?, ?, ?, ?)",
+            (user, project, created_at if isinstance(created_at, str) else None, _dumps(fields)),
+        )
+
+    def _save_video(self, conn, user, project, video_id, video):
+        conn.execute(
+            "INSERT OR REPLACE INTO videos (user, project, video_id, data) VALUES (?, ?, ?, ?)",
+            (user, project, video_id, _dumps(video)),
+        )
+
+    def _ensure_project(self, conn, user, project):
+        conn.execute(
+            "INSERT OR IGNORE INTO projects (user, project, created_at, data) VALUES (?, ?, NULL, '{}')",
+            (user, project),
+        )
+
+    # --- escrita ------------------------------------------------------------------
+
+    def apply_updates(self, updates):
+        """Aplica uma atualização multi-caminho do Firebase ({caminho: valor}); caminhos fora de projects/ e user_settings/ são ignorados."""
+        with self._transaction() as conn:
+            for path, value in updates.items():
+                parts = _split(path)
+                if parts and parts[0] == "projects":
+                    self._apply_projects(conn, parts[1:], value)
+                elif parts and parts[0] == "user_settings" and len(parts) >= 2:
+                    self._apply_settings(conn, parts[1], parts[2:], value)
+
+    def apply_event(self, event_type, path, data):
+        """Evento de um listener do Firebase (path relativo a projects/, começando pelo usuário)."""
+        base = "projects/" + "/".join(_split(path))
+        if event_type == "put":
+            self.apply_updates({base: data})
+        elif event_type == "patch" and isinstance(data, dict):
+            self.apply_updates({f"{base}/{key}": value for key, value in data.items()})
+
+    def _apply_projects(self, conn, parts, value):
+        if not parts:
+            # a raiz inteira nunca é carregada aqui: os usuários entram um a um (load_user ou listener)
+            return
+
+        user = parts[0]
+        if len(parts) == 1:
+            # nó inteiro do usuário: estado completo
+            self._replace_user(conn, user, value if isinstance(value, dict) else {})
+            self._mark_synced(conn, user)
+            return
+        if conn.execute("SELECT 1 FROM synced_users WHERE user = ?", (user,)).fetchone() is None:
+            return
+
+        project, rest = parts[1], parts[2:]
+        if not rest:
+            if isinstance(value, dict):
+                self._put_project(conn, user, project, value)
+            else:
+                conn.execute("DELETE FROM projects WHERE user = ? AND project = ?", (user, project))
+                conn.execute("DELETE FROM videos WHERE user = ? AND project = ?", (user, project))
+            return
+
+        if rest[0] == "videos":
+            if len(rest) == 1:
+                conn.execute("DELETE FROM videos WHERE user = ? AND project = ?", (user, project))
+                for video_id, video in (value or {}).items() if isinstance(value, dict) else ():
+                    if isinstance(video, dict):
+                        self._save_video(conn, user, project, video_id, video)
+            else:
+                video_id = rest[1]
+                row = conn.execute("SELECT data FROM videos WHERE user = ? AND project = ? AND video_id = ?",
+                                   (user, project, video_id)).fetchone()
+                video = _set_nested(json.loads(row[0]) if row else {}, rest[2:], value)
+                if isinstance(video, dict) and video:
+                    self._save_video(conn, user, project, video_id, video)
+                else:
+                    conn.execute("DELETE FROM videos WHERE user = ? AND project = ? AND video_id = ?",
+                                 (user, project, video_id))
+            if value is not None:
+                self._ensure_project(conn, user, project)
+            return
+
+        row = conn.execute("SELECT data FROM projects WHERE user = ? AND project = ?", (user, project)).fetchone()
+        if row is None and value is None:
+            return
+        fields = _set_nested(json.loads(row[0]) if row else {}, rest, value)
+        self._save_project_fields(conn, user, project, fields if isinstance(fields, dict) else {})
+
+    def _apply_settings(self, conn, user, rest, value):
+        if not rest:
+            conn.execute("INSERT OR REPLACE INTO settings (user, data) VALUES (?, ?)",
+                         (user, _dumps(value) if value else None))
+            return
+        row = conn.execute("SELECT data FROM settings WHERE user = ?", (user,)).fetchone()
+        if row is None:
+            # configurações ainda não lidas: a atualização parcial não tem sobre o que ser aplicada
+            return
+        data = _set_nested(json.loads(row[0]) if row[0] else {}, rest, value)
+        conn.execute("UPDATE settings SET data = ? WHERE user = ?", (_dumps(data) if data else None, user))
+
+    def set_settings(self, user, settings):
+        self._conn().execute("INSERT OR REPLACE INTO settings (user, data) VALUES (?, ?)",
+                             (user, _dumps(settings) if settings else None))
+
+    # --- leitura ------------------------------------------------------------------
+
+    def _videos_by_project(self, user, projects=None):
+        query = "SELECT project, video_id, data FROM videos WHERE user = ?"
+        params = [user]
+        if projects is not None:
+            query += f" AND project IN ({','.join('?' * len(projects))})"
+            params += list(projects)
+        videos = {}
+        for project, video_id, data in self._conn().execute(query, params):
+            videos.setdefault(project, {})[video_id] = json.loads(data)
+        return videos
+
+    def user_projects(self, user):
+        """projects/{usuario} no mesmo formato do Firebase ({projeto: {..., "videos": {...}}})."""
+        videos = self._videos_by_project(user)
+        tree = {}
+        for project, data in self._conn().execute("SELECT project, data FROM projects WHERE user = ?", (user,)):
+            details = json.loads(data)
+            if videos.get(project):
+                details["videos"] = videos[project]
+            tree[project] = details
+        return tree
+
+    def project(self, user, project):
+        row = self._conn().execute("SELECT data FROM projects WHERE user = ? AND project = ?",
+                                   (user, project)).fetchone()
+        if row is None:
+            return None
+        details = json.loads(row[0])
+        videos = self._videos_by_project(user, [project]).get(project)
+        if videos:
+            details["videos"] = videos
+        return details
+
+    def project_exists(self, user, project):
+        return self._conn().execute("SELECT 1 FROM projects WHERE user = ? AND project = ?",
+                                    (user, project)).fetchone() is not None
+
+    def project_video_ids(self, user, project):
+        return [row[0] for row in self._conn().execute(
+            "SELECT video_id FROM videos WHERE user = ? AND project = ?", (user, project))]
+
+    def video(self, user, project, video_id):
+        row = self._conn().execute("SELECT data FROM videos WHERE user = ? AND project = ? AND video_id = ?",
+                                   (user, project, video_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def video_by_id(self, user, video_id):
+        """(projeto, dados) do item pelo id, ou (None, None)."""
+        row = self._conn().execute("SELECT project, data FROM videos WHERE user = ? AND video_id = ? LIMIT 1",
+                                   (user, video_id)).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, None)
+
+    def projects_page(self, user, after, limit):
+        """
+        Projetos na ordem (tem createdAt, createdAt, chave), a mesma de _project_sort_key do servidor,
+        posteriores a after. Retorna [(chave, dados com "videos")].
+        """
+        query = ("SELECT project, data FROM projects WHERE user = ?")
+        params = [user]
+        if after is not None:
+            query += " AND (created_at IS NOT NULL, COALESCE(created_at, ''), project) > (?, ?, ?)"
+            params += [int(after[0]), after[1], after[2]]
+        query += " ORDER BY created_at IS NOT NULL, COALESCE(created_at, ''), project LIMIT ?"
+        params.append(limit)
+        rows = self._conn().execute(query, params).fetchall()
+        videos = self._videos_by_project(user, [row[0] for row in rows]) if rows else {}
+        page = []
+        for project, data in rows:
+            details = json.loads(data)
+            if videos.get(project):
+                details["videos"] = videos[project]
+            page.append((project, details))
+        return page
+
+    def project_stats(self, user):
+        """[(chave, {name, fileCount, totalBytes, lastUploadAt})] calculados por SQL, sem montar os nós."""
+        rows = self._conn().execute(
+            "SELECT p.project, json_extract(p.data, '$.name'), COUNT(v.video_id),"
+            " COALESCE(SUM(CASE WHEN json_type(v.data, '$.size') IN ('integer', 'real')"
+            "              THEN json_extract(v.data, '$.size') END), 0),"
+            " MAX(json_extract(v.data, '$.uploadedAt'))"
+            " FROM projects p LEFT JOIN videos v ON v.user = p.user AND v.project = p.project"
+            " WHERE p.user = ? GROUP BY p.project ORDER BY p.project", (user,))
+        return [(project, {"name": name or project, "fileCount": count, "totalBytes": total,
+                           "lastUploadAt": last_upload})
+                for project, name, count, total, last_upload in rows]
+
+    def settings(self, user):
+        """(encontrado, configurações): encontrado=False se ainda não foram lidas do Firebase."""
+        row = self._conn().execute("SELECT data FROM settings WHERE user = ?", (user,)).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0]) if row[0] else None
+
+    # --- verificação --------------------------------------------------------------
+
+    def diff_user(self, user, projects_tree):
+        """Diferenças entre o espelho e projects/{usuario} lido do Firebase: lista de caminhos divergentes."""
+        local = self.user_projects(user)
+        remote = {k: v for k, v in (projects_tree or {}).items() if isinstance(v, dict)}
+        differences = []
+        for project in sorted(set(local) | set(remote)):
+            if project not in local:
+                differences.append(f"projects/{user}/{project}: ausente no espelho")
+                continue
+            if project not in remote:
+                differences.append(f"projects/{user}/{project}: ausente no Firebase")
+                continue
+            local_fields = {k: v for k, v in local[project].items() if k != "videos"}
+            remote_fields = {k: v for k, v in remote[project].items() if k != "videos"}
+            for field in sorted(set(local_fields) | set(remote_fields)):
+                if local_fields.get(field) != remote_fields.get(field):
+                    differences.append(f"projects/{user}/{project}/{field}")
+            local_videos = local[project].get("videos") or {}
+            remote_videos = {k: v for k, v in (remote[project].get("videos") or {}).items() if isinstance(v, dict)}
+            for video_id in sorted(set(local_videos) | set(remote_videos)):
+                if local_videos.get(video_id) != remote_videos.get(video_id):
+                    differences.append(f"projects/{user}/{project}/videos/{video_id}")
+        return differences
+
+    def stats(self):
+        conn = self._conn()
+        return {
+            "db_path": self.db_path,
+            "users": conn.execute("SELECT COUNT(*) FROM synced_users").fetchone()[0],
+            "projects": conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0],
+            "videos": conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0],
+            "settings": conn.execute("SELECT COUNT(*) FROM settings").fetchone()[0],
+        }
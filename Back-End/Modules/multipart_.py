@@ -0,0 +1,90 @@
+# Modules/multipart_.py
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+
+
+class MultipartError(Exception):
+    """Erro no corpo multipart; status e mensagem são devolvidos ao cliente."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class UploadTooLarge(MultipartError):
+    def __init__(self, max_size):
+        super().__init__(f"Arquivo excede o tamanho máximo permitido ({max_size} bytes)", 413)
+        self.max_size = max_size
+
+
+def parse_multipart_stream(stream, boundary, on_file, max_file_size=None,
+                           max_field_size=1024 * 1024, chunk_size=1024 * 1024, max_total_size=None):
+    """
+    Lê um corpo multipart/form-data em blocos de chunk_size e grava cada parte de arquivo
+    direto no destino final, sem arquivo temporário nem cópia em memória.
+
+    on_file(nome_do_campo, filename, campos_ja_lidos) deve devolver um arquivo binário aberto
+    para escrita (ou levantar MultipartError para recusar a parte). Campos de texto ficam em
+    memória, limitados a max_field_size. max_file_size (por arquivo) e max_total_size (soma de
+    todas as partes de arquivo) são verificados enquanto os bytes chegam.
+
+    Retorna (fields, files): fields = {nome: valor}, files = {nome: {"filename", "size"}}.
+    """
+    if isinstance(boundary, str):
+        boundary = boundary.encode("latin-1")
+    decoder = MultipartDecoder(boundary, max_form_memory_size=max_field_size)
+
+    fields = {}
+    files = {}
+    current = None
+    buffer = None
+    target = None
+    written = 0
+    total = 0
+
+    try:
+        while True:
+            data = stream.read(chunk_size)
+            decoder.receive_data(data or None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    current, buffer = event, []
+                    written = 0
+                elif isinstance(event, File):
+                    current, written = event, 0
+                    target = on_file(event.name, event.filename, fields)
+                elif isinstance(event, Data):
+                    if isinstance(current, Field):
+                        written += len(event.data)
+                        if written > max_field_size:
+                            raise MultipartError(f"Campo '{current.name}' excede {max_field_size} bytes", 413)
+                        buffer.append(event.data)
+                        if not event.more_data:
+                            fields[current.name] = b"".join(buffer).decode("utf-8", "replace")
+                    else:
+                        written += len(event.data)
+                        total += len(event.data)
+                        if max_file_size is not None and written > max_file_size:
+                            raise UploadTooLarge(max_file_size)
+                        if max_total_size is not None and total > max_total_size:
+                            raise UploadTooLarge(max_total_size)
+                        target.write(event.data)
+                        if not event.more_data:
+                            target.close()
+                            target = None
+                            files[current.name] = {"filename": current.filename, "size": written}
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not data:
+                break
+    except RequestEntityTooLarge as e:
+        raise MultipartError(f"Campo excede {max_field_size} bytes", 413) from e
+    except ValueError as e:
+        # MultipartDecoder sinaliza corpo malformado com ValueError
+        raise MultipartError(f"Corpo multipart inválido: {e}") from e
+    finally:
+        if target is not None:
+            target.close()
+
+    return fields, files
@@ -0,0 +1,358 @@
+# Modules/project_events_.py
+import json
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Campos do projeto repassados nos eventos (o resto do nó não interessa ao painel)
+PROJECT_EVENT_FIELDS = ("name", "status", "progress_percent", "used", "thumbnail_url",
+                        "url_original", "model_ai", "last_used_timestamp")
+
+
+class _Subscriber:
+    def __init__(self, user, push):
+        self.user = user
+        self.push = push
+        self.overflowed = False
+
+
+class ProjectEventHub:
+    """
+    Eventos de alteração de projetos por usuário, alimentados por listeners do Firebase em
+    projects/{usuario} (um por usuário em uso no worker, no máximo max_listeners) e distribuídos
+    para as conexões SSE abertas nesse worker.
+
+    Cada evento recebe o id "{epoch}-{seq}"; os últimos ring_size ficam em memória para que uma
+    reconexão com Last-Event-ID receba o que perdeu. Se o id é de outro worker/processo (epoch
+    diferente) ou já saiu do buffer, o cliente recebe um evento "resync" e deve recarregar a lista.
+
+    Tipos de evento (data em JSON):
+      - project: nó do projeto gravado inteiro (criação) -> campos de PROJECT_EVENT_FIELDS
+      - updated: {"project", "changes": {campo: valor}, "videosChanged": bool}
+      - deleted: {"project"}
+      - resync:  {} (estado desconhecido; recarregar via GET /api/projects)
+    """
+
+    def __init__(self, listen, ring_size=2048, max_pending=256, on_change=None, max_listeners=256,
+                 on_release=None):
+        self._listen = listen            # listen(usuario, callback) -> registro do listener do Firebase
+        self.on_change = on_change       # on_change(usuario) a cada alteração vinda do Firebase
+        self.on_release = on_release     # on_release(usuario) quando o listener do usuário é fechado
+        self.max_pending = max_pending
+        self.max_listeners = max_listeners
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._ring = deque(maxlen=ring_size)  # (seq, usuario, tipo, dados)
+        self._subscribers = {}                # usuario -> set(_Subscriber)
+        self._lock = threading.Lock()
+        self._listener_lock = threading.Lock()
+        self._listeners = OrderedDict()       # usuario -> registro do listener, do menos ao mais recente
+        self._sinks = []
+        self.published = 0
+        self.overflows = 0
+
+    # --- publicação ---------------------------------------------------------------
+
+    def publish(self, user, event_type, data):
+        with self._lock:
+            self._seq += 1
+            event = (self._seq, user, event_type, data)
+            self._ring.append(event)
+            self.published += 1
+            subscribers = list(self._subscribers.get(user, ()))
+        for subscriber in subscribers:
+            subscriber.push(event)
+        return event
+
+    def format_event(self, event):
+        seq, _, event_type, data = event
+        payload = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        return f"id: {self.epoch}-{seq}\nevent: {event_type}\ndata: {payload}\n\n".encode("utf-8")
+
+    def _resync_event(self, user):
+        with self._lock:
+            return (self._seq, user, "resync", {})
+
+    # --- inscrição ----------------------------------------------------------------
+
+    def subscribe(self, user, push, last_event_id=None):
+        """
+        Registra push(evento) para os eventos do usuário. Retorna (inscrição, eventos_perdidos, resync):
+        eventos_perdidos são os posteriores a last_event_id ainda no buffer; resync=True quando
+        não é possível saber o que o cliente perdeu.
+        """
+        subscriber = _Subscriber(user, push)
+        with self._lock:
+            self._subscribers.setdefault(user, set()).add(subscriber)
+            replay, resync = self._replay(user, last_event_id)
+        return subscriber, replay, resync
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.user)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.user]
+
+    def _replay(self, user, last_event_id):
+        if not last_event_id:
+            return [], False
+        epoch, _, seq = last_event_id.partition("-")
+        try:
+            seq = int(seq)
+        except ValueError:
+            return [], True
+        if epoch != self.epoch or seq > self._seq:
+            return [], True
+        oldest = self._ring[0][0] if self._ring else self._seq + 1
+        if seq < oldest - 1:
+            return [], True
+        return [event for event in self._ring if event[0] > seq and event[1] == user], False
+
+    # --- listeners do Firebase ----------------------------------------------------
+
+    def add_sink(self, sink):
+        """sink(event_type, path, data) recebe todos os eventos brutos dos listeners, inclusive o estado inicial."""
+        self._sinks.append(sink)
+
+    def ensure_listener(self, user):
+        """
+        Inicia (ou reinicia, se a thread morreu) o listener de projects/{usuario} neste worker.
+        Acima de max_listeners, o listener usado há mais tempo de um usuário sem conexões SSE é fechado.
+        """
+        with self._listener_lock:
+            listener = self._listeners.get(user)
+            thread = getattr(listener, "_thread", None)
+            if listener is not None and (thread is None or thread.is_alive()):
+                self._listeners.move_to_end(user)
+                return True
+            try:
+                state = {"snapshot_seen": False}
+                self._listeners[user] = self._listen(user, lambda event: self._on_firebase_event(user, state, event))
+                self._listeners.move_to_end(user)
+            except Exception as e:
+                self._listeners.pop(user, None)
+                logger.warning(f"[EVENTS] Falha ao iniciar listener do Firebase para {user}: {e}")
+                return False
+            released = self._evict_listeners()
+        for evicted in released:
+            self._release(evicted)
+        return True
+
+    def _evict_listeners(self):
+        with self._lock:
+            watched = set(self._subscribers)
+        released = []
+        for user in list(self._listeners):
+            if len(self._listeners) <= self.max_listeners:
+                break
+            if user in watched:
+                continue
+            listener = self._listeners.pop(user)
+            try:
+                listener.close()
+            except Exception as e:
+                logger.warning(f"[EVENTS] Falha ao fechar listener de {user}: {e}")
+            released.append(user)
+        return released
+
+    def _release(self, user):
+        if self.on_release is not None:
+            try:
+                self.on_release(user)
+            except Exception as e:
+                logger.warning(f"[EVENTS] on_release falhou para {user}: {e}")
+
+    def _on_firebase_event(self, user, state, event):
+        # caminhos dos eventos passam a ser relativos a projects/, como os de um listener na raiz
+        path = f"/{user}/" + "/".join(part for part in (event.path or "/").split("/") if part)
+        path = path.rstrip("/")
+        for sink in self._sinks:
+            try:
+                sink(event.event_type, path, event.data)
+            except Exception as e:
+                logger.error(f"[EVENTS] Erro ao repassar evento do Firebase ({path}): {e}", exc_info=True)
+        try:
+            if event.event_type == "put" and path == f"/{user}":
+                # primeiro put do nó é o estado inicial; os seguintes vêm de reconexões do SDK
+                first = not state["snapshot_seen"]
+                state["snapshot_seen"] = True
+                if first:
+                    return
+            self._dispatch(event.event_type, path, event.data)
+        except Exception as e:
+            logger.error(f"[EVENTS] Erro ao processar evento do Firebase ({path}): {e}", exc_info=True)
+
+    def _dispatch(self, event_type, path, data):
+        base = [part for part in (path or "/").split("/") if part]
+        if event_type == "put":
+            writes = [(base, data)]
+        elif event_type == "patch" and isinstance(data, dict):
+            writes = [(base + [part for part in key.split("/") if part], value) for key, value in data.items()]
+        else:
+            return
+
+        events = {}  # (usuario, projeto) -> (tipo, dados), na ordem de chegada
+        for segments, value in writes:
+            if not segments:
+                continue
+            user = segments[0]
+            if len(segments) == 1:
+                events[(user, None)] = ("resync", {})
+                continue
+            project, rest = segments[1], segments[2:]
+            key = (user, project)
+            if not rest:
+                if value is None:
+                    events[key] = ("deleted", {"project": project})
+                else:
+                    details = value if isinstance(value, dict) else {}
+                    events[key] = ("project", {"project": project,
+                                               **{f: details.get(f) for f in PROJECT_EVENT_FIELDS if f in details}})
+                continue
+            current = events.get(key)
+            if current is None or current[0] != "updated":
+                current = ("updated", {"project": project, "changes": {}, "videosChanged": False})
+                events[key] = current
+            if rest[0] == "videos":
+                current[1]["videosChanged"] = True
+            elif rest[0] in PROJECT_EVENT_FIELDS and len(rest) == 1:
+                current[1]["changes"][rest[0]] = value
+
+        notified = set()
+        for (user, _), (kind, payload) in events.items():
+            if user not in notified:
+                notified.add(user)
+                self._notify(user)
+            if kind == "updated" and not payload["changes"] and not payload["videosChanged"]:
+                continue
+            self.publish(user, kind, payload)
+
+    def _notify(self, user):
+        if self.on_change is not None:
+            try:
+                self.on_change(user)
+            except Exception as e:
+                logger.warning(f"[EVENTS] on_change falhou para {user}: {e}")
+
+    # --- entrega ------------------------------------------------------------------
+
+    async def serve(self, user, last_event_id, receive, send, heartbeat=15, retry_ms=3000):
+        """
+        Corpo da resposta SSE no event loop (os cabeçalhos já foram enviados): eventos perdidos,
+        depois eventos ao vivo e um comentário de heartbeat a cada `heartbeat` segundos, até o
+        cliente desconectar.
+        """
+        loop = asyncio.get_running_loop()
+        pending = asyncio.Queue()
+        subscriber = None
+
+        def deliver(event):
+            if pending.qsize() >= self.max_pending:
+                # cliente lento: descarta o que acumulou e pede que ele recarregue
+                subscriber.overflowed = True
+                return
+            pending.put_nowait(event)
+
+        def push(event):
+            loop.call_soon_threadsafe(deliver, event)
+
+        subscriber, replay, resync = self.subscribe(user, push, last_event_id)
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            await loop.run_in_executor(None, self.ensure_listener, user)
+            chunk = f"retry: {retry_ms}\n\n".encode("utf-8")
+            if resync:
+                chunk += self.format_event(self._resync_event(user))
+            chunk += b"".join(self.format_event(event) for event in replay)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+            while not disconnected.done():
+                getter = asyncio.ensure_future(pending.get())
+                done, _ = await asyncio.wait({getter, disconnected}, timeout=heartbeat,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    if disconnected.done():
+                        break
+                    chunk = b": ping\n\n"
+                else:
+                    events = [getter.result()]
+                    while not pending.empty():
+                        events.append(pending.get_nowait())
+                    if subscriber.overflowed:
+                        subscriber.overflowed = False
+                        self.overflows += 1
+                        events = [self._resync_event(user)]
+                    chunk = b"".join(self.format_event(event) for event in events)
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        finally:
+            self.unsubscribe(subscriber)
+            disconnected.cancel()
+        try:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        except Exception:
+            pass
+
+    def iter_events(self, user, last_event_id=None, heartbeat=15, retry_ms=3000):
+        """Mesmo fluxo de serve() como gerador síncrono (servidor WSGI sem o middleware ASGI)."""
+        pending = queue.Queue(maxsize=self.max_pending)
+        subscriber = None
+
+        def push(event):
+            try:
+                pending.put_nowait(event)
+            except queue.Full:
+                subscriber.overflowed = True
+
+        subscriber, replay, resync = self.subscribe(user, push, last_event_id)
+        try:
+            self.ensure_listener(user)
+            chunk = f"retry: {retry_ms}\n\n".encode("utf-8")
+            if resync:
+                chunk += self.format_event(self._resync_event(user))
+            yield chunk + b"".join(self.format_event(event) for event in replay)
+            while True:
+                try:
+                    event = pending.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield b": ping\n\n"
+                    continue
+                if subscriber.overflowed:
+                    subscriber.overflowed = False
+                    self.overflows += 1
+                    while not pending.empty():
+                        pending.get_nowait()
+                    event = self._resync_event(user)
+                yield self.format_event(event)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            connections = sum(len(subscribers) for subscribers in self._subscribers.values())
+            users = len(self._subscribers)
+        with self._listener_lock:
+            listeners = len(self._listeners)
+        return {
+            "epoch": self.epoch,
+            "listeners": listeners,
+            "connections": connections,
+            "users": users,
+            "published": self.published,
+            "buffered": len(self._ring),
+            "overflows": self.overflows,
+        }
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
@@ -0,0 +1,192 @@
+# Modules/shared_cache_.py
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SharedPathCache:
+    """
+    Cache compartilhado entre os workers do uvicorn (processos distintos), gravado em SQLite
+    no modo WAL. Tem a mesma interface do LRUTTLCache (get/set/delete/invalidate_group/stats),
+    então as rotas não precisam saber qual backend está em uso.
+
+    Como todos os workers leem a mesma tabela, uma invalidação feita por um worker
+    (delete_project/delete_single_video) vale imediatamente para os demais.
+
+    Erros do SQLite (banco travado, disco cheio, arquivo corrompido) nunca derrubam a requisição:
+    viram miss ou no-op com um aviso no log, e a conexão da thread é reaberta na próxima chamada.
+    """
+
+    def __init__(self, db_path, max_entries=20000, ttl=300, purge_every=500):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._sets_since_purge = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.errors = 0
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # a cada conexão nova: recria a tabela se o arquivo foi apagado depois de uma falha
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " grp TEXT,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_grp ON entries(grp)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_expires ON entries(expires_at)")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _encode(key):
+        return json.dumps(key if not isinstance(key, tuple) else list(key), separators=(",", ":"))
+
+    def _count(self, attr, amount=1):
+        with self._stats_lock:
+            setattr(self, attr, getattr(self, attr) + amount)
+
+    def _failed(self, operation, error):
+        """Registra a falha do SQLite e descarta a conexão da thread (pode ter ficado inutilizável)."""
+        self._count("errors")
+        logger.warning(f"[CACHE] Falha no cache compartilhado ({operation}) em {self.db_path}: {error}")
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def get(self, key, default=None):
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (self._encode(key),)
+            ).fetchone()
+            if row is not None and row[1] <= time.time():
+                self._conn().execute("DELETE FROM entries WHERE key = ?", (self._encode(key),))
+                self._count("expirations")
+                row = None
+        except sqlite3.Error as e:
+            self._failed("get", e)
+            row = None
+        if row is None:
+            self._count("misses")
+            return default
+        self._count("hits")
+        return json.loads(row[0])
+
+    def set(self, key, value, group=None, ttl=None, size=None):
+        try:
+            self._set(key, value, group, ttl)
+        except sqlite3.Error as e:
+            self._failed("set", e)
+
+    def _set(self, key, value, group, ttl):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._conn().execute(
+            "INSERT OR REPLACE INTO entries (key, grp, value, expires_at) VALUES (?, ?, ?, ?)",
+            (
+                self._encode(key),
+                self._encode(group) if group is not None else None,
+                json.dumps(value, separators=(",", ":")),
+                expires_at,
+            ),
+        )
+        with self._stats_lock:
+            self._sets_since_purge += 1
+            purge = self._sets_since_purge >= self.purge_every
+            if purge:
+                self._sets_since_purge = 0
+        if purge:
+            self.purge()
+
+    def delete(self, key):
+        try:
+            cur = self._conn().execute("DELETE FROM entries WHERE key = ?", (self._encode(key),))
+        except sqlite3.Error as e:
+            self._failed("delete", e)
+            return False
+        self._count("invalidations", cur.rowcount)
+        return cur.rowcount > 0
+
+    def invalidate_group(self, group):
+        """Remove todas as entradas de um grupo (em todos os workers). Retorna quantas foram removidas."""
+        try:
+            cur = self._conn().execute("DELETE FROM entries WHERE grp = ?", (self._encode(group),))
+        except sqlite3.Error as e:
+            self._failed("invalidate_group", e)
+            return 0
+        self._count("invalidations", cur.rowcount)
+        return cur.rowcount
+
+    def purge(self):
+        """Remove entradas expiradas e, se ainda acima do limite, as que expiram primeiro."""
+        conn = self._conn()
+        cur = conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        self._count("expirations", cur.rowcount)
+        (total,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        excess = total - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY expires_at LIMIT ?)",
+                (excess,),
+            )
+            self._count("evictions", excess)
+
+    def clear(self):
+        try:
+            self._conn().execute("DELETE FROM entries")
+        except sqlite3.Error as e:
+            self._failed("clear", e)
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            local = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "errors": self.errors,
+            }
+        try:
+            entries = len(self)
+        except sqlite3.Error as e:
+            self._failed("stats", e)
+            entries = None
+        return {
+            "backend": "sqlite",
+            "db_path": self.db_path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            **local,
+        }
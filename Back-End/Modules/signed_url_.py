@@ -0,0 +1,42 @@
+# Modules/signed_url_.py
+import hmac
+import time
+import hashlib
+
+
+def _message(user_key, path, expires):
+    return f"{user_key}\n{path}\n{int(expires)}".encode("utf-8")
+
+
+def sign_stream_path(secret, user_key, path, ttl):
+    """
+    Assina (usuario, caminho, expiração) com HMAC-SHA256.
+    Retorna (expires, assinatura_hex) para compor a URL de streaming.
+    ValueError se o segredo não está configurado.
+    """
+    if not secret:
+        raise ValueError("Segredo das URLs assinadas não configurado")
+    expires = int(time.time()) + int(ttl)
+    signature = hmac.new(secret.encode("utf-8"), _message(user_key, path, expires), hashlib.sha256).hexdigest()
+    return expires, signature
+
+
+def verify_stream_signature(secret, user_key, path, expires, signature):
+    """
+    Verifica localmente (sem acesso ao banco) uma assinatura gerada por sign_stream_path.
+    Retorna (ok: bool, reason: str); sem segredo configurado nenhuma assinatura é aceita.
+    """
+    if not secret:
+        return False, "disabled"
+    if not user_key or not expires or not signature:
+        return False, "missing"
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False, "invalid"
+    expected = hmac.new(secret.encode("utf-8"), _message(user_key, path, expires), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, signature):
+        return False, "invalid"
+    if expires < time.time():
+        return False, "expired"
+    return True, "ok"
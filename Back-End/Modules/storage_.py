@@ -0,0 +1,398 @@
+# Modules/storage_.py
+import os
+import json
+import time
+import fcntl
+import hashlib
+import collections
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_VOLUME = "default"
+VOLUME_PREFIX = "@"
+
+
+def parse_volumes(spec):
+    """"nome=/caminho,nome2=/caminho2" -> [(nome, caminho)] (entradas vazias ou sem nome são ignoradas)."""
+    volumes = []
+    for item in (spec or "").split(","):
+        name, _, root = item.strip().partition("=")
+        name, root = name.strip(), root.strip()
+        if name and root and name != PRIMARY_VOLUME:
+            volumes.append((name, root))
+    return volumes
+
+
+# --- políticas de posicionamento -----------------------------------------------------
+# policy(storage, candidatos) -> nome do volume; candidatos já excluem volumes sem espaço mínimo
+
+def free_space_policy():
+    def choose(storage, candidates):
+        return max(candidates, key=storage.free_bytes)
+    return choose
+
+
+def round_robin_policy():
+    lock = threading.Lock()
+    state = {"next": 0}
+
+    def choose(storage, candidates):
+        with lock:
+            name = candidates[state["next"] % len(candidates)]
+            state["next"] += 1
+        return name
+    return choose
+
+
+POLICIES = {
+    "free_space": free_space_policy,
+    "round_robin": round_robin_policy,
+}
+
+
+class Storage:
+    """
+    Camada de armazenamento dos arquivos dos projetos sobre um ou mais volumes.
+
+    - Layout: {volume}/{usuario}/{projeto}/{ab}/{video_id}_{nome}, com fanout_levels níveis de
+      fanout_width caracteres do SHA-1 do video_id, para que projetos grandes não tenham
+      diretórios com dezenas de milhares de entradas. O diretório do projeto continua sendo a
+      unidade de exclusão (lixeira) em cada volume.
+    - serverFilePath: relativo ao volume principal (VIDEO_BASE_DIR), como antes, ou
+      "@{volume}/{caminho}" nos demais volumes. resolve() converte de volta para o caminho absoluto.
+    - Posicionamento: policy escolhe o volume de cada novo upload entre os que têm pelo menos
+      min_free_bytes livres (nome em POLICIES ou função policy(storage, candidatos) -> nome).
+    """
+
+    def __init__(self, primary_root, volumes=(), policy="free_space", fanout_levels=1, fanout_width=2,
+                 min_free_bytes=0):
+        self.volumes = {PRIMARY_VOLUME: os.path.abspath(primary_root)}
+        for name, root in volumes:
+            self.volumes[name] = os.path.abspath(root)
+        self.policy_name = policy if isinstance(policy, str) else getattr(policy, "__name__", "custom")
+        self._policy = POLICIES[policy]() if isinstance(policy, str) else policy
+        self.fanout_levels = fanout_levels
+        self.fanout_width = fanout_width
+        self.min_free_bytes = min_free_bytes
+        self._free_cache = {}
+        self.placed = {name: 0 for name in self.volumes}
+        for root in self.volumes.values():
+            os.makedirs(root, exist_ok=True)
+
+    # --- volumes ------------------------------------------------------------------
+
+    def free_bytes(self, name):
+        """Bytes livres no volume (statvfs, guardado por 5s)."""
+        now = time.monotonic()
+        cached = self._free_cache.get(name)
+        if cached and cached[0] > now:
+            return cached[1]
+        try:
+            st = os.statvfs(self.volumes[name])
+            free = st.f_bavail * st.f_frsize
+        except OSError:
+            free = 0
+        self._free_cache[name] = (now + 5, free)
+        return free
+
+    def choose_volume(self):
+        """Volume para um novo upload conforme a política de posicionamento."""
+        if len(self.volumes) == 1:
+            return PRIMARY_VOLUME
+        names = list(self.volumes)
+        candidates = [name for name in names if self.free_bytes(name) >= self.min_free_bytes] or names
+        name = self._policy(self, candidates)
+        self.placed[name] = self.placed.get(name, 0) + 1
+        return name
+
+    def volume_of(self, path):
+        """Nome do volume que contém o caminho absoluto path, ou None se está fora de todos."""
+        path = os.path.abspath(path)
+        matches = [(root, name) for name, root in self.volumes.items() if path.startswith(root + os.sep)]
+        return max(matches)[1] if matches else None
+
+    # --- caminhos -----------------------------------------------------------------
+
+    def shard(self, video_id):
+        digest = hashlib.sha1(video_id.encode("utf-8")).hexdigest()
+        width = self.fanout_width
+        return [digest[i * width:(i + 1) * width] for i in range(self.fanout_levels)]
+
+    def user_dir(self, user, volume=PRIMARY_VOLUME):
+        return os.path.join(self.volumes[volume], user)
+
+    def project_dir(self, user, project, volume=PRIMARY_VOLUME):
+        return os.path.join(self.volumes[volume], user, project)
+
+    def incoming_dir(self, user, volume=PRIMARY_VOLUME):
+        """Arquivos recebidos antes do projeto ser conhecido (mesmo volume do destino final)."""
+        return os.path.join(self.volumes[volume], user, ".incoming")
+
+    def item_path(self, user, project, video_id, basename, volume=PRIMARY_VOLUME):
+        """Caminho absoluto do arquivo do item (os diretórios não são criados)."""
+        return os.path.join(self.project_dir(user, project, volume), *self.shard(video_id), basename)
+
+    def project_dirs(self, user, project):
+        """Diretórios existentes do projeto em todos os volumes."""
+        dirs = [self.project_dir(user, project, name) for name in self.volumes]
+        return [path for path in dirs if os.path.isdir(path)]
+
+    def user_dirs(self, user):
+        return [self.user_dir(user, name) for name in self.volumes]
+
+    def server_path(self, path):
+        """Caminho absoluto -> serverFilePath."""
+        volume = self.volume_of(path)
+        if volume is None:
+            raise ValueError(f"Caminho fora dos volumes de armazenamento: {path}")
+        rel = os.path.relpath(os.path.abspath(path), self.volumes[volume])
+        return rel if volume == PRIMARY_VOLUME else f"{VOLUME_PREFIX}{volume}/{rel}"
+
+    def resolve(self, server_file_path):
+        """serverFilePath -> caminho absoluto, ou None se o volume é desconhecido ou o caminho sai dele."""
+        if not server_file_path:
+            return None
+        volume, rel = PRIMARY_VOLUME, server_file_path
+        if rel.startswith(VOLUME_PREFIX):
+            volume, _, rel = rel[len(VOLUME_PREFIX):].partition("/")
+            if volume not in self.volumes:
+                return None
+        root = self.volumes[volume]
+        path = os.path.abspath(os.path.join(root, rel))
+        if not path.startswith(root + os.sep):
+            return None
+        return path
+
+    def stats(self):
+        volumes = {}
+        for name, root in self.volumes.items():
+            try:
+                st = os.statvfs(root)
+                total, free = st.f_blocks * st.f_frsize, st.f_bavail * st.f_frsize
+            except OSError:
+                total = free = None
+            volumes[name] = {"root": root, "total_bytes": total, "free_bytes": free,
+                             "placed": self.placed.get(name, 0)}
+        return {"policy": self.policy_name, "fanout_levels": self.fanout_levels, "volumes": volumes}
+
+
+class LayoutMigrator:
+    """
+    Migração online dos arquivos gravados no layout antigo ({usuario}/{projeto}/{arquivo}) para
+    o layout com fan-out, no mesmo volume e em segundo plano:
+
+      hardlink no caminho novo -> commit(usuario, projeto, video_id, novo_serverFilePath) -> unlink do antigo
+
+    Leituras em andamento continuam válidas (o inode é o mesmo) e o caminho antigo só some grace
+    segundos depois que os metadados apontam para o novo (caminhos ainda guardados no cache dos
+    outros workers e URLs assinadas já emitidas continuam funcionando até expirar). list_users() e
+    list_items(usuario) -> [(projeto, video_id, serverFilePath)] vêm do servidor. O progresso
+    (usuários concluídos) fica em state_path e os caminhos antigos ainda no prazo em retired_path
+    (uma linha "prazo\tcaminho" por arquivo), para que uma queda dentro do prazo não os deixe para
+    trás; só um processo por vez migra (flock em lock_path).
+    """
+
+    def __init__(self, storage, list_users, list_items, commit, state_path, items_per_sec=50,
+                 grace=300, interval=3600, start_delay=60):
+        self.storage = storage
+        self._list_users = list_users
+        self._list_items = list_items
+        self._commit = commit
+        self.state_path = state_path
+        self.lock_path = state_path + ".lock"
+        self.retired_path = state_path + ".retired"
+        self.items_per_sec = items_per_sec
+        self.grace = grace
+        self._retired = collections.deque()  # (prazo em epoch, caminho antigo), na ordem dos prazos
+        self._retired_removed = 0             # linhas de retired_path já removidas do disco
+        self._retired_paths_cache = None      # ((mtime_ns, tamanho) de retired_path, caminhos)
+        self.interval = interval
+        self.start_delay = start_delay
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.migrated = 0
+        self.errors = 0
+        self.finished = False
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+
+    def start(self):
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="storage-migration", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        time.sleep(self.start_delay)
+        while not self.finished:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"[STORAGE] Erro na migração de layout: {e}", exc_info=True)
+            if not self.finished:
+                time.sleep(self.interval)
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"done_users": [], "finished": False}
+
+    def _save_state(self, state):
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def run_once(self):
+        """Migra os usuários ainda pendentes. Retorna itens migrados, ou None se outro processo está migrando."""
+        with open(self.lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            state = self._load_state()
+            if state.get("finished"):
+                self.finished = True
+                return 0
+            done = set(state.get("done_users") or [])
+            self._load_retired()
+            migrated = 0
+            for user in self._list_users():
+                if user in done:
+                    continue
+                for project, video_id, server_file_path in self._list_items(user):
+                    if self.migrate_item(user, project, video_id, server_file_path):
+                        migrated += 1
+                        if self.items_per_sec:
+                            time.sleep(1.0 / self.items_per_sec)
+                done.add(user)
+                state["done_users"] = sorted(done)
+                self._save_state(state)
+                self._unlink_retired()
+            # caminhos antigos que ainda estão no prazo: espera antes de marcar a migração como concluída
+            while self._retired:
+                time.sleep(max(0.0, self._retired[0][0] - time.time()))
+                self._unlink_retired()
+            state["finished"] = True
+            self._save_state(state)
+            self.finished = True
+            logger.info(f"[STORAGE] Migração de layout concluída ({migrated} arquivo(s) nesta volta)")
+            return migrated
+
+    def migrate_item(self, user, project, video_id, server_file_path):
+        old_path = self.storage.resolve(server_file_path)
+        volume = self.storage.volume_of(old_path) if old_path else None
+        if volume is None or not os.path.isfile(old_path):
+            return False
+        new_path = self.storage.item_path(user, project, video_id, os.path.basename(old_path), volume)
+        if new_path == old_path:
+            return False
+        try:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            if not os.path.exists(new_path):
+                os.link(old_path, new_path)
+        except OSError as e:
+            self.errors += 1
+            logger.warning(f"[STORAGE] Não foi possível migrar {server_file_path}: {e}")
+            return False
+        try:
+            committed = self._commit(user, project, video_id, self.storage.server_path(new_path))
+        except Exception as e:
+            committed = False
+            self.errors += 1
+            logger.warning(f"[STORAGE] Falha ao gravar novo caminho de {video_id}: {e}")
+        if not committed:
+            # item removido no meio do caminho (ou falha): o caminho antigo continua valendo
+            try:
+                os.unlink(new_path)
+            except OSError:
+                pass
+            return False
+        self._retire(old_path)
+        self.migrated += 1
+        return True
+
+    # --- caminhos antigos --------------------------------------------------------
+
+    def _load_retired(self):
+        """Caminhos antigos pendentes de uma volta anterior (inclusive de outro processo que caiu)."""
+        pending = {path: deadline for deadline, path in self._retired}
+        try:
+            with open(self.retired_path) as f:
+                for line in f:
+                    deadline, _, path = line.rstrip("\n").partition("\t")
+                    try:
+                        pending.setdefault(path, float(deadline))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        self._retired = collections.deque(sorted((deadline, path) for path, deadline in pending.items() if path))
+        self._retired_removed = 0
+        self._rewrite_retired()
+
+    def retired_paths(self):
+        """
+        Caminhos antigos ainda no prazo, lidos de retired_path (vale para a migração de qualquer
+        processo); a leitura é refeita só quando o arquivo muda.
+        """
+        try:
+            st = os.stat(self.retired_path)
+        except OSError:
+            return set()
+        version = (st.st_mtime_ns, st.st_size)
+        cached = self._retired_paths_cache
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        paths = set()
+        try:
+            with open(self.retired_path) as f:
+                for line in f:
+                    _, _, path = line.rstrip("\n").partition("\t")
+                    if path:
+                        paths.add(path)
+        except OSError:
+            return set()
+        self._retired_paths_cache = (version, paths)
+        return paths
+
+    def _retire(self, old_path):
+        deadline = time.time() + self.grace
+        self._retired.append((deadline, old_path))
+        # gravado depois do commit: se o commit falha o caminho antigo continua em uso
+        with open(self.retired_path, "a") as f:
+            f.write(f"{deadline}\t{old_path}\n")
+
+    def _rewrite_retired(self):
+        tmp_path = f"{self.retired_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(f"{deadline}\t{path}\n" for deadline, path in self._retired)
+        os.replace(tmp_path, self.retired_path)
+
+    def _unlink_retired(self):
+        now = time.time()
+        while self._retired and self._retired[0][0] <= now:
+            _, path = self._retired.popleft()
+            self._retired_removed += 1
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        # compacta o arquivo quando mais da metade das linhas já foi removida
+        if self._retired_removed and self._retired_removed >= len(self._retired):
+            self._rewrite_retired()
+            self._retired_removed = 0
+
+    def stats(self):
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "finished": self.finished,
+            "migrated": self.migrated,
+            "retired_pending": len(self._retired),
+            "errors": self.errors,
+        }
@@ -0,0 +1,306 @@
+# Modules/storage_scan_.py
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from Modules.trash_ import RateLimiter, lower_io_priority
+
+logger = logging.getLogger(__name__)
+
+
+def _empty_report(repair):
+    return {
+        "started_at": time.time(),
+        "finished_at": None,
+        "repair": repair,
+        "users": 0,
+        "files": 0,
+        "bytes": 0,
+        "orphans": {"count": 0, "bytes": 0, "items": []},
+        "missing": {"count": 0, "items": []},
+        "repaired": {"orphans": 0, "bytes": 0, "missing": 0},
+        "errors": 0,
+    }
+
+
+class StorageScanner:
+    """
+    Reconciliação entre os arquivos em disco e os metadados dos projetos, usuário por usuário:
+
+    - órfãos: arquivos sob {volume}/{usuario} que nenhum item aponta (uploads interrompidos,
+      exclusões pela metade); só entram os que não mudam há min_age segundos, para não pegar
+      uploads em andamento, e nunca os caminhos de skip_paths() (caminhos antigos da migração de
+      layout ainda no prazo, que URLs assinadas já emitidas continuam usando)
+    - ausentes: itens cujo serverFilePath não existe no disco
+
+    Os diretórios de cada usuário são listados com os.scandir em paralelo (workers threads, com
+    prioridade de I/O idle e no máximo files_per_sec entradas/s no total) e os metadados vêm de
+    uma leitura por usuário: read_items(usuario) -> [(projeto, video_id, serverFilePath)] dos itens
+    que têm serverFilePath.
+    Diretórios com ponto na raiz dos volumes (.cache, .blobs, .trash, .uploads) ficam de fora, assim
+    como a raiz de outro volume montada dentro de um deles (ex.: um volume em VIDEO_BASE_DIR/hd2),
+    que não é um usuário e é escaneada como o volume que é.
+
+    O progresso (usuários concluídos e o relatório parcial) fica em state_path, então uma volta
+    interrompida continua de onde parou; o relatório completo vai para report_path. Com repair,
+    repair_orphan(caminho, entrada) e repair_missing(entrada) corrigem cada caso; itens ausentes
+    só são corrigidos se a pasta do projeto existe no volume (um volume desmontado não vira uma
+    exclusão em massa de metadados).
+    """
+
+    def __init__(self, storage, list_users, read_items, repair_orphan, repair_missing, state_path, report_path,
+                 workers=4, files_per_sec=2000, min_age=3600, repair=False, interval=86400, report_max=1000,
+                 start_delay=120, skip_paths=None):
+        self.storage = storage
+        self._volume_roots = set(storage.volumes.values())
+        self._list_users = list_users
+        self._read_items = read_items
+        self._repair_orphan = repair_orphan
+        self._repair_missing = repair_missing
+        self._skip_paths = skip_paths or (lambda: set())
+        self.state_path = state_path
+        self.lock_path = state_path + ".lock"
+        self.report_path = report_path
+        self.workers = workers
+        self.files_per_sec = files_per_sec
+        self.min_age = min_age
+        self.repair = repair
+        self.interval = interval
+        self.report_max = report_max
+        self.start_delay = start_delay
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.runs = 0
+        self.errors = 0
+        self.last_run_at = None
+        self.last_report = None
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        try:
+            with open(report_path) as f:
+                self.last_report = self._summary(json.load(f))
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def start(self):
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="storage-scan", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        time.sleep(self.start_delay)
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"[SCAN] Erro na reconciliação do armazenamento: {e}", exc_info=True)
+            time.sleep(min(self.interval, 3600))
+
+    # --- estado -------------------------------------------------------------------
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_json(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    # --- volta --------------------------------------------------------------------
+
+    def run_once(self, force=False):
+        """
+        Uma volta completa (ou a continuação da interrompida). Retorna o relatório, ou None se
+        outro processo está escaneando ou a última volta terminou há menos de interval segundos.
+        """
+        with open(self.lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            state = self._load_state()
+            run = state.get("run")
+            if run is None:
+                if not force and time.time() - (state.get("last_finished_at") or 0) < self.interval:
+                    return None
+                run = {"done_users": [], "report": _empty_report(self.repair)}
+                state["run"] = run
+            elif run["done_users"]:
+                logger.info(f"[SCAN] Retomando reconciliação ({len(run['done_users'])} usuário(s) já verificado(s))")
+            report = run["report"]
+            done = set(run["done_users"])
+            limiter = RateLimiter(self.files_per_sec, 0)
+            users = sorted(set(self._disk_users()) | set(self._list_users()))
+
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="storage-scan",
+                                    initializer=lower_io_priority) as pool:
+                for user in users:
+                    if user in done:
+                        continue
+                    try:
+                        self._scan_user(user, pool, limiter, report)
+                    except Exception as e:
+                        self.errors += 1
+                        report["errors"] += 1
+                        logger.error(f"[SCAN] Falha ao verificar {user}: {e}", exc_info=True)
+                    done.add(user)
+                    run["done_users"] = sorted(done)
+                    self._write_json(self.state_path, state)
+
+            report["finished_at"] = time.time()
+            self._write_json(self.report_path, report)
+            self._write_json(self.state_path, {"last_finished_at": report["finished_at"]})
+            self.runs += 1
+            self.last_run_at = report["finished_at"]
+            self.last_report = self._summary(report)
+            logger.info(f"[SCAN] Reconciliação concluída: {report['files']} arquivo(s) em {report['users']} usuário(s), "
+                        f"{report['orphans']['count']} órfão(s) ({report['orphans']['bytes']} bytes), "
+                        f"{report['missing']['count']} item(ns) sem arquivo; corrigidos "
+                        f"{report['repaired']['orphans']} órfão(s) e {report['repaired']['missing']} item(ns)")
+            return report
+
+    def _disk_users(self):
+        roots = self._volume_roots
+        users = set()
+        for root in roots:
+            try:
+                with os.scandir(root) as entries:
+                    users.update(entry.name for entry in entries
+                                 if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False)
+                                 and entry.path not in roots)
+            except OSError:
+                pass
+        return users
+
+    def _scan_dir(self, path, limiter):
+        """Uma listagem: ({caminho: (tamanho, última alteração)}, [subdiretórios])."""
+        files, subdirs = {}, []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.path not in self._volume_roots:
+                                subdirs.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            # ctime muda no link/unlink (migração de layout, deduplicação)
+                            files[entry.path] = (st.st_size, max(st.st_mtime, st.st_ctime))
+                    except FileNotFoundError:
+                        pass
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        limiter.consume(files=len(files) + len(subdirs))
+        return files, subdirs
+
+    def _list_files(self, user, pool, limiter):
+        """Todos os arquivos do usuário em todos os volumes, listando os diretórios em paralelo."""
+        files = {}
+        pending = {pool.submit(self._scan_dir, path, limiter) for path in self.storage.user_dirs(user)
+                   if os.path.isdir(path)}
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                found, subdirs = future.result()
+                files.update(found)
+                pending |= {pool.submit(self._scan_dir, path, limiter) for path in subdirs}
+        return files
+
+    def _owner(self, user, path):
+        """(projeto, video_id) deduzidos do caminho {volume}/{usuario}/{projeto}/.../{video_id}_{nome}."""
+        volume = self.storage.volume_of(path)
+        parts = os.path.relpath(path, self.storage.volumes[volume]).split(os.sep)
+        project = parts[1] if len(parts) > 2 and not parts[1].startswith(".") else None
+        video_id = parts[-1].split("_", 1)[0] if "_" in parts[-1] else None
+        return project, video_id
+
+    def _scan_user(self, user, pool, limiter, report):
+        files = self._list_files(user, pool, limiter)
+        items = self._read_items(user)
+        report["users"] += 1
+        report["files"] += len(files)
+        report["bytes"] += sum(size for size, _ in files.values())
+
+        referenced = set()
+        tracked = set()
+        for project, video_id, server_file_path in items:
+            tracked.add((project, video_id))
+            path = self.storage.resolve(server_file_path)
+            if path and (path in files or os.path.isfile(path)):
+                referenced.add(path)
+                continue
+            volume = self.storage.volume_of(path) if path else None
+            entry = {
+                "user": user,
+                "project": project,
+                "video_id": video_id,
+                "serverFilePath": server_file_path,
+                "repairable": volume is not None and os.path.isdir(self.storage.project_dir(user, project, volume)),
+            }
+            report["missing"]["count"] += 1
+            if len(report["missing"]["items"]) < self.report_max:
+                report["missing"]["items"].append(entry)
+            if self.repair and entry["repairable"]:
+                try:
+                    if self._repair_missing(entry):
+                        report["repaired"]["missing"] += 1
+                except Exception as e:
+                    report["errors"] += 1
+                    logger.warning(f"[SCAN] Falha ao corrigir {user}/{project}/{video_id}: {e}")
+
+        now = time.time()
+        skipped = self._skip_paths()
+        for path, (size, changed_at) in files.items():
+            if path in referenced or path in skipped or now - changed_at < self.min_age:
+                continue
+            project, video_id = self._owner(user, path)
+            entry = {
+                "user": user,
+                "path": self.storage.server_path(path),
+                "project": project,
+                "video_id": video_id,
+                "size": size,
+                # o item ainda existe com outro caminho: o conteúdo não pode ser solto do armazenamento deduplicado
+                "tracked": (project, video_id) in tracked,
+            }
+            report["orphans"]["count"] += 1
+            report["orphans"]["bytes"] += size
+            if len(report["orphans"]["items"]) < self.report_max:
+                report["orphans"]["items"].append(entry)
+            if self.repair:
+                try:
+                    if self._repair_orphan(path, entry):
+                        report["repaired"]["orphans"] += 1
+                        report["repaired"]["bytes"] += size
+                except Exception as e:
+                    report["errors"] += 1
+                    logger.warning(f"[SCAN] Falha ao remover órfão {entry['path']}: {e}")
+
+    def _summary(self, report):
+        summary = {k: v for k, v in report.items() if k not in ("orphans", "missing")}
+        summary["orphans"] = {k: v for k, v in report["orphans"].items() if k != "items"}
+        summary["missing"] = {"count": report["missing"]["count"]}
+        return summary
+
+    def stats(self):
+        in_progress = (self._load_state().get("run") or {}).get("done_users")
+        return {
+            "repair": self.repair,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "runs": self.runs,
+            "last_run_at": self.last_run_at,
+            "last_report": self.last_report,
+            "users_done_in_progress": len(in_progress) if in_progress is not None else None,
+            "errors": self.errors,
+        }
@@ -0,0 +1,238 @@
+# Modules/trash_.py
+import os
+import time
+import uuid
+import errno
+import fcntl
+import ctypes
+import logging
+import platform
+import threading
+
+logger = logging.getLogger(__name__)
+
+TRASH_DIRNAME = ".trash"
+
+# ioprio_set(2): não exposto pelo módulo os; números da syscall por arquitetura
+_IOPRIO_SYSCALLS = {"x86_64": 251, "amd64": 251, "aarch64": 30, "arm64": 30, "i386": 289, "i686": 289}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_IDLE = 3
+_IOPRIO_CLASS_SHIFT = 13
+
+
+def lower_io_priority():
+    """Coloca a thread atual na classe de I/O idle (Linux). Retorna False se não foi possível."""
+    number = _IOPRIO_SYSCALLS.get(platform.machine().lower())
+    if number is None:
+        return False
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        result = libc.syscall(number, _IOPRIO_WHO_PROCESS, threading.get_native_id(),
+                              _IOPRIO_CLASS_IDLE << _IOPRIO_CLASS_SHIFT)
+    except Exception:
+        return False
+    return result == 0
+
+
+class RateLimiter:
+    """
+    Limita arquivos/s e bytes/s (0 desativa o limite) dormindo o necessário entre as operações.
+    Pode ser compartilhado entre threads.
+    """
+
+    def __init__(self, files_per_sec, bytes_per_sec):
+        self.files_per_sec = files_per_sec
+        self.bytes_per_sec = bytes_per_sec
+        self._started = time.monotonic()
+        self._files = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def consume(self, files=0, nbytes=0):
+        with self._lock:
+            self._files += files
+            self._bytes += nbytes
+            wait = 0.0
+            if self.files_per_sec:
+                wait = max(wait, self._files / self.files_per_sec)
+            if self.bytes_per_sec:
+                wait = max(wait, self._bytes / self.bytes_per_sec)
+        delay = self._started + wait - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class TrashBin:
+    """
+    Exclusão em duas etapas: move() renomeia o arquivo/diretório para {raiz}/.trash na hora
+    (rename atômico no mesmo volume, cada raiz tem a sua lixeira) e uma thread de limpeza apaga
+    o conteúdo da lixeira depois, em segundo plano.
+
+    A limpeza roda em um único worker por vez (flock em .trash/.purge.lock), com prioridade de
+    I/O idle e limite de arquivos/s e bytes/s; arquivos grandes são truncados em passos antes do
+    unlink para não gerar picos de I/O. Tudo que está na lixeira já foi descartado, então uma
+    limpeza interrompida (queda do processo) simplesmente continua de onde parou na próxima volta.
+    """
+
+    def __init__(self, roots, files_per_sec=500, bytes_per_sec=256 * 1024 * 1024,
+                 truncate_step=1024 * 1024 * 1024, interval=30):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.files_per_sec = files_per_sec
+        self.bytes_per_sec = bytes_per_sec
+        self.truncate_step = truncate_step
+        self.interval = interval
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.moved = 0
+        self.purged_files = 0
+        self.purged_bytes = 0
+        self.last_purge_at = None
+        for root in self.roots:
+            os.makedirs(self.trash_dir(root), exist_ok=True)
+
+    def trash_dir(self, root):
+        return os.path.join(root, TRASH_DIRNAME)
+
+    def _root_for(self, path):
+        path = os.path.abspath(path)
+        matches = [root for root in self.roots if path.startswith(root + os.sep)]
+        return max(matches, key=len) if matches else None
+
+    def move(self, path):
+        """
+        Renomeia path para a lixeira da sua raiz e acorda a limpeza. Retorna o caminho na
+        lixeira, ou None se path não está sob nenhuma raiz ou o rename não é possível (outro
+        volume montado dentro da raiz); nesse caso o chamador remove path diretamente.
+        FileNotFoundError se path não existe.
+        """
+        root = self._root_for(path)
+        if root is None:
+            return None
+        target = os.path.join(self.trash_dir(root),
+                              f"{int(time.time())}-{uuid.uuid4().hex[:12]}-{os.path.basename(path)}")
+        try:
+            os.rename(path, target)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                raise FileNotFoundError(path) from e
+            if e.errno == errno.EXDEV:
+                return None
+            raise
+        self.moved += 1
+        self.start()
+        self._wake.set()
+        return target
+
+    # --- limpeza ------------------------------------------------------------------
+
+    def start(self):
+        """Inicia a thread de limpeza (se ainda não está rodando neste processo)."""
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="trash-purge", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        if not lower_io_priority():
+            logger.info("[TRASH] Prioridade de I/O idle indisponível; limpeza segue só com limite de taxa")
+        while True:
+            try:
+                for root in self.roots:
+                    self.purge(root)
+            except Exception as e:
+                logger.error(f"[TRASH] Erro na limpeza da lixeira: {e}", exc_info=True)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def purge(self, root):
+        """Apaga o conteúdo da lixeira de root se nenhum outro processo estiver fazendo isso."""
+        trash = self.trash_dir(root)
+        try:
+            lock = open(os.path.join(trash, ".purge.lock"), "a")
+        except OSError:
+            return False
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            limiter = RateLimiter(self.files_per_sec, self.bytes_per_sec)
+            files = nbytes = 0
+            with os.scandir(trash) as entries:
+                names = sorted(entry.name for entry in entries if not entry.name.startswith("."))
+            for name in names:
+                f, b = self._purge_tree(os.path.join(trash, name), limiter)
+                files += f
+                nbytes += b
+            if names:
+                self.last_purge_at = time.time()
+                logger.info(f"[TRASH] {len(names)} item(ns) da lixeira apagado(s): {files} arquivo(s), {nbytes} bytes")
+            return True
+
+    def _purge_tree(self, path, limiter):
+        files = nbytes = 0
+        try:
+            is_dir = os.path.isdir(path) and not os.path.islink(path)
+        except OSError:
+            return 0, 0
+        if is_dir:
+            try:
+                with os.scandir(path) as entries:
+                    children = [entry.path for entry in entries]
+            except FileNotFoundError:
+                return 0, 0
+            for child in children:
+                f, b = self._purge_tree(child, limiter)
+                files += f
+                nbytes += b
+            try:
+                os.rmdir(path)
+            except FileNotFoundError:
+                pass
+            return files, nbytes
+        return 1, self._purge_file(path, limiter)
+
+    def _purge_file(self, path, limiter):
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return 0
+        # hardlinks (blobs deduplicados): o unlink não libera blocos, não há o que truncar
+        size = st.st_size if st.st_nlink <= 1 and not os.path.islink(path) else 0
+        if self.truncate_step and size > self.truncate_step:
+            remaining = size
+            while remaining > self.truncate_step:
+                remaining -= self.truncate_step
+                os.truncate(path, remaining)
+                limiter.consume(nbytes=self.truncate_step)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return 0
+        limiter.consume(files=1, nbytes=min(size, self.truncate_step) if self.truncate_step else size)
+        self.purged_files += 1
+        self.purged_bytes += size
+        return size
+
+    def pending(self):
+        count = 0
+        for root in self.roots:
+            try:
+                with os.scandir(self.trash_dir(root)) as entries:
+                    count += sum(1 for entry in entries if not entry.name.startswith("."))
+            except OSError:
+                pass
+        return count
+
+    def stats(self):
+        return {
+            "roots": self.roots,
+            "pending": self.pending(),
+            "moved": self.moved,
+            "purged_files": self.purged_files,
+            "purged_bytes": self.purged_bytes,
+            "last_purge_at": self.last_purge_at,
+            "purger": self._thread is not None and self._thread.is_alive(),
+        }
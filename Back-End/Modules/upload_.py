@@ -1,15 +1,25 @@
 # Substituir /app/Modules/upload_.py 
+import io
 import os
 import json
 import requests
 import logging
 import tempfile
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import shutil
 from typing import IO
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 CHUNK_SIZE = 1024 * 1024  # 1MB por chunk para streaming
+RESUMABLE_CHUNK_SIZE = 16 * 1024 * 1024  # bloco de cada PATCH no upload retomável
+RESUMABLE_MAX_ATTEMPTS = 10  # tentativas seguidas sem progresso antes de desistir
+PARALLEL_MAX_PARTS = 10000  # part_size cresce para não passar disso
+# abaixo disso um único POST multipart sai mais barato que sessão + PATCH + complete (e o SHA-256 do preflight)
+RESUMABLE_MIN_SIZE = 8 * 1024 * 1024
 
 diretorio_script = os.path.dirname(__file__)
 os.makedirs(os.path.join(diretorio_script, '../', 'Logs'), exist_ok=True)
@@ -44,7 +54,7 @@ def _get_content_length(fileobj: IO):
     except Exception:
         return None
 
-def _create_session(max_retries=5, backoff_factor=1):
+def _create_session(max_retries=5, backoff_factor=1, pool_maxsize=10):
     session = requests.Session()
     retries = Retry(
         total=max_retries,
@@ -54,11 +64,179 @@ def _create_session(max_retries=5, backoff_factor=1):
         raise_on_status=False,
         respect_retry_after_header=True
     )
-    adapter = HTTPAdapter(max_retries=retries, pool_connections=10, pool_maxsize=10)
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=10, pool_maxsize=pool_maxsize)
     session.mount("https://", adapter)
     session.mount("http://", adapter)
     return session
 
+def _sha256_fileobj(fileobj):
+    """SHA-256 lido em blocos a partir do início; devolve o arquivo à posição 0."""
+    hasher = hashlib.sha256()
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        hasher.update(chunk)
+    fileobj.seek(0)
+    return hasher.hexdigest()
+
+def _preflight(session, base_url, headers, fileobj, filename, size, metadata):
+    """
+    Pergunta ao servidor se o conteúdo (SHA-256 + tamanho) já existe para o usuário. Se existir,
+    o servidor cria o item por referência e o corpo não é enviado. Retorna o video_id ou None.
+    """
+    try:
+        content_hash = _sha256_fileobj(fileobj)
+        response = session.post(f"{base_url}/api/upload-video/preflight",
+                                json={"hash": content_hash, "size": size, "filename": filename,
+                                      "metadata": metadata},
+                                headers=headers, timeout=60)
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Preflight indisponível: {e}")
+        return None
+    if response.status_code in (200, 201):
+        payload = response.json()
+        if payload.get('exists'):
+            logger.info(f"Conteúdo já existe no servidor ({content_hash[:12]}); upload dispensado.")
+            return payload.get('video_id') or payload.get('item_id') or None
+    elif response.status_code not in (404, 405):
+        logger.warning(f"Preflight recusado: Código {response.status_code} {response.text}")
+    return None
+
+class _ResumableUnavailable(Exception):
+    """Servidor sem /api/uploads (ou arquivo pequeno demais para a sessão): o chamador usa o multipart."""
+
+
+def _upload_resumable(session, base_url, headers, fileobj, filename, size, metadata,
+                      chunk_size=RESUMABLE_CHUNK_SIZE):
+    """
+    Upload retomável: cria a sessão em /api/uploads, envia blocos com PATCH + Upload-Offset e
+    finaliza em /complete. Se a conexão cair, consulta o offset aceito pelo servidor (HEAD) e
+    continua de lá, sem reenviar o que já chegou. Retorna o video_id ou None.
+    """
+    response = session.post(f"{base_url}/api/uploads",
+                            json={"filename": filename, "size": size, "metadata": metadata},
+                            headers=headers, timeout=60)
+    if response.status_code in (404, 405):
+        raise _ResumableUnavailable()
+    if response.status_code != 201:
+        logger.warning(f"Erro ao criar sessão de upload: Código {response.status_code} {response.text}")
+        return None
+    upload_url = f"{base_url}/api/uploads/{response.json()['upload_id']}"
+    logger.info(f"Sessão de upload retomável criada: {upload_url}")
+
+    offset = 0
+    failures = 0
+    while offset < size:
+        fileobj.seek(offset)
+        chunk = fileobj.read(min(chunk_size, size - offset))
+        try:
+            response = session.patch(upload_url, data=chunk,
+                                     headers={**headers, 'Upload-Offset': str(offset),
+                                              'Content-Type': 'application/offset+octet-stream'},
+                                     timeout=600)
+            if response.status_code == 200:
+                offset = int(response.headers.get('Upload-Offset', offset + len(chunk)))
+                failures = 0
+                continue
+            if response.status_code in (401, 403, 404, 409, 413, 416):
+                logger.warning(f"Erro no upload retomável: Código {response.status_code} {response.text}")
+                return None
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Falha no envio do bloco em {offset}: {e}")
+
+        failures += 1
+        if failures >= RESUMABLE_MAX_ATTEMPTS:
+            logger.warning(f"Upload retomável abandonado após {failures} falhas seguidas (offset {offset})")
+            return None
+        time.sleep(min(2 ** failures, 60))
+        try:
+            # retoma do offset que o servidor de fato gravou
+            offset = int(session.head(upload_url, headers=headers, timeout=60).headers.get('Upload-Offset', offset))
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+
+    response = session.post(f"{upload_url}/complete", headers=headers, timeout=600)
+    if response.status_code in (200, 201):
+        logger.info("Upload bem-sucedido (retomável).")
+        payload = response.json()
+        return payload.get('video_id') or payload.get('item_id') or None
+    logger.warning(f"Erro ao finalizar upload retomável: Código {response.status_code} {response.text}")
+    return None
+
+def _upload_parallel(session, base_url, headers, fileobj, filename, size, metadata, parallelism,
+                     part_size=RESUMABLE_CHUNK_SIZE):
+    """
+    Upload em partes paralelas: o arquivo é dividido em partes de part_size bytes enviadas por
+    `parallelism` conexões a PUT /api/uploads/{id}/parts/{n}, cada uma com seu SHA-256
+    (X-Part-Sha256). Partes que falham são reenviadas; no fim, /complete monta o arquivo.
+    Retorna o video_id ou None.
+    """
+    part_size = max(part_size, -(-size // PARALLEL_MAX_PARTS))
+    response = session.post(f"{base_url}/api/uploads",
+                            json={"filename": filename, "size": size, "metadata": metadata,
+                                  "part_size": part_size},
+                            headers=headers, timeout=60)
+    if response.status_code in (404, 405):
+        raise _ResumableUnavailable()
+    if response.status_code != 201:
+        logger.warning(f"Erro ao criar sessão de upload: Código {response.status_code} {response.text}")
+        return None
+    upload_url = f"{base_url}/api/uploads/{response.json()['upload_id']}"
+    part_count = max(1, -(-size // part_size))
+    logger.info(f"Upload em {part_count} partes de {part_size} bytes, {parallelism} em paralelo: {upload_url}")
+
+    # os.pread permite leituras concorrentes sem mexer na posição do arquivo
+    try:
+        fd = fileobj.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fd = None
+    read_lock = threading.Lock()
+
+    def read_part(part_number):
+        offset, length = part_number * part_size, min(part_size, size - part_number * part_size)
+        if fd is not None:
+            return os.pread(fd, length, offset)
+        with read_lock:
+            fileobj.seek(offset)
+            return fileobj.read(length)
+
+    def send_part(part_number):
+        data = read_part(part_number)
+        digest = hashlib.sha256(data).hexdigest()
+        for attempt in range(1, RESUMABLE_MAX_ATTEMPTS + 1):
+            try:
+                response = session.put(f"{upload_url}/parts/{part_number}", data=data,
+                                       headers={**headers, 'X-Part-Sha256': digest,
+                                                'Content-Type': 'application/octet-stream'},
+                                       timeout=600)
+                if response.status_code == 200:
+                    return True
+                if response.status_code in (401, 403, 404, 409, 413, 416):
+                    logger.warning(f"Parte {part_number} recusada: Código {response.status_code} {response.text}")
+                    return False
+                logger.warning(f"Parte {part_number} falhou (tentativa {attempt}): Código {response.status_code}")
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Parte {part_number} falhou (tentativa {attempt}): {e}")
+            time.sleep(min(2 ** attempt, 60))
+        return False
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        results = list(executor.map(send_part, range(part_count)))
+    if not all(results):
+        failed = [n for n, ok in enumerate(results) if not ok]
+        logger.warning(f"Upload em partes incompleto; partes com falha: {failed}")
+        return None
+
+    response = session.post(f"{upload_url}/complete", headers=headers, timeout=600)
+    if response.status_code in (200, 201):
+        logger.info("Upload bem-sucedido (partes paralelas).")
+        payload = response.json()
+        return payload.get('video_id') or payload.get('item_id') or None
+    logger.warning(f"Erro ao finalizar upload em partes: Código {response.status_code} {response.text}")
+    return None
+
 def upload_(name_project, VIDEO_FILE_PATH, USER_ID_FOR_TEST,
             type_project="files",
             title='',
@@ -69,16 +247,43 @@ def upload_(name_project, VIDEO_FILE_PATH, USER_ID_FOR_TEST,
             urltumbnail='',
             justificativa='',
             sentimento_principal='',
-            potencial_de_viralizacao=''):
+            potencial_de_viralizacao='',
+            parallelism=1,
+            preflight=True,
+            resumable_min_size=RESUMABLE_MIN_SIZE):
     """
     Versão streaming-first do upload:
-      - path (string) -> multipart
-      - fileobj seekable -> multipart (fileobj)
+      - path (string) -> upload retomável (/api/uploads), multipart se o servidor não suportar
+      - fileobj seekable -> upload retomável, multipart (fileobj) se o servidor não suportar
       - fileobj não-seekable -> STREAM RAW direto para /api/upload-video (X-Filename + X-Metadata)
       - fallback: temp file (apenas em caso extremo)
+
+    Com parallelism > 1, caminhos e fileobjs com seek são enviados em partes paralelas
+    (várias conexões TCP), com SHA-256 por parte e reenvio das partes que falharem.
+
+    Com preflight=True, caminhos e fileobjs com seek têm o SHA-256 calculado localmente e o
+    servidor é consultado antes: se ele já tiver o conteúdo, nenhum byte do corpo é enviado.
+
+    Arquivos com menos de resumable_min_size bytes passam pelo preflight do mesmo jeito, mas o
+    corpo vai no POST multipart, sem sessão retomável.
     """
     UPLOAD_URL = "https://videomanager.api.mediacutsstudio.com"
-    session = _create_session(max_retries=5, backoff_factor=1)
+    session = _create_session(max_retries=5, backoff_factor=1, pool_maxsize=max(10, parallelism))
+
+    def send_resumable(fileobj, filename, size):
+        if preflight:
+            video_id = _preflight(session, UPLOAD_URL, {'X-User-Id': USER_ID_FOR_TEST}, fileobj, filename,
+                                  size, video_metadata)
+            if video_id:
+                return video_id
+        # o tamanho só decide como o corpo vai: sessão retomável ou POST multipart
+        if size < resumable_min_size:
+            raise _ResumableUnavailable()
+        if parallelism > 1:
+            return _upload_parallel(session, UPLOAD_URL, {'X-User-Id': USER_ID_FOR_TEST}, fileobj, filename,
+                                    size, video_metadata, parallelism)
+        return _upload_resumable(session, UPLOAD_URL, {'X-User-Id': USER_ID_FOR_TEST}, fileobj, filename,
+                                 size, video_metadata)
 
     if type_project == "files":
         video_metadata = {
@@ -108,6 +313,12 @@ def upload_(name_project, VIDEO_FILE_PATH, USER_ID_FOR_TEST,
 
         try:
             with open(VIDEO_FILE_PATH, 'rb') as video_file:
+                try:
+                    logger.info(f"Tentando enviar '{VIDEO_FILE_PATH}' para {UPLOAD_URL} (retomável)...")
+                    return send_resumable(video_file, os.path.basename(VIDEO_FILE_PATH),
+                                          os.path.getsize(VIDEO_FILE_PATH))
+                except _ResumableUnavailable:
+                    video_file.seek(0)
                 files = {
                     'file': (os.path.basename(VIDEO_FILE_PATH), video_file, 'video/mp4')
                 }
@@ -169,6 +380,11 @@ def upload_(name_project, VIDEO_FILE_PATH, USER_ID_FOR_TEST,
     # Se fileobj tem tamanho/seekable, faça multipart usando fileobj (não raw stream)
     if content_length is not None and seekable:
         try:
+            try:
+                logger.info(f"Tentando enviar stream '{filename}' para {UPLOAD_URL} (retomável)...")
+                return send_resumable(fileobj, filename, content_length)
+            except _ResumableUnavailable:
+                pass
             # garante posição no início
             fileobj.seek(0)
             files = {'file': (filename, fileobj, 'video/mp4')}
@@ -287,3 +503,56 @@ def upload_(name_project, VIDEO_FILE_PATH, USER_ID_FOR_TEST,
                 os.remove(tmp_path)
             except Exception:
                 pass
+
+
+def _batch_body(boundary, manifest, paths):
+    """Corpo multipart do upload em lote gerado em blocos (manifest primeiro, depois um arquivo por parte)."""
+    yield (f'--{boundary}\r\nContent-Disposition: form-data; name="manifest"\r\n'
+           f'Content-Type: application/json\r\n\r\n{json.dumps(manifest)}\r\n').encode("utf-8")
+    for index, path in enumerate(paths):
+        filename = os.path.basename(path).replace('"', '_')
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="file{index}"; filename="{filename}"\r\n'
+               f'Content-Type: application/octet-stream\r\n\r\n').encode("utf-8")
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode("utf-8")
+
+
+def upload_batch_(name_project, file_paths, USER_ID_FOR_TEST, type_project="files", items=None):
+    """
+    Envia vários arquivos locais para o mesmo projeto numa única requisição a
+    /api/upload-video/batch (corpo multipart gerado em streaming, sem carregar os arquivos).
+    items: metadados opcionais por arquivo, na mesma ordem de file_paths.
+    Retorna a lista de resultados por arquivo do servidor (ou None se a requisição falhar).
+    """
+    UPLOAD_URL = "https://videomanager.api.mediacutsstudio.com"
+    session = _create_session(max_retries=0)
+    manifest = {"projectName": name_project, "type_project": type_project}
+    if items:
+        manifest["items"] = list(items)
+    boundary = os.urandom(16).hex()
+    logger.info(f"Enviando lote de {len(file_paths)} arquivo(s) para o projeto '{name_project}' ...")
+    try:
+        response = session.post(f"{UPLOAD_URL}/api/upload-video/batch",
+                                data=_batch_body(boundary, manifest, file_paths),
+                                headers={'X-User-Id': USER_ID_FOR_TEST,
+                                         'Content-Type': f'multipart/form-data; boundary={boundary}'},
+                                timeout=3600)
+    except Exception as e:
+        logger.exception(f"Erro no upload em lote: {e}")
+        return None
+    try:
+        payload = response.json()
+    except Exception:
+        logger.warning(f"Erro no upload em lote: Código {response.status_code} {response.text}")
+        return None
+    if response.status_code not in (201, 207):
+        logger.warning(f"Erro no upload em lote: Código {response.status_code} {json.dumps(payload, indent=2)}")
+        return payload.get('results')
+    logger.info(f"Lote enviado: {payload.get('created')} criado(s), {payload.get('rejected')} recusado(s).")
+    return payload.get('results')
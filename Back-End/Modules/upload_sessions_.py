@@ -0,0 +1,363 @@
+# Modules/upload_sessions_.py
+import os
+import json
+import time
+import uuid
+import fcntl
+import hashlib
+from contextlib import contextmanager
+
+
+DEFAULT_PART_SIZE = 16 * 1024 * 1024
+
+
+class UploadSessionError(Exception):
+    """Erro de sessão de upload; status e mensagem são devolvidos ao cliente."""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+
+def merge_range(ranges, start, end):
+    """Insere [start, end) numa lista ordenada de intervalos [inicio, fim) unindo os adjacentes."""
+    merged = []
+    for a, b in sorted(ranges + [[start, end]]):
+        if merged and a <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return merged
+
+
+def subtract_range(ranges, start, end):
+    """Remove [start, end) da lista de intervalos recebidos."""
+    result = []
+    for a, b in ranges:
+        if b <= start or a >= end:
+            result.append([a, b])
+            continue
+        if a < start:
+            result.append([a, start])
+        if b > end:
+            result.append([end, b])
+    return result
+
+
+def contiguous_offset(ranges):
+    """Quantidade de bytes recebidos em sequência a partir do início (offset de retomada)."""
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+
+def missing_ranges(ranges, size):
+    """Intervalos [inicio, fim) ainda não recebidos."""
+    missing, cursor = [], 0
+    for a, b in ranges:
+        if a > cursor:
+            missing.append([cursor, a])
+        cursor = max(cursor, b)
+    if cursor < size:
+        missing.append([cursor, size])
+    return missing
+
+
+class _PartialWrite(Exception):
+    def __init__(self, position, error):
+        super().__init__(str(error))
+        self.position = position
+        self.error = error
+
+
+class UploadSessionStore:
+    """
+    Sessões de upload retomável gravadas em disco (base_dir, no mesmo volume dos vídeos):
+      - {id}.part: arquivo pré-alocado com o tamanho final; cada bloco é gravado com os.pwrite
+        no seu offset, então os blocos podem chegar fora de ordem e por workers diferentes;
+      - {id}.json: estado da sessão (usuário, arquivo, metadados, intervalos recebidos, expiração).
+
+    Os bytes chegam por PATCH (write, offset livre) ou por partes numeradas de part_size bytes
+    (write_part, com SHA-256 verificado), que podem ser enviadas em paralelo.
+
+    O estado é atualizado sob fcntl.flock no .part (válido entre os processos do uvicorn) e
+    gravado de forma atômica (arquivo temporário + os.replace). Sessões expiram após ttl segundos
+    sem atividade e são removidas por collect_expired().
+    """
+
+    def __init__(self, base_dir, ttl=24 * 3600, gc_interval=600):
+        self.base_dir = base_dir
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+        self._last_gc = 0.0
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.base_dir, f"{upload_id}.json")
+
+    def part_path(self, upload_id):
+        return os.path.join(self.base_dir, f"{upload_id}.part")
+
+    @staticmethod
+    def _valid_id(upload_id):
+        try:
+            return uuid.UUID(upload_id).hex == upload_id
+        except (ValueError, AttributeError, TypeError):
+            return False
+
+    def _load(self, upload_id):
+        try:
+            with open(self._state_path(upload_id), "r", encoding="utf-8") as f:
+                session = json.load(f)
+        except FileNotFoundError:
+            return None
+        # sessões criadas antes do envio por partes
+        session.setdefault("partSize", DEFAULT_PART_SIZE)
+        session.setdefault("parts", {})
+        return session
+
+    def _save(self, session):
+        path = self._state_path(session["id"])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _locked(self, upload_id):
+        fd = os.open(self.part_path(upload_id), os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield fd
+        finally:
+            os.close(fd)
+
+    def create(self, user_key, filename, size, metadata, part_size=DEFAULT_PART_SIZE):
+        self.maybe_collect_expired()
+        upload_id = uuid.uuid4().hex
+        now = time.time()
+        fd = os.open(self.part_path(upload_id), os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            if size:
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except (AttributeError, OSError):
+                    # sistemas de arquivos sem fallocate: arquivo esparso do tamanho final
+                    os.ftruncate(fd, size)
+        except OSError:
+            os.close(fd)
+            os.remove(self.part_path(upload_id))
+            raise
+        os.close(fd)
+
+        session = {
+            "id": upload_id,
+            "user": user_key,
+            "filename": filename,
+            "size": size,
+            "metadata": metadata,
+            "partSize": part_size,
+            "ranges": [],
+            "parts": {},
+            "status": "open",
+            "createdAt": now,
+            "expiresAt": now + self.ttl,
+        }
+        self._save(session)
+        return session
+
+    def get(self, upload_id, user_key):
+        """Retorna a sessão do usuário ou levanta UploadSessionError 404 (inexistente, de outro usuário ou expirada)."""
+        if not self._valid_id(upload_id):
+            raise UploadSessionError("Sessão de upload não encontrada", 404)
+        session = self._load(upload_id)
+        if not session or session.get("user") != user_key or session["expiresAt"] < time.time():
+            raise UploadSessionError("Sessão de upload não encontrada", 404)
+        return session
+
+    def write(self, upload_id, user_key, offset, stream, length=None, chunk_size=1024 * 1024):
+        """
+        Grava o corpo (stream) a partir de offset no .part e registra o intervalo recebido.
+        length (Content-Length) é opcional; sem ele o corpo é lido até o fim.
+        Retorna a sessão atualizada.
+        """
+        session = self.get(upload_id, user_key)
+        if session["status"] != "open":
+            raise UploadSessionError("Sessão de upload já finalizada", 409)
+        size = session["size"]
+        if offset < 0 or offset > size:
+            raise UploadSessionError("Upload-Offset fora do arquivo", 416)
+        if length is not None and offset + length > size:
+            raise UploadSessionError("Bloco ultrapassa o tamanho declarado do arquivo", 416)
+
+        position = offset
+        try:
+            position = self._pwrite_stream(upload_id, offset, size, stream, chunk_size)
+        except _PartialWrite as e:
+            position = e.position
+            raise e.error
+        finally:
+            # registra o que chegou ao disco, mesmo que a conexão tenha caído no meio do bloco
+            if position > offset:
+                self._record(upload_id, offset, position)
+        return self.get(upload_id, user_key)
+
+    def part_count(self, session):
+        return max(1, -(-session["size"] // session["partSize"]))
+
+    def write_part(self, upload_id, user_key, part_number, stream, sha256=None, chunk_size=1024 * 1024):
+        """
+        Grava a parte part_number (offset part_number * partSize) e confere o tamanho e o SHA-256
+        informado pelo cliente. A parte só é registrada se estiver completa e íntegra; reenviar
+        uma parte substitui a anterior. Retorna (sessão, sha256_hex).
+        """
+        session = self.get(upload_id, user_key)
+        if session["status"] != "open":
+            raise UploadSessionError("Sessão de upload já finalizada", 409)
+        if part_number < 0 or part_number >= self.part_count(session):
+            raise UploadSessionError("Número de parte fora do arquivo", 416)
+        start = part_number * session["partSize"]
+        end = min(start + session["partSize"], session["size"])
+
+        hasher = hashlib.sha256()
+        try:
+            position = self._pwrite_stream(upload_id, start, end, stream, chunk_size, hasher)
+        except _PartialWrite as e:
+            self._forget(upload_id, part_number, start, end)
+            raise e.error
+        digest = hasher.hexdigest()
+        if position != end:
+            self._forget(upload_id, part_number, start, end)
+            raise UploadSessionError(f"Parte {part_number} incompleta: esperado {end - start} bytes, recebido {position - start}")
+        if sha256 and sha256.lower() != digest:
+            self._forget(upload_id, part_number, start, end)
+            raise UploadSessionError(f"Checksum da parte {part_number} não confere", 422, sha256=digest)
+        self._record(upload_id, start, end, part=(part_number, digest))
+        return self.get(upload_id, user_key), digest
+
+    def _pwrite_stream(self, upload_id, offset, limit, stream, chunk_size, hasher=None):
+        """Grava stream a partir de offset sem passar de limit. Retorna a posição final."""
+        fd = os.open(self.part_path(upload_id), os.O_WRONLY)
+        position = offset
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                if position + len(chunk) > limit:
+                    raise UploadSessionError("Bloco ultrapassa o tamanho declarado do arquivo", 416)
+                if hasher is not None:
+                    hasher.update(chunk)
+                view = memoryview(chunk)
+                while view:
+                    written = os.pwrite(fd, view, position)
+                    position += written
+                    view = view[written:]
+        except Exception as e:
+            raise _PartialWrite(position, e)
+        finally:
+            os.close(fd)
+        return position
+
+    def _record(self, upload_id, start, end, part=None):
+        try:
+            with self._locked(upload_id):
+                session = self._load(upload_id)
+                if not session or session["status"] != "open":
+                    return
+                session["ranges"] = merge_range(session["ranges"], start, end)
+                if part is not None:
+                    session["parts"][str(part[0])] = part[1]
+                session["expiresAt"] = time.time() + self.ttl
+                self._save(session)
+        except FileNotFoundError:
+            # sessão finalizada ou removida enquanto o bloco era gravado
+            pass
+
+    def _forget(self, upload_id, part_number, start, end):
+        """Parte recebida com erro: os bytes em disco deixam de contar como recebidos."""
+        try:
+            with self._locked(upload_id):
+                session = self._load(upload_id)
+                if not session or session["status"] != "open":
+                    return
+                session["ranges"] = subtract_range(session["ranges"], start, end)
+                session["parts"].pop(str(part_number), None)
+                self._save(session)
+        except FileNotFoundError:
+            pass
+
+    def complete(self, upload_id, user_key, finalize):
+        """
+        Finaliza a sessão: exige todos os bytes e chama finalize(sessao, caminho_do_part),
+        que deve mover o arquivo e retornar o resultado (dict). O resultado fica gravado na
+        sessão até ela expirar, então repetir o complete devolve a mesma resposta.
+        """
+        session = self.get(upload_id, user_key)
+        if session["status"] == "completed":
+            return session["result"]
+        try:
+            with self._locked(upload_id):
+                session = self._load(upload_id)
+                if session["status"] == "completed":
+                    return session["result"]
+                missing = missing_ranges(session["ranges"], session["size"])
+                if missing:
+                    raise UploadSessionError("Upload incompleto", 409, missing=missing)
+                result = finalize(session, self.part_path(upload_id))
+                session["status"] = "completed"
+                session["result"] = result
+                session["expiresAt"] = time.time() + self.ttl
+                self._save(session)
+        except FileNotFoundError:
+            # outro worker finalizou a sessão (o .part já foi movido)
+            session = self.get(upload_id, user_key)
+            if session["status"] == "completed":
+                return session["result"]
+            raise
+        return result
+
+    def abort(self, upload_id, user_key):
+        self.get(upload_id, user_key)
+        self._remove(upload_id)
+
+    def _remove(self, upload_id):
+        for path in (self._state_path(upload_id), self.part_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def maybe_collect_expired(self):
+        now = time.time()
+        if now - self._last_gc >= self.gc_interval:
+            self._last_gc = now
+            return self.collect_expired(now)
+        return 0
+
+    def collect_expired(self, now=None):
+        """Remove sessões expiradas (e .part órfãos mais antigos que ttl). Retorna quantas removeu."""
+        now = now or time.time()
+        removed = 0
+        try:
+            entries = list(os.scandir(self.base_dir))
+        except FileNotFoundError:
+            return 0
+        states = {e.name[:-5] for e in entries if e.name.endswith(".json")}
+        for entry in entries:
+            name = entry.name
+            if name.endswith(".json"):
+                upload_id = name[:-5]
+                session = self._load(upload_id)
+                if session and session.get("expiresAt", 0) >= now:
+                    continue
+                self._remove(upload_id)
+                removed += 1
+            elif name.endswith(".tmp") or (name.endswith(".part") and name[:-5] not in states):
+                try:
+                    if entry.stat().st_mtime + self.ttl < now:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
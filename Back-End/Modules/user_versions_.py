@@ -0,0 +1,65 @@
+# Modules/user_versions_.py
+import os
+import time
+import sqlite3
+import threading
+
+
+class UserVersionStore:
+    """
+    Carimbo de versão por (usuario, escopo), compartilhado entre os workers (SQLite WAL).
+
+    Toda rota que altera os dados de um escopo chama bump(); as rotas GET usam o carimbo
+    como ETag e respondem 304 sem consultar o Firebase. O valor é derivado de time.time_ns()
+    (sempre crescente), então um banco recriado não repete carimbos antigos dos clientes.
+
+    max_age limita quanto tempo um carimbo vale sem nenhum bump: alterações gravadas no
+    Firebase por outros processos (ex.: status/progress_percent do processamento) aparecem
+    no máximo max_age segundos depois. max_age=0 desativa a expiração.
+    """
+
+    def __init__(self, db_path, max_age=30):
+        self.db_path = db_path
+        self.max_age = max_age
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS versions ("
+            " user TEXT NOT NULL,"
+            " scope TEXT NOT NULL,"
+            " version INTEGER NOT NULL,"
+            " bumped_at REAL NOT NULL,"
+            " PRIMARY KEY (user, scope))"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, user, scope):
+        row = self._conn().execute(
+            "SELECT version, bumped_at FROM versions WHERE user = ? AND scope = ?", (user, scope)
+        ).fetchone()
+        if row is None or (self.max_age and row[1] <= time.time() - self.max_age):
+            return self.bump(user, scope)[scope]
+        return row[0]
+
+    def bump(self, user, *scopes):
+        """Invalida os escopos do usuário (em todos os workers). Retorna {escopo: nova_versão}."""
+        conn = self._conn()
+        now = time.time()
+        versions = {}
+        for scope in scopes:
+            versions[scope] = conn.execute(
+                "INSERT INTO versions (user, scope, version, bumped_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user, scope) DO UPDATE SET "
+                " version = MAX(version + 1, excluded.version), bumped_at = excluded.bumped_at "
+                "RETURNING version",
+                (user, scope, time.time_ns(), now),
+            ).fetchone()[0]
+        return versions
@@ -0,0 +1,40 @@
+# batch_upload.py
+# Upload em lote para um projeto "files" que ainda não existe: o nó do projeto e todos os itens
+# são criados numa única atualização multi-caminho (sem caminhos sobrepostos).
+#
+# Uso: USER_ID=usuario@exemplo_com python Test/batch_upload.py
+import os
+import sys
+import uuid
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from Modules.upload_ import upload_batch_
+
+USER_ID_FOR_TEST = os.getenv("USER_ID", "freitasalexandre810@gmail_com")
+name_project = f"lote_{uuid.uuid4().hex[:8]}"
+
+tmp_dir = tempfile.mkdtemp(prefix="batch_upload_")
+file_paths = []
+for name, content in (("legenda.srt", b"1\n00:00:00,000 --> 00:00:01,000\nteste\n"),
+                      ("dados.json", b'{"teste": true}'),
+                      ("notas.txt", b"teste")):
+    path = os.path.join(tmp_dir, name)
+    with open(path, "wb") as f:
+        f.write(content)
+    file_paths.append(path)
+
+print(f"Enviando {len(file_paths)} arquivos para o projeto novo '{name_project}'...")
+results = upload_batch_(name_project, file_paths, USER_ID_FOR_TEST, type_project="files")
+
+if not results:
+    print("Upload em lote falhou: nenhuma resposta do servidor.")
+    sys.exit(1)
+created = [r for r in results if r.get("status") == "created"]
+for r in results:
+    print(f"- {r.get('filename')}: {r.get('status')} {r.get('video_id') or r.get('message') or ''}")
+if len(created) != len(file_paths):
+    print(f"Upload em lote falhou: {len(created)} de {len(file_paths)} arquivos criados.")
+    sys.exit(1)
+print("Upload em lote OK: projeto criado com todos os arquivos.")
@@ -0,0 +1,115 @@
+# bench_stream.py
+# Compara throughput e CPU por GB entre:
+#   - wsgi:     send_from_directory atravessando o WsgiToAsgi (caminho antigo)
+#   - chunked:  MediaStreamMiddleware com leitura em blocos (fallback sem extensões ASGI)
+#   - zerocopy: MediaStreamMiddleware com "http.response.zerocopysend" (servidor simulado com os.sendfile)
+#
+# Uso: python Test/bench_stream.py [tamanho_em_MB] [repeticoes]
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask, request, send_from_directory
+from asgiref.wsgi import WsgiToAsgi
+from Modules.http_range_ import send_file_ranged
+from Modules.asgi_stream_ import MediaStreamMiddleware, OFFLOAD_ENVIRON_KEY
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+REPEAT = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(1024 * 1024)))
+
+tmp_dir = tempfile.mkdtemp(prefix="bench_stream_")
+file_path = os.path.join(tmp_dir, "video.mp4")
+with open(file_path, "wb") as f:
+    block = os.urandom(1024 * 1024)
+    for _ in range(SIZE_MB):
+        f.write(block)
+
+app = Flask(__name__)
+
+
+@app.route('/wsgi')
+def wsgi_route():
+    return send_from_directory(tmp_dir, "video.mp4", as_attachment=True)
+
+
+@app.route('/asgi')
+def asgi_route():
+    return send_file_ranged(file_path, request.headers, download_name="video.mp4",
+                            chunk_size=CHUNK_SIZE,
+                            offload=request.environ.get(OFFLOAD_ENVIRON_KEY) == "1")
+
+
+plain_asgi = WsgiToAsgi(app)
+media_asgi = MediaStreamMiddleware(WsgiToAsgi(app), chunk_size=CHUNK_SIZE)
+devnull_fd = os.open(os.devnull, os.O_WRONLY)
+
+
+async def run_request(asgi_app, path, zerocopy=False):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        "extensions": {"http.response.zerocopysend": {}} if zerocopy else {},
+    }
+    body_sent = asyncio.Event()
+    received = 0
+    status = None
+
+    async def receive():
+        if not body_sent.is_set():
+            body_sent.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal received, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            received += len(message.get("body", b""))
+        elif message["type"] == "http.response.zerocopysend":
+            # servidor simulado: os.sendfile do arquivo para /dev/null
+            fd, offset, count = message["file"].fileno(), message.get("offset", 0), message["count"]
+            while count > 0:
+                sent = os.sendfile(devnull_fd, fd, offset, count)
+                if sent == 0:
+                    break
+                offset += sent
+                count -= sent
+                received += sent
+
+    await asyncio.wait_for(asgi_app(scope, receive, send), timeout=600)
+    return status, received
+
+
+def bench(label, asgi_app, path, zerocopy=False):
+    # aquecimento (page cache)
+    asyncio.run(run_request(asgi_app, path, zerocopy))
+    wall, cpu, total = 0.0, 0.0, 0
+    for _ in range(REPEAT):
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        status, received = asyncio.run(run_request(asgi_app, path, zerocopy))
+        cpu += time.process_time() - cpu0
+        wall += time.perf_counter() - wall0
+        total += received
+        assert status == 200 and received == SIZE_MB * 1024 * 1024, (status, received)
+    gb = total / (1024 ** 3)
+    print(f"{label:<10} {total / (1024 ** 2) / wall:10.1f} MB/s {cpu / gb:10.3f} CPU s/GB")
+
+
+if __name__ == "__main__":
+    print(f"Arquivo: {SIZE_MB} MB, repetições: {REPEAT}, chunk: {CHUNK_SIZE} bytes")
+    try:
+        bench("wsgi", plain_asgi, "/wsgi")
+        bench("chunked", media_asgi, "/asgi")
+        bench("zerocopy", media_asgi, "/asgi", zerocopy=True)
+    finally:
+        os.close(devnull_fd)
+        os.remove(file_path)
+        os.rmdir(tmp_dir)
@@ -1,9 +1,11 @@
 # server.py
-from flask import Flask, render_template, Response, request, jsonify, session, redirect,send_from_directory,  url_for
+from flask import Flask, render_template, Response, request, jsonify, session, redirect,  url_for
 from flask_cors import CORS  
 import time
+import threading
 import pytz
 import hashlib
+import hmac
 from dotenv import load_dotenv
 import os
 import logging
@@ -15,11 +17,29 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from flask_limiter.util import get_remote_address
 from werkzeug.formparser import parse_form_data
 from werkzeug.utils import secure_filename # Para sanitizar nomes de arquivos
+from werkzeug.http import http_date
 import re
-from asgiref.wsgi import WsgiToAsgi
 import shutil
+import errno
+import base64
 from firebase_admin import initialize_app, credentials, storage, get_app
 from dotenv import load_dotenv
+from Modules.cache_ import LRUTTLCache
+from Modules.shared_cache_ import SharedPathCache
+from Modules.metrics_ import Counters
+from Modules.http_range_ import send_file_ranged
+from Modules.asgi_stream_ import MediaStreamMiddleware, StreamingWsgiToAsgi, OFFLOAD_ENVIRON_KEY, events_offload_headers
+from Modules.project_events_ import ProjectEventHub
+from Modules.metadata_store_ import MetadataStore
+from Modules.multipart_ import parse_multipart_stream, MultipartError, UploadTooLarge
+from Modules.upload_sessions_ import UploadSessionStore, UploadSessionError, contiguous_offset, missing_ranges, DEFAULT_PART_SIZE
+from Modules.signed_url_ import sign_stream_path, verify_stream_signature
+from Modules.blob_store_ import BlobStore, HashingWriter, hash_file
+from Modules.user_versions_ import UserVersionStore
+from Modules.trash_ import TrashBin
+from Modules.expiry_reaper_ import ExpiryReaper
+from Modules.storage_ import Storage, LayoutMigrator, parse_volumes, PRIMARY_VOLUME
+from Modules.storage_scan_ import StorageScanner
 
 load_dotenv(os.path.join(os.path.dirname(__file__), 'Keys', 'keys.env'))
 
@@ -45,12 +65,37 @@ if os.getenv("FLASK_ENV") == "development":
                 "https://a7ae3fc28c35.ngrok-free.app"
             ],
             "methods": ["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"],
-            "allow_headers": ["Content-Type", "Authorization", "X-User-Id"],
+            "allow_headers": ["Content-Type", "Authorization", "X-User-Id", "Upload-Offset", "Content-Range", "X-Part-Sha256", "Last-Event-ID"],
+            "expose_headers": ["Location", "Upload-Offset", "Upload-Length", "Upload-Expires", "X-Part-Sha256"],
             "supports_credentials": True
         }
     })
 
-asgi_app = WsgiToAsgi(app)
+# Tamanho dos blocos do envio de arquivos pelo caminho ASGI (fallback sem zerocopysend)
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(1024 * 1024)))
+# Threads por worker para atender as requisições Flask (uploads longos ocupam uma thread cada)
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "64"))
+# Eventos de projetos (SSE): listeners do Firebase em projects/{usuario} por worker, repassados às conexões abertas
+PROJECT_EVENTS_ENABLED = os.getenv("PROJECT_EVENTS_ENABLED", "1") == "1"
+PROJECT_EVENTS_HEARTBEAT = int(os.getenv("PROJECT_EVENTS_HEARTBEAT", "15"))
+PROJECT_EVENTS_BUFFER = int(os.getenv("PROJECT_EVENTS_BUFFER", "2048"))
+# Listeners abertos por worker (usuários com conexão SSE aberta não são fechados)
+PROJECT_EVENTS_MAX_LISTENERS = int(os.getenv("PROJECT_EVENTS_MAX_LISTENERS", "256"))
+# Os listeners também alimentam o espelho local de metadados (METADATA_SOURCE=local)
+project_events = ProjectEventHub(
+    lambda user_key, callback: db.reference(f'projects/{user_key}', app=app_instance).listen(callback),
+    ring_size=PROJECT_EVENTS_BUFFER,
+    max_listeners=PROJECT_EVENTS_MAX_LISTENERS,
+    # alterações externas (status/progress_percent do processamento) também invalidam o ETag
+    on_change=lambda user_key: _bump_user_version(user_key, 'projects'),
+    # sem listener o espelho do usuário deixaria de receber as alterações externas
+    on_release=lambda user_key: _release_user_metadata(user_key),
+)
+# Arquivos grandes e streams SSE são enviados pelo middleware no event loop, fora da thread do WSGI;
+# o corpo das requisições chega ao Flask em streaming (sem pré-bufferização do WsgiToAsgi)
+asgi_app = MediaStreamMiddleware(StreamingWsgiToAsgi(app, max_threads=WSGI_THREADS), chunk_size=STREAM_CHUNK_SIZE,
+                                 events=project_events if PROJECT_EVENTS_ENABLED else None,
+                                 events_heartbeat=PROJECT_EVENTS_HEARTBEAT)
 
 app.secret_key = 'sua_chave_secreta'  # Substitua por uma chave forte e secreta
 app.permanent_session_lifetime = timedelta(minutes=60)  # Sessão válida por 60 minutos
@@ -75,10 +120,192 @@ logger.addHandler(console_handler)
 
 
 users_ref = db.reference("users", app=app_instance)
-video_path_cache = {}
+# Paginação de /api/projects (ordenada por createdAt; requer ".indexOn": "createdAt" em projects/$user)
+PROJECTS_PAGE_DEFAULT = 20
+PROJECTS_PAGE_MAX = int(os.getenv("PROJECTS_PAGE_MAX", "100"))
+PROJECT_LIST_FIELDS = ("name", "model_ai", "status", "used", "progress_percent", "url_original",
+                       "thumbnail_url", "createdAt", "type_project")
+# Índice email -> chave do usuário em "users" (evita baixar a árvore inteira de usuários)
+users_by_email_ref = db.reference("users_by_email", app=app_instance)
 CACHE_TTL = 300 
 CHUNK_SIZE =  1 * 1024 * 1024
-VIDEO_BASE_DIR = os.path.join(os.path.dirname(__file__), 'videos')
+# Tamanho máximo de um arquivo enviado (verificado pelo Content-Length e durante a leitura)
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 ** 3)))
+# Cota de armazenamento por usuário em bytes (0 = sem cota); usage/{usuario}/quotaBytes tem precedência
+USER_STORAGE_QUOTA = int(os.getenv("USER_STORAGE_QUOTA", "0"))
+# Intervalo para recalcular usage/{usuario} a partir dos resumos por projeto
+USAGE_RECONCILE_INTERVAL = int(os.getenv("USAGE_RECONCILE_INTERVAL", "3600"))
+# Folga para boundary, cabeçalhos e campos de texto ao comparar o Content-Length de um corpo
+# multipart com os limites do arquivo (o limite exato é verificado durante a leitura)
+MULTIPART_OVERHEAD = 64 * 1024
+# Upload em lote (/api/upload-video/batch): tamanho total do corpo e quantidade de arquivos
+MAX_BATCH_UPLOAD_SIZE = int(os.getenv("MAX_BATCH_UPLOAD_SIZE", str(MAX_UPLOAD_SIZE)))
+BATCH_UPLOAD_MAX_FILES = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "1000"))
+VIDEO_BASE_DIR = os.getenv("VIDEO_BASE_DIR", os.path.join(os.path.dirname(__file__), 'videos'))
+# Volumes extras para os arquivos dos projetos ("nome=/caminho,..."); VIDEO_BASE_DIR é o volume "default"
+# e continua guardando .blobs, .uploads, .cache e os arquivos com serverFilePath relativo
+STORAGE_VOLUMES = parse_volumes(os.getenv("STORAGE_VOLUMES", ""))
+# Volume de cada novo upload: free_space (mais espaço livre) ou round_robin
+STORAGE_PLACEMENT = os.getenv("STORAGE_PLACEMENT", "free_space")
+# Níveis de subdiretórios por hash do video_id dentro da pasta do projeto (0 = layout plano antigo)
+STORAGE_FANOUT_LEVELS = int(os.getenv("STORAGE_FANOUT_LEVELS", "1"))
+# Volumes com menos espaço livre que isto só recebem uploads se todos estiverem abaixo
+STORAGE_MIN_FREE_BYTES = int(os.getenv("STORAGE_MIN_FREE_BYTES", str(1024 * 1024 * 1024)))
+# Migração em segundo plano dos arquivos no layout plano para o layout com fan-out
+STORAGE_MIGRATION = os.getenv("STORAGE_MIGRATION", "1") == "1"
+STORAGE_MIGRATION_RATE = int(os.getenv("STORAGE_MIGRATION_RATE", "50"))
+# Reconciliação disco x metadados (arquivos órfãos e itens sem arquivo)
+STORAGE_SCAN_ENABLED = os.getenv("STORAGE_SCAN_ENABLED", "1") == "1"
+STORAGE_SCAN_INTERVAL = int(os.getenv("STORAGE_SCAN_INTERVAL", str(24 * 3600)))
+STORAGE_SCAN_WORKERS = int(os.getenv("STORAGE_SCAN_WORKERS", "4"))
+STORAGE_SCAN_FILES_PER_SEC = int(os.getenv("STORAGE_SCAN_FILES_PER_SEC", "2000"))
+# Arquivos alterados há menos que isto não são órfãos (uploads em andamento, caminhos recém-migrados)
+STORAGE_SCAN_MIN_AGE = int(os.getenv("STORAGE_SCAN_MIN_AGE", "3600"))
+STORAGE_SCAN_REPAIR = os.getenv("STORAGE_SCAN_REPAIR", "0") == "1"
+storage = Storage(VIDEO_BASE_DIR, STORAGE_VOLUMES, policy=STORAGE_PLACEMENT, fanout_levels=STORAGE_FANOUT_LEVELS,
+                  min_free_bytes=STORAGE_MIN_FREE_BYTES)
+# Sessões de upload retomável (estado + arquivo parcial pré-alocado no volume de vídeos)
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+# Limites do tamanho de parte no upload em partes paralelas (a última parte pode ser menor)
+UPLOAD_MIN_PART_SIZE = int(os.getenv("UPLOAD_MIN_PART_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_PART_SIZE = int(os.getenv("UPLOAD_MAX_PART_SIZE", str(512 * 1024 * 1024)))
+upload_sessions = UploadSessionStore(os.path.join(VIDEO_BASE_DIR, '.uploads'), ttl=UPLOAD_SESSION_TTL)
+# Armazenamento deduplicado: arquivos dos projetos viram hardlinks de {VIDEO_BASE_DIR}/.blobs/ab/cd/{sha256}
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+blob_store = None
+if DEDUP_ENABLED:
+    try:
+        blob_store = BlobStore(os.path.join(VIDEO_BASE_DIR, '.blobs'))
+    except Exception as e:
+        logger.warning(f"[DEDUP] Armazenamento deduplicado indisponível ({e}); arquivos gravados sem deduplicação")
+# Lixeira: exclusões renomeiam para {volume}/.trash e uma thread apaga em segundo plano
+TRASH_ENABLED = os.getenv("TRASH_ENABLED", "1") == "1"
+TRASH_PURGE_FILES_PER_SEC = int(os.getenv("TRASH_PURGE_FILES_PER_SEC", "500"))
+TRASH_PURGE_BYTES_PER_SEC = int(os.getenv("TRASH_PURGE_BYTES_PER_SEC", str(256 * 1024 * 1024)))
+TRASH_PURGE_INTERVAL = int(os.getenv("TRASH_PURGE_INTERVAL", "30"))
+trash_bin = None
+if TRASH_ENABLED:
+    try:
+        trash_bin = TrashBin(list(storage.volumes.values()), files_per_sec=TRASH_PURGE_FILES_PER_SEC,
+                             bytes_per_sec=TRASH_PURGE_BYTES_PER_SEC, interval=TRASH_PURGE_INTERVAL)
+        # retoma a limpeza interrompida (queda/reinício) já na subida do worker
+        trash_bin.start()
+    except Exception as e:
+        logger.warning(f"[TRASH] Lixeira indisponível ({e}); exclusões apagam os arquivos na requisição")
+# Remoção dos projetos vencidos (delete_after) pelo índice project_expiry
+EXPIRY_REAPER_ENABLED = os.getenv("EXPIRY_REAPER_ENABLED", "1") == "1"
+EXPIRY_REAPER_DRY_RUN = os.getenv("EXPIRY_REAPER_DRY_RUN", "0") == "1"
+EXPIRY_REAPER_INTERVAL = int(os.getenv("EXPIRY_REAPER_INTERVAL", "300"))
+EXPIRY_REAPER_BATCH = int(os.getenv("EXPIRY_REAPER_BATCH", "50"))
+EXPIRY_REAPER_MAX_PER_RUN = int(os.getenv("EXPIRY_REAPER_MAX_PER_RUN", "200"))
+# Carga única dos projetos existentes com delete_after no índice (usuários por volta do reaper)
+EXPIRY_BACKFILL_USERS_PER_RUN = int(os.getenv("EXPIRY_BACKFILL_USERS_PER_RUN", "50"))
+# Espelho local (SQLite) de projects/ e user_settings/: leituras locais, escrita no Firebase e aqui.
+# METADATA_SOURCE=firebase volta às leituras diretas do Firebase.
+METADATA_SOURCE = os.getenv("METADATA_SOURCE", "local")
+METADATA_DB = os.getenv("METADATA_DB", os.path.join(VIDEO_BASE_DIR, '.cache', 'metadata.sqlite3'))
+# Usuários lidos são recarregados do Firebase a cada intervalo (rede de segurança do listener)
+METADATA_RECONCILE_INTERVAL = int(os.getenv("METADATA_RECONCILE_INTERVAL", "600"))
+metadata_mirror = None
+if METADATA_SOURCE == "local":
+    try:
+        metadata_mirror = MetadataStore(METADATA_DB)
+        project_events.add_sink(metadata_mirror.apply_event)
+    except Exception as e:
+        logger.warning(f"[MIRROR] Espelho local indisponível ({e}); lendo direto do Firebase")
+PATH_CACHE_MAX_ENTRIES = int(os.getenv("PATH_CACHE_MAX_ENTRIES", "20000"))
+# Cache compartilhado entre os workers (SQLite WAL no volume de vídeos)
+PATH_CACHE_DB = os.getenv("PATH_CACHE_DB", os.path.join(VIDEO_BASE_DIR, '.cache', 'path_cache.sqlite3'))
+# Cache (usuario, projeto, video_id) -> {'path', 'filename'}, agrupado por (usuario, projeto)
+try:
+    video_path_cache = SharedPathCache(PATH_CACHE_DB, max_entries=PATH_CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+except Exception as e:
+    logger.warning(f"[CACHE] Cache compartilhado indisponível ({e}); usando cache local do worker")
+    video_path_cache = LRUTTLCache(max_entries=PATH_CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+# Cache em memória das identidades já verificadas (positivas e negativas)
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_NEGATIVE_CACHE_TTL = int(os.getenv("AUTH_NEGATIVE_CACHE_TTL", "15"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+auth_identity_cache = LRUTTLCache(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL)
+# Carimbo de versão por usuário (ETag/304 em /api/projects, /api/list-projects e /api/settings)
+USER_VERSION_DB = os.getenv("USER_VERSION_DB", os.path.join(VIDEO_BASE_DIR, '.cache', 'user_versions.sqlite3'))
+USER_VERSION_MAX_AGE = int(os.getenv("USER_VERSION_MAX_AGE", "30"))
+try:
+    user_versions = UserVersionStore(USER_VERSION_DB, max_age=USER_VERSION_MAX_AGE)
+except Exception as e:
+    logger.warning(f"[ETAG] Carimbos de versão indisponíveis ({e}); listagens respondidas sem ETag")
+    user_versions = None
+# Corpos JSON já serializados por (usuario, escopo, variante), válidos enquanto o carimbo não muda
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+response_cache = LRUTTLCache(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL, max_bytes=RESPONSE_CACHE_MAX_BYTES)
+# Log de alterações project_changes/{usuario}/{chave} para /api/projects/changes
+PROJECT_CHANGES_RETENTION_DAYS = int(os.getenv("PROJECT_CHANGES_RETENTION_DAYS", "30"))
+PROJECT_CHANGES_PAGE_MAX = int(os.getenv("PROJECT_CHANGES_PAGE_MAX", "1000"))
+# Alterações mais novas que isto ainda não entram numa página (gravações concorrentes com chaves fora de ordem)
+PROJECT_CHANGES_SETTLE_MS = int(os.getenv("PROJECT_CHANGES_SETTLE_MS", "2000"))
+PROJECT_CHANGES_COMPACT_INTERVAL = int(os.getenv("PROJECT_CHANGES_COMPACT_INTERVAL", "3600"))
+# usuários cujo log já foi compactado recentemente neste worker
+changes_compacted = LRUTTLCache(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=PROJECT_CHANGES_COMPACT_INTERVAL)
+expiry_reaper = None
+if EXPIRY_REAPER_ENABLED:
+    expiry_reaper = ExpiryReaper(
+        fetch_due=lambda after_key, limit: _fetch_expired_projects(after_key, limit),
+        reap=lambda entry, dry_run: _reap_expired_project(entry, dry_run),
+        drop=lambda keys: _db_update({f'project_expiry/{key}': None for key in keys}),
+        lock_path=os.path.join(VIDEO_BASE_DIR, '.cache', 'expiry_reaper.lock'),
+        interval=EXPIRY_REAPER_INTERVAL, batch_size=EXPIRY_REAPER_BATCH,
+        max_per_run=EXPIRY_REAPER_MAX_PER_RUN, dry_run=EXPIRY_REAPER_DRY_RUN,
+        backfill=lambda user_id_filter: _backfill_expiry_index(user_id_filter),
+        list_users=lambda: _metadata_user_keys(),
+        backfill_users_per_run=EXPIRY_BACKFILL_USERS_PER_RUN,
+    )
+    expiry_reaper.start()
+# URLs de streaming assinadas (HMAC) emitidas pelo preview; verificadas sem acesso ao Firebase.
+# Igual em todos os workers e nunca derivado de app.secret_key: sem ele nenhuma URL assinada é
+# emitida nem aceita, e o preview volta às URLs sem assinatura (autenticação por X-User-Id)
+STREAM_URL_SECRET = os.getenv("STREAM_URL_SECRET") or None
+if not STREAM_URL_SECRET:
+    logger.warning("[STREAM] STREAM_URL_SECRET não configurado; preview e eventos usam URLs sem assinatura "
+                   "(autenticação por X-User-Id)")
+STREAM_URL_TTL = int(os.getenv("STREAM_URL_TTL", str(4 * 3600)))
+# /api/metrics expõe pid, estado dos caches e caminhos do armazenamento: só com
+# "Authorization: Bearer {METRICS_TOKEN}"; sem o token configurado o endpoint fica desativado
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+layout_migrator = None
+if STORAGE_MIGRATION and STORAGE_FANOUT_LEVELS > 0:
+    layout_migrator = LayoutMigrator(
+        storage,
+        list_users=lambda: _metadata_user_keys(),
+        list_items=lambda user_id_filter: _flat_layout_items(user_id_filter),
+        commit=lambda user_id_filter, project_name_safe, video_id, server_file_path:
+            _commit_item_path(user_id_filter, project_name_safe, video_id, server_file_path),
+        state_path=os.path.join(VIDEO_BASE_DIR, '.cache', f'layout_migration_{STORAGE_FANOUT_LEVELS}.json'),
+        # URLs de preview já emitidas assinam o caminho antigo e valem por STREAM_URL_TTL
+        items_per_sec=STORAGE_MIGRATION_RATE, grace=max(CACHE_TTL, STREAM_URL_TTL),
+    )
+    layout_migrator.start()
+storage_scanner = None
+if STORAGE_SCAN_ENABLED:
+    storage_scanner = StorageScanner(
+        storage,
+        list_users=lambda: _metadata_user_keys(),
+        read_items=lambda user_id_filter: _stored_items(user_id_filter),
+        repair_orphan=lambda path, entry: _repair_orphan_file(path, entry),
+        repair_missing=lambda entry: _repair_missing_item(entry),
+        state_path=os.path.join(VIDEO_BASE_DIR, '.cache', 'storage_scan.json'),
+        report_path=os.path.join(VIDEO_BASE_DIR, '.cache', 'storage_scan_report.json'),
+        workers=STORAGE_SCAN_WORKERS, files_per_sec=STORAGE_SCAN_FILES_PER_SEC, min_age=STORAGE_SCAN_MIN_AGE,
+        repair=STORAGE_SCAN_REPAIR, interval=STORAGE_SCAN_INTERVAL,
+        # caminhos antigos da migração de layout ainda no prazo não são órfãos
+        skip_paths=lambda: layout_migrator.retired_paths() if layout_migrator else set(),
+    )
+    storage_scanner.start()
+# usuários cujo usage/{usuario} já foi recalculado recentemente neste worker
+usage_reconciled = LRUTTLCache(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=USAGE_RECONCILE_INTERVAL)
+# Respostas do download otimizado (200, 206, 206 multi-range, 304, 416) e bytes enviados
+download_metrics = Counters("status_200", "status_206", "status_206_multi", "status_304", "status_416", "bytes_sent")
+_users_by_email_backfilled = False
 ALLOWED_EXTENSIONS = {
     'mp4',
     'txt',
@@ -98,18 +325,88 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _email_index_key(email):
+    """
+    Chave do email no índice users_by_email (o RTDB não aceita . $ # [ ] / em chaves).
+    '.' vira '_' (como nas chaves de usuário); '%', '_' e os demais proibidos viram %XX antes,
+    para que emails diferentes (a.b@x e a_b@x) nunca caiam na mesma chave.
+    """
+    return re.sub(r'[%_$#\[\]/]', lambda m: f"%{ord(m.group()):02X}", email).replace('.', '_')
+
+def _backfill_users_by_email():
+    """
+    Reconstrói o índice users_by_email a partir de "users".
+    Executado no máximo uma vez por processo, apenas para contas antigas criadas antes do índice.
+    """
+    global _users_by_email_backfilled
+    snapshot = users_ref.get() or {}
+    updates = {}
+    for uid, user in snapshot.items():
+        db_email = (user or {}).get("email")
+        if db_email:
+            updates[_email_index_key(db_email)] = {"uid": uid, "email": db_email}
+    if updates:
+        users_by_email_ref.update(updates)
+    _users_by_email_backfilled = True
+    logger.info(f"[AUTH] Índice users_by_email reconstruído ({len(updates)} contas)")
+    return updates
+
+def find_user_key_by_email(email):
+    """
+    Resolve email -> chave do usuário em "users" com uma leitura pontual no índice.
+    Retorna a chave ou None.
+    """
+    if not email:
+        return None
+    index_key = _email_index_key(email)
+    entry = users_by_email_ref.child(index_key).get()
+    if isinstance(entry, dict) and entry.get("email") == email and entry.get("uid"):
+        return entry["uid"]
+
+    # Conta antiga sem entrada no índice: consulta indexada (requer ".indexOn": "email")
+    try:
+        matches = users_ref.order_by_child("email").equal_to(email).limit_to_first(1).get() or {}
+        for uid in matches:
+            users_by_email_ref.child(index_key).set({"uid": uid, "email": email})
+            return uid
+        return None
+    except Exception as e:
+        logger.warning(f"[AUTH] Consulta por email indisponível ({e}); usando reconstrução do índice")
+
+    if not _users_by_email_backfilled:
+        entry = _backfill_users_by_email().get(index_key)
+        if entry and entry.get("email") == email:
+            return entry["uid"]
+    return None
+
+def _auth_cache_key(email):
+    """Chave do email no cache de autenticação (o X-User-Id pode vir com '_' no lugar de '.')."""
+    return email.replace('_', '.')
+
+def invalidate_user_identity(email=None):
+    """Remove uma identidade (ou todas, se email=None) do cache de autenticação."""
+    if email is None:
+        auth_identity_cache.clear()
+    else:
+        auth_identity_cache.delete(_auth_cache_key(email))
+
 def authenticate_user(req):
     email = req.headers.get('X-User-Id')
-    
-    snapshot = users_ref.get() or {}
-    for _, user in snapshot.items():
-        db_email = user.get("email") 
-        logger.info(f"X-User-Id {email}")
-        logger.info(f"email {db_email}")
-        if db_email == email.replace('_', '.'):
-            logger.info("Usuário tem conta")
-            return email, email.replace('.', '_')
-    logger.info("Usuário nao tem conta")
+    if not email:
+        logger.info("Usuário nao tem conta")
+        return None, None
+
+    lookup_email = _auth_cache_key(email)
+    # "" no cache representa um email verificado como sem conta
+    user_key = auth_identity_cache.get(lookup_email)
+    if user_key is None:
+        user_key = find_user_key_by_email(lookup_email) or ""
+        ttl = AUTH_CACHE_TTL if user_key else AUTH_NEGATIVE_CACHE_TTL
+        auth_identity_cache.set(lookup_email, user_key, ttl=ttl)
+
+    if user_key:
+        return email, email.replace('.', '_')
+    logger.info(f"Usuário nao tem conta: {email}")
     return None, None
 
 @app.route('/')
@@ -117,6 +414,32 @@ def index():
     return jsonify({"message": "#1 Video Manager API Media Cuts Studio funcionando!"})
 
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Contadores internos do processo (caches), só para quem tem METRICS_TOKEN."""
+    if not METRICS_TOKEN:
+        return jsonify({"message": "Métricas desativadas (METRICS_TOKEN não configurado)"}), 503
+    scheme, _, token = (request.headers.get('Authorization') or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return jsonify({"message": "Autenticação necessária"}), 401
+    if not hmac.compare_digest(token.strip().encode('utf-8'), METRICS_TOKEN.encode('utf-8')):
+        return jsonify({"message": "Token de métricas inválido"}), 403
+    return jsonify({
+        "pid": os.getpid(),
+        "path_cache": video_path_cache.stats(),
+        "auth_cache": auth_identity_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "project_events": project_events.stats(),
+        "metadata": metadata_mirror.stats() if metadata_mirror else None,
+        "downloads": download_metrics.snapshot(),
+        "blobs": blob_store.stats() if blob_store else None,
+        "trash": trash_bin.stats() if trash_bin else None,
+        "expiry": expiry_reaper.stats() if expiry_reaper else None,
+        "storage": dict(storage.stats(), migration=layout_migrator.stats() if layout_migrator else None,
+                        scan=storage_scanner.stats() if storage_scanner else None)
+    }), 200
+
+
 @app.route("/api/create-login", methods=["POST"])
 def create_login():
     data = request.get_json()
@@ -127,11 +450,9 @@ def create_login():
     if not email or not password:
         return jsonify({"error": "Email e senha são obrigatórios"}), 400
 
-    # 🔹 Busca todos os usuários e verifica se já existe o email
-    snapshot = users_ref.get() or {}
-    for _, user in snapshot.items():
-        if user.get("email") == email:
-            return jsonify({"error": "Usuário já existe"}), 400
+    # 🔹 Verifica no índice de emails se o usuário já existe
+    if find_user_key_by_email(email):
+        return jsonify({"error": "Usuário já existe"}), 400
 
     # 🔹 Cria novo usuário
     hashed_password = generate_password_hash(password)
@@ -141,6 +462,17 @@ def create_login():
         "last_seen": str(datetime.utcnow())
     })
 
+    # 🔹 Reserva o email no índice; se outra requisição chegou antes, desfaz a criação
+    index_entry = {"uid": new_user_ref.key, "email": email}
+    # entrada com outro email na chave só pode ser do formato antigo (a.b@x e a_b@x colidiam)
+    claimed = users_by_email_ref.child(_email_index_key(email)).transaction(
+        lambda current: current if isinstance(current, dict) and current.get("email") == email else index_entry
+    )
+    if not claimed or claimed.get("uid") != new_user_ref.key:
+        new_user_ref.delete()
+        return jsonify({"error": "Usuário já existe"}), 400
+    invalidate_user_identity(email)
+
     return jsonify({
         "message": "Usuário criado com sucesso",
         "user_id": new_user_ref.key
@@ -153,13 +485,9 @@ def login():
     email = data.get("email")
     password = data.get("password")
 
-    # 🔹 Busca todos os usuários e encontra pelo email
-    snapshot = users_ref.get() or {}
-    user_id, user_data = None, None
-    for uid, user in snapshot.items():
-        if user.get("email") == email:
-            user_id, user_data = uid, user
-            break
+    # 🔹 Resolve o usuário pelo índice de emails (leitura pontual)
+    user_id = find_user_key_by_email(email)
+    user_data = users_ref.child(user_id).get() if user_id else None
 
     if not user_data or not check_password_hash(user_data["password"], password):
         return jsonify({"error": "Credenciais inválidas"}), 401
@@ -182,12 +510,8 @@ def get_project_metadata(user_id, project_name):
         safe_project_name = secure_filename(project_name).replace("-", "").replace("....", "").replace("...", "").replace("..", "").replace(".", "").replace("... - ", "").replace('"????????"', '').replace("...__", "_")
         safe_project_name_filter = re.sub(r'[^0-9A-Za-z_-]', '', safe_project_name)
 
-        # Referência ao nó "metadata" do projeto
-        ref = db.reference(
-            f'projects/{authenticated_user_id_filter}/{safe_project_name_filter}/metadata',
-            app=app_instance
-        )
-        metadata_node = ref.get()
+        # Nó "metadata" do projeto
+        metadata_node = (_read_project(authenticated_user_id_filter, safe_project_name_filter) or {}).get('metadata')
 
         # Se não houver metadados, retorna lista vazia (200)
         if not metadata_node:
@@ -223,15 +547,32 @@ def get_project_metadata(user_id, project_name):
 
 @app.route('/api/projects', methods=['GET'])
 def get_user_projects():
+    """
+    Lista os projetos do usuário.
+    Sem parâmetros: array completo (formato legado).
+    Com limit/cursor/fields/videos: página ordenada por createdAt, {"projects": [...], "next_cursor": ...}
+      - limit: projetos por página (padrão 20, máximo PROJECTS_PAGE_MAX)
+      - cursor: next_cursor devolvido pela página anterior
+      - fields: campos do projeto separados por vírgula (ex.: name,status)
+      - videos: full (lista sem serverFilePath), summary (videoCount/lastUploadAt) ou none
+    Responde com ETag; If-None-Match com o carimbo atual devolve 304 sem ler o Firebase.
+    """
     authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
     if not authenticated_user_id:
         return jsonify({"message": "Não autorizado"}), 403
+
+    if any(param in request.args for param in ('limit', 'cursor', 'fields', 'videos')):
+        return _get_user_projects_page(authenticated_user_id_filter)
+
+    return _versioned_json(authenticated_user_id_filter, 'projects', 'projects',
+                           lambda: _build_user_projects(authenticated_user_id_filter))
+
+def _build_user_projects(user_id_filter):
     try:
-        ref = db.reference(f'projects/{authenticated_user_id_filter}', app=app_instance)
-        projects_data = ref.get()
+        projects_data = _read_user_projects(user_id_filter)
 
         if not projects_data:
-            return jsonify([]), 200
+            return [], 200
 
         # Formata os dados para o frontend, removendo `serverFilePath`
         formatted_projects = []
@@ -256,10 +597,46 @@ def get_user_projects():
                 "videos": videos_list
             })
         
-        return jsonify(formatted_projects), 200
+        return formatted_projects, 200
 
     except Exception as e:
-        return jsonify({"message": f"Erro ao buscar projetos: {str(e)}"}), 500
+        return {"message": f"Erro ao buscar projetos: {str(e)}"}, 500
+
+def _get_user_projects_page(user_id_filter):
+    try:
+        limit = int(request.args.get('limit', PROJECTS_PAGE_DEFAULT))
+    except ValueError:
+        return jsonify({"message": "limit inválido"}), 400
+    limit = max(1, min(limit, PROJECTS_PAGE_MAX))
+
+    videos_mode = request.args.get('videos', 'full')
+    if videos_mode not in ('full', 'summary', 'none'):
+        return jsonify({"message": "videos deve ser full, summary ou none"}), 400
+
+    fields = None
+    if request.args.get('fields'):
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in PROJECT_LIST_FIELDS]
+        if unknown:
+            return jsonify({"message": f"Campos desconhecidos: {', '.join(unknown)}"}), 400
+
+    cursor = None
+    if request.args.get('cursor'):
+        cursor = _decode_projects_cursor(request.args['cursor'])
+        if cursor is None:
+            return jsonify({"message": "cursor inválido"}), 400
+
+    def build():
+        try:
+            page, next_cursor = _fetch_projects_page(user_id_filter, limit, cursor)
+        except Exception as e:
+            logger.error(f"Erro ao paginar projetos: {e}", exc_info=True)
+            return {"message": f"Erro ao buscar projetos: {str(e)}"}, 500
+        projects = [_format_project_entry(key, details, fields, videos_mode) for key, details in page]
+        return {"projects": projects, "next_cursor": next_cursor}, 200
+
+    variant = ('page', limit, request.args.get('cursor'), tuple(fields or ()), videos_mode)
+    return _versioned_json(user_id_filter, 'projects', variant, build)
 
 @app.route('/api/projects/create', methods=['POST'])
 def create_project():
@@ -300,13 +677,11 @@ def create_project():
         return jsonify({"message": "Erro ao criar diretório do projeto no servidor"}), 500
 
     # Criação do nó no Firebase
-    project_ref = db.reference(f'projects/{user_key}/{safe_project_name_filter}', app=app_instance)
     try:
-        existing_project = project_ref.get()
-        if existing_project:
+        if project_exists(user_key, safe_project_name_filter):
             return jsonify({"message": "Projeto já existe"}), 400
 
-        project_ref.set({
+        _create_project_node(user_key, safe_project_name_filter, {
             "name": project_name,
             "model_ai": model_ai,
             "type_project": type_project,
@@ -363,10 +738,8 @@ def create_video_project():
         return jsonify({"message": "Erro ao criar diretório do projeto no servidor"}), 500
 
     # Criação do nó no Firebase
-    project_ref = db.reference(f'projects/{user_key}/{safe_project_name_filter}', app=app_instance)
     try:
-        existing_project = project_ref.get()
-        if existing_project:
+        if project_exists(user_key, safe_project_name_filter):
             return jsonify({"message": "Projeto já existe"}), 400
 
         tz_str = 'America/Sao_Paulo'
@@ -388,7 +761,7 @@ def create_video_project():
             "delete_after": (datetime.now(tz) + timedelta(days=3)).isoformat(),  # data 3 dias à frente
             "videos": {}
         }
-        project_ref.set(data_to_save)
+        _create_project_node(user_key, safe_project_name_filter, data_to_save)
 
         return jsonify({
             "message": "Projeto criado com sucesso",
@@ -406,14 +779,51 @@ def list_projects():
     if not authenticated_user_id:
         return jsonify({"message": "Autenticação necessária"}), 401
 
-    projects_ref = db.reference(f'projects/{authenticated_user_id_filter}', app=app_instance)
-    projects = projects_ref.get() or {}
+    # resumos por projeto (project_stats): não baixa os nós de vídeos
+    def build():
+        return [
+            {
+                "id": key,
+                "name": stats.get("name", key),
+                "fileCount": stats.get("fileCount", 0),
+                "totalBytes": stats.get("totalBytes", 0),
+                "lastUploadAt": stats.get("lastUploadAt"),
+            }
+            for key, stats in _load_project_stats(authenticated_user_id_filter)
+        ], 200
 
-    result = [
-        {"id": key, "name": data.get("name", key), "fileCount": len(data.get("videos", {}))}
-        for key, data in projects.items()
-    ]
-    return jsonify(result), 200
+    return _versioned_json(authenticated_user_id_filter, 'projects', 'list-projects', build)
+
+
+@app.route('/api/usage', methods=['GET'])
+def get_user_usage():
+    """Bytes e arquivos do usuário (total e por projeto) e os limites aplicados aos uploads."""
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
+
+    try:
+        if request.args.get('reconcile') == '1':
+            usage = _reconcile_user_usage(authenticated_user_id_filter)
+        else:
+            usage = _read_user_usage(authenticated_user_id_filter)
+        limits = _upload_limits(authenticated_user_id_filter)
+        quota = usage.get("quotaBytes") or USER_STORAGE_QUOTA or None
+        return jsonify({
+            "bytes": usage.get("bytes", 0),
+            "files": usage.get("files", 0),
+            "quotaBytes": quota,
+            "remainingBytes": limits["remaining"],
+            "maxFileSize": limits["file"],
+            "reconciledAt": usage.get("reconciledAt"),
+            "projects": [
+                {"id": key, "fileCount": stats.get("fileCount", 0), "totalBytes": stats.get("totalBytes", 0)}
+                for key, stats in _load_project_stats(authenticated_user_id_filter)
+            ],
+        }), 200
+    except Exception as e:
+        logger.error(f"[USAGE] Erro ao obter uso de {authenticated_user_id_filter}: {e}", exc_info=True)
+        return jsonify({"message": "Erro ao obter uso de armazenamento"}), 500
 
 
 @app.route('/api/settings', methods=['GET'])
@@ -423,21 +833,23 @@ def get_user_settings():
         authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
         if not authenticated_user_id:
             return jsonify({"message": "Autenticação necessária"}), 401
-        settings_ref = db.reference(f'user_settings/{authenticated_user_id_filter}', app=app_instance)
-        settings = settings_ref.get()
-        
-        if not settings:
-            return jsonify({'message': 'Configurações não encontradas'}), 404
-        
-        # Flatten
-        flat_settings = {
-            **settings.get('profile', {}),
-            **settings.get('notifications', {}),
-            **settings.get('privacy', {}),
-            **settings.get('preferences', {})
-        }
 
-        return jsonify(flat_settings), 200
+        def build():
+            settings = _read_user_settings(authenticated_user_id_filter)
+
+            if not settings:
+                return {'message': 'Configurações não encontradas'}, 404
+
+            # Flatten
+            flat_settings = {
+                **settings.get('profile', {}),
+                **settings.get('notifications', {}),
+                **settings.get('privacy', {}),
+                **settings.get('preferences', {})
+            }
+            return flat_settings, 200
+
+        return _versioned_json(authenticated_user_id_filter, 'settings', 'settings', build)
 
         
     except Exception as e:
@@ -486,8 +898,8 @@ def save_user_settings():
         }
         
         # Salvar no Firebase
-        settings_ref = db.reference(f'user_settings/{authenticated_user_id_filter}', app=app_instance)
-        settings_ref.set(settings_data)
+        _db_update({f'user_settings/{authenticated_user_id_filter}': settings_data})
+        _bump_user_version(authenticated_user_id_filter, 'settings')
         
         return jsonify({
             'message': 'Configurações salvas com sucesso',
@@ -594,11 +1006,11 @@ def upload_profile_image():
         
         # Atualizar configurações do usuário com nova imagem
 
-        settings_ref = db.reference(f'user_settings/{authenticated_user_id_filter}', app=app_instance)
-        settings_ref.update({
-            'profile/avatar': image_url,
-            'profile/avatarUpdatedAt': datetime.now().isoformat()
+        _db_update({
+            f'user_settings/{authenticated_user_id_filter}/profile/avatar': image_url,
+            f'user_settings/{authenticated_user_id_filter}/profile/avatarUpdatedAt': datetime.now().isoformat()
         })
+        _bump_user_version(authenticated_user_id_filter, 'settings')
         
         return jsonify({
             'message': 'Imagem do perfil atualizada com sucesso',
@@ -616,10 +1028,8 @@ def delete_profile_image():
         authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
         if not authenticated_user_id:
             return jsonify({"message": "Autenticação necessária"}), 401
-        settings_ref = db.reference(f'user_settings/{authenticated_user_id_filter}', app=app_instance)
-        
         # Obter URL da imagem atual
-        current_settings = settings_ref.get()
+        current_settings = _read_user_settings(authenticated_user_id_filter)
         if current_settings and 'profile' in current_settings:
             current_avatar = current_settings['profile'].get('avatar')
             
@@ -630,10 +1040,11 @@ def delete_profile_image():
                     os.remove(file_path)
         
         # Remover URL do avatar das configurações
-        settings_ref.update({
-            'profile/avatar': '',
-            'profile/avatarDeletedAt': datetime.now().isoformat()
+        _db_update({
+            f'user_settings/{authenticated_user_id_filter}/profile/avatar': '',
+            f'user_settings/{authenticated_user_id_filter}/profile/avatarDeletedAt': datetime.now().isoformat()
         })
+        _bump_user_version(authenticated_user_id_filter, 'settings')
         
         return jsonify({'message': 'Imagem do perfil removida com sucesso'}), 200
         
@@ -649,8 +1060,7 @@ def export_user_settings():
         if not authenticated_user_id:
             return jsonify({"message": "Autenticação necessária"}), 401
         # Obter configurações
-        settings_ref = db.reference(f'user_settings/{authenticated_user_id_filter}', app=app_instance)
-        settings = settings_ref.get()
+        settings = _read_user_settings(authenticated_user_id_filter)
         
         # Obter dados do usuário
         user_ref = db.reference(f'users/{authenticated_user_id_filter}', app=app_instance)
@@ -692,8 +1102,8 @@ def import_user_settings():
         })
         
         # Salvar configurações importadas
-        settings_ref = db.reference(f'user_settings/{authenticated_user_id_filter}', app=app_instance)
-        settings_ref.set(settings_data)
+        _db_update({f'user_settings/{authenticated_user_id_filter}': settings_data})
+        _bump_user_version(authenticated_user_id_filter, 'settings')
         
         return jsonify({
             'message': 'Configurações importadas com sucesso',
@@ -744,8 +1154,8 @@ def reset_user_settings():
         }
         
         # Resetar configurações
-        settings_ref = db.reference(f'user_settings/{authenticated_user_id_filter}', app=app_instance)
-        settings_ref.set(default_settings)
+        _db_update({f'user_settings/{authenticated_user_id_filter}': default_settings})
+        _bump_user_version(authenticated_user_id_filter, 'settings')
         
         return jsonify({
             'message': 'Configurações resetadas com sucesso',
@@ -767,8 +1177,7 @@ def get_settings_activity_log():
         logs = []
         
         # Log de configurações
-        settings_ref = db.reference(f'user_settings/{authenticated_user_id_filter}', app=app_instance)
-        settings = settings_ref.get()
+        settings = _read_user_settings(authenticated_user_id_filter)
         
         if settings:
             if 'updatedAt' in settings:
@@ -830,54 +1239,129 @@ def upload_files():
     content_type = request.content_type or ""
     is_multipart = content_type.startswith("multipart/form-data")
 
-    # helper para sanitizar nome do projeto
-    def sanitize_project_name(raw):
-        safe_project_name = secure_filename(raw or "")
-        safe_project_name = safe_project_name.replace("-", "").replace("....", "").replace("...", "").replace("..", "").replace(".", "").replace("... - ", "").replace('"????????"', '').replace("...__", "_")
-        return re.sub(r'[^0-9A-Za-z_-]', '', safe_project_name)
+    # limites do usuário (tamanho de arquivo e cota) antes de ler o corpo
+    limits = _upload_limits(authenticated_user_id_filter)
+    if request.content_length is not None:
+        limit_error = _upload_limit_error(
+            limits, request.content_length - (MULTIPART_OVERHEAD if is_multipart else 0))
+        if limit_error:
+            return jsonify({"message": limit_error}), 413
 
     # --- modo multipart/form-data (com form + file) ---
+    # O corpo é lido em streaming (sem request.files): a parte do arquivo é gravada direto no
+    # destino final. Se o campo metadata vier antes do arquivo (recomendado), o destino já é a
+    # pasta do projeto; senão o arquivo vai para {usuario}/.incoming e é movido no final.
     if is_multipart:
-        # validar presença de arquivo e metadata
-        if 'file' not in request.files:
+        boundary = request.mimetype_params.get("boundary")
+        if not boundary:
+            return jsonify({"message": "Corpo multipart sem boundary"}), 400
+
+        # volume do arquivo escolhido pela política de posicionamento; .incoming fica no mesmo volume
+        volume = storage.choose_volume()
+        incoming_dir = storage.incoming_dir(authenticated_user_id_filter, volume)
+        video_id = str(uuid.uuid4())
+        upload = {}
+
+        def open_upload_target(field_name, filename, fields):
+            if field_name != 'file':
+                raise MultipartError(f"Campo de arquivo inesperado: {field_name}")
+            if 'file' in upload:
+                raise MultipartError("Apenas um arquivo por requisição")
+            if not filename:
+                raise MultipartError("Nome de arquivo inválido")
+            if not allowed_file(filename):
+                raise MultipartError("Tipo de arquivo não permitido")
+
+            upload['filename'] = secure_filename(filename)
+            basename = f"{video_id}_{upload['filename']}"
+            upload['file'] = os.path.join(incoming_dir, basename)
+            if 'metadata' in fields:
+                try:
+                    early_metadata = json.loads(fields['metadata'])
+                    early_project = early_metadata.get('projectName')
+                except Exception:
+                    early_metadata, early_project = None, None
+                # type_project inválido recusado antes de aceitar o corpo do arquivo
+                if isinstance(early_metadata, dict) and not _valid_type_project(early_metadata):
+                    raise MultipartError("type_project inválido")
+                if early_project:
+                    upload['file'] = storage.item_path(authenticated_user_id_filter, sanitize_project_name(early_project),
+                                                       video_id, basename, volume)
+            try:
+                os.makedirs(os.path.dirname(upload['file']), exist_ok=True)
+            except OSError:
+                logger.exception("Erro ao criar diretório")
+                raise MultipartError("Erro no servidor ao preparar armazenamento", 500)
+
+            # SHA-256 calculado enquanto os bytes vão para o disco (deduplicação)
+            upload['writer'] = HashingWriter(open(upload['file'], "wb"))
+            return upload['writer']
+
+        def drop_incoming_dir():
+            # .incoming vazio não pode impedir a limpeza da pasta do usuário
+            try:
+                os.rmdir(incoming_dir)
+            except OSError:
+                pass
+
+        def discard_upload():
+            try:
+                if upload.get('file') and os.path.exists(upload['file']):
+                    os.remove(upload['file'])
+            except Exception:
+                pass
+            drop_incoming_dir()
+
+        try:
+            fields, _ = parse_multipart_stream(request.stream, boundary, open_upload_target,
+                                               max_file_size=_upload_stream_limit(limits), chunk_size=CHUNK_SIZE)
+        except UploadTooLarge as e:
+            discard_upload()
+            return jsonify({"message": _upload_limit_error(limits, e.max_size + 1)}), 413
+        except MultipartError as e:
+            discard_upload()
+            logger.warning(f"[UPLOAD] Multipart recusado: {e.message}")
+            return jsonify({"message": e.message}), e.status
+        except Exception:
+            logger.exception("Erro ao salvar arquivo (multipart)")
+            discard_upload()
+            return jsonify({"message": "Erro ao salvar arquivo de vídeo no servidor"}), 500
+
+        if 'file' not in upload:
             return jsonify({"message": "Nenhum arquivo de vídeo enviado"}), 400
-        if 'metadata' not in request.form:
+        if 'metadata' not in fields:
+            discard_upload()
             return jsonify({"message": "Nenhum metadado enviado"}), 400
-
-        file = request.files['file']
         try:
-            metadata = json.loads(request.form['metadata'])
+            metadata = json.loads(fields['metadata'])
         except Exception:
+            discard_upload()
             return jsonify({"message": "Metadados inválidos (não é JSON válido)"}), 400
 
-        if file.filename == '':
-            return jsonify({"message": "Nome de arquivo inválido"}), 400
-        if not allowed_file(file.filename):
-            return jsonify({"message": "Tipo de arquivo não permitido"}), 400
-
         project_name = metadata.get('projectName')
         if not project_name:
+            discard_upload()
             return jsonify({"message": "Nome do projeto é obrigatório nos metadados"}), 400
+        if not _valid_type_project(metadata):
+            discard_upload()
+            return jsonify({"message": "type_project inválido"}), 400
 
         safe_project_name_filter = sanitize_project_name(project_name)
-        user_dir = os.path.join(VIDEO_BASE_DIR, authenticated_user_id_filter)
-        project_dir = os.path.join(user_dir, safe_project_name_filter)
-        try:
-            os.makedirs(project_dir, exist_ok=True)
-        except OSError as e:
-            logger.exception("Erro ao criar diretório")
-            return jsonify({"message": "Erro no servidor ao preparar armazenamento"}), 500
-
-        video_id = str(uuid.uuid4())
-        original_filename = secure_filename(file.filename)
-        filename_on_disk = f"{video_id}_{original_filename}"
-        file_path = os.path.join(project_dir, filename_on_disk)
+        original_filename = upload['filename']
+        file_path = storage.item_path(authenticated_user_id_filter, safe_project_name_filter, video_id,
+                                      f"{video_id}_{original_filename}", volume)
+        content_hash = upload['writer'].hexdigest()
 
-        try:
-            file.save(file_path)  # mesmo comportamento de antes
-        except Exception as e:
-            logger.exception("Erro ao salvar arquivo (multipart)")
-            return jsonify({"message": "Erro ao salvar arquivo de vídeo no servidor"}), 500
+        if upload['file'] != file_path:
+            # metadata chegou depois do arquivo: move de .incoming para a pasta do projeto (mesmo volume)
+            try:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                os.replace(upload['file'], file_path)
+            except OSError:
+                logger.exception("Erro ao mover arquivo enviado para o projeto")
+                discard_upload()
+                return jsonify({"message": "Erro no servidor ao preparar armazenamento"}), 500
+            drop_incoming_dir()
 
     # --- modo stream (raw binary) ---
     else:
@@ -899,32 +1383,41 @@ def upload_files():
         project_name = metadata.get('projectName')
         if not project_name:
             return jsonify({"message": "Nome do projeto é obrigatório nos metadados"}), 400
+        if not _valid_type_project(metadata):
+            return jsonify({"message": "type_project inválido"}), 400
 
         if not allowed_file(filename_header):
             return jsonify({"message": "Tipo de arquivo não permitido"}), 400
 
         safe_project_name_filter = sanitize_project_name(project_name)
-        user_dir = os.path.join(VIDEO_BASE_DIR, authenticated_user_id_filter)
-        project_dir = os.path.join(user_dir, safe_project_name_filter)
+        video_id = str(uuid.uuid4())
+        original_filename = secure_filename(filename_header)
+        filename_on_disk = f"{video_id}_{original_filename}"
+        file_path = storage.item_path(authenticated_user_id_filter, safe_project_name_filter, video_id,
+                                      filename_on_disk, storage.choose_volume())
         try:
-            os.makedirs(project_dir, exist_ok=True)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
         except OSError as e:
             logger.exception("Erro ao criar diretório (stream)")
             return jsonify({"message": "Erro no servidor ao preparar armazenamento"}), 500
 
-        video_id = str(uuid.uuid4())
-        original_filename = secure_filename(filename_header)
-        filename_on_disk = f"{video_id}_{original_filename}"
-        file_path = os.path.join(project_dir, filename_on_disk)
-
-        # grava o body em chunks (streaming)
+        # grava o body em chunks (streaming), calculando o SHA-256 no caminho
         try:
-            with open(file_path, "wb") as f:
+            with HashingWriter(open(file_path, "wb")) as f:
                 while True:
                     chunk = request.stream.read(CHUNK_SIZE)
                     if not chunk:
                         break
+                    if f.size + len(chunk) > _upload_stream_limit(limits):
+                        raise UploadTooLarge(_upload_stream_limit(limits))
                     f.write(chunk)
+            content_hash = f.hexdigest()
+        except UploadTooLarge as e:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            return jsonify({"message": _upload_limit_error(limits, e.max_size + 1)}), 413
         except Exception as e:
             logger.exception("Erro ao salvar arquivo (stream)")
             # tenta remover arquivo incompleto
@@ -937,83 +1430,437 @@ def upload_files():
 
     # --- A partir daqui o arquivo está salvo em file_path; vamos montar os metadados e atualizar o Firebase ---
     try:
-        type_project = metadata.get('type_project', 'video')
-        if type_project == "video":
-            update_data = {
-                "filename": original_filename,
-                "serverFilePath": os.path.relpath(file_path, VIDEO_BASE_DIR),
-                "uploadedAt": datetime.now().isoformat(),
-                "status": "UPLOADED",
-                "progress_percent": "100",
-            }
-            update_data.update({
-                "type_project": "video",
-                "title": metadata.get('title', original_filename),
-                "descricao": metadata.get('description', ''),
-                "hashtags": metadata.get('hashtags', []),
-                "minutagemdeInicio": metadata.get('minutagemdeInicio', '00:00'),
-                "minutagemdeFim": metadata.get('minutagemdeFim', 'Fim'),
-                "urltumbnail": metadata.get('urltumbnail', ''),
-                "justificativa": metadata.get('justificativa', ''),
-                "sentimento_principal": metadata.get('sentimento_principal', ''),
-                "potencial_de_viralizacao": metadata.get('potencial_de_viralizacao', ''),
-            })
-            if isinstance(update_data["hashtags"], str):
-                update_data["hashtags"] = [tag.strip() for tag in update_data["hashtags"].split(',') if tag.strip()]
+        payload, status_code = _commit_uploaded_file(authenticated_user_id_filter, project_name, safe_project_name_filter,
+                                                     video_id, original_filename, file_path, metadata,
+                                                     content_hash=content_hash)
+        return jsonify(payload), status_code
+    except Exception as e:
+        logger.exception("Erro ao atualizar metadados no Firebase")
+        # cleanup em caso de erro
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except Exception:
+            pass
+        return jsonify({"message": f"Erro interno do servidor: {str(e)}"}), 500
 
-            item_ref_path = f'projects/{authenticated_user_id_filter}/{safe_project_name_filter}/videos/{video_id}'
-            item_ref = db.reference(item_ref_path, app=app_instance)
-            item_ref.update(update_data)
 
-            return jsonify({
-                "message": f"{'Vídeo' if type_project == 'video' else 'Arquivo'} e metadados atualizados com sucesso!",
-                "item_id": video_id,
-                "video_id": video_id,
-                "filename": original_filename,
-                "project_name": project_name,
-                "type_project": type_project
-            }), 200
 
-        elif type_project == "files":
-            file_size = os.path.getsize(file_path)
-            video_metadata_for_firebase = {
-                "type_project": "files",
-                "id": video_id,
-                "filename": original_filename,
-                "serverFilePath": os.path.relpath(file_path, VIDEO_BASE_DIR),
-                "uploadedAt": datetime.now().isoformat(),
-                "size": file_size,
-                "status": "ready"
-            }
+@app.route('/api/upload-video/preflight', methods=['POST'])
+def upload_preflight():
+    """
+    Handshake antes do upload. Corpo JSON: {"hash": sha256_hex, "size": int, "filename": str, "metadata": {...}}
+    Se o usuário já tem esse conteúdo, o item é criado por referência ao blob existente (sem
+    transferir o corpo) e a resposta é a mesma do /api/upload-video com "exists": true.
+    Senão responde {"exists": false} e o cliente envia o arquivo normalmente.
+    """
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
 
-            project_ref = db.reference(f'projects/{authenticated_user_id_filter}/{safe_project_name_filter}', app=app_instance)
-            existing_project = project_ref.get()
-            if not existing_project:
-                project_ref.set({
-                    "name": project_name,
-                    "createdAt": datetime.now().isoformat(),
-                    "videos": {}
-                })
-            video_ref = project_ref.child(f'videos/{video_id}')
-            video_ref.set(video_metadata_for_firebase)
+    data = request.get_json(silent=True) or {}
+    content_hash = str(data.get('hash') or '').lower()
+    filename = data.get('filename')
+    metadata = data.get('metadata')
+    if not re.fullmatch(r'[0-9a-f]{64}', content_hash):
+        return jsonify({"message": "hash deve ser o SHA-256 do conteúdo em hexadecimal"}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({"message": "Tamanho do arquivo (size) é obrigatório"}), 400
+    if not filename or not secure_filename(filename):
+        return jsonify({"message": "Nome de arquivo inválido"}), 400
+    if not allowed_file(filename):
+        return jsonify({"message": "Tipo de arquivo não permitido"}), 400
+    if not isinstance(metadata, dict):
+        return jsonify({"message": "Nenhum metadado enviado"}), 400
+    project_name = metadata.get('projectName')
+    if not project_name or not sanitize_project_name(project_name):
+        return jsonify({"message": "Nome do projeto é obrigatório nos metadados"}), 400
+    if not _valid_type_project(metadata):
+        return jsonify({"message": "type_project inválido"}), 400
+
+    limit_error = _upload_limit_error(_upload_limits(authenticated_user_id_filter), size)
+    if limit_error:
+        return jsonify({"message": limit_error}), 413
+
+    # só conteúdo que o próprio usuário já enviou (não revela arquivos de outros usuários)
+    if not blob_store or blob_store.size_for_user(authenticated_user_id_filter, content_hash) != size:
+        return jsonify({"exists": False}), 200
+
+    safe_project_name_filter = sanitize_project_name(project_name)
+    video_id = str(uuid.uuid4())
+    original_filename = secure_filename(filename)
+    # hardlink do blob: sempre no volume principal, onde fica .blobs
+    file_path = storage.item_path(authenticated_user_id_filter, safe_project_name_filter, video_id,
+                                  f"{video_id}_{original_filename}")
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    except OSError:
+        logger.exception("Erro ao criar diretório (preflight)")
+        return jsonify({"message": "Erro no servidor ao preparar armazenamento"}), 500
 
-            return jsonify({
-                "message": "Vídeo e metadados enviados com sucesso!",
-                "video_id": video_id,
-                "filename": original_filename,
-                "project_name": project_name
-            }), 201
+    if not blob_store.link(content_hash, file_path):
+        return jsonify({"exists": False}), 200
 
+    try:
+        payload, status_code = _commit_uploaded_file(authenticated_user_id_filter, project_name, safe_project_name_filter,
+                                                     video_id, original_filename, file_path, metadata,
+                                                     content_hash=content_hash)
     except Exception as e:
-        logger.exception("Erro ao atualizar metadados no Firebase")
-        # cleanup em caso de erro
+        logger.exception("Erro ao atualizar metadados no Firebase (preflight)")
         try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception:
+            os.remove(file_path)
+        except OSError:
             pass
         return jsonify({"message": f"Erro interno do servidor: {str(e)}"}), 500
 
+    logger.info(f"[PREFLIGHT] Conteúdo {content_hash[:12]} já existia; {video_id} criado sem transferência")
+    payload["exists"] = True
+    return jsonify(payload), status_code
+
+
+@app.route('/api/upload-video/batch', methods=['POST'])
+def upload_files_batch():
+    """
+    Vários arquivos de um mesmo projeto numa única requisição multipart: o campo "manifest"
+    (JSON, antes dos arquivos) traz os metadados comuns do upload simples e, opcionalmente,
+    "items": [{...}] com metadados por arquivo, na ordem das partes. Cada parte de arquivo é
+    gravada em streaming direto na pasta do projeto e os metadados de todos os itens entram no
+    Firebase numa única atualização multi-caminho. A resposta traz o resultado de cada arquivo.
+    """
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
+
+    if not (request.content_type or "").startswith("multipart/form-data"):
+        return jsonify({"message": "Envie os arquivos como multipart/form-data"}), 400
+    boundary = request.mimetype_params.get("boundary")
+    if not boundary:
+        return jsonify({"message": "Corpo multipart sem boundary"}), 400
+    if request.content_length is not None and request.content_length > MAX_BATCH_UPLOAD_SIZE:
+        return jsonify({"message": f"Lote excede o tamanho máximo permitido ({MAX_BATCH_UPLOAD_SIZE} bytes)"}), 413
+    limits = _upload_limits(authenticated_user_id_filter)
+    if request.content_length is not None and limits["remaining"] is not None \
+            and request.content_length - MULTIPART_OVERHEAD > limits["remaining"]:
+        return jsonify({"message": f"Cota de armazenamento excedida ({limits['remaining']} bytes disponíveis)"}), 413
+
+    batch = {"results": [], "saved": []}
+    # o lote inteiro vai para o mesmo volume
+    volume = storage.choose_volume()
+
+    def open_batch_target(field_name, filename, fields):
+        if 'project' not in batch:
+            if 'manifest' not in fields:
+                raise MultipartError("O campo manifest deve vir antes dos arquivos")
+            try:
+                manifest = json.loads(fields['manifest'])
+            except Exception:
+                raise MultipartError("Manifesto inválido (não é JSON válido)")
+            if not isinstance(manifest, dict) or not manifest.get('projectName'):
+                raise MultipartError("Nome do projeto é obrigatório no manifesto")
+            if not _valid_type_project(manifest):
+                raise MultipartError("type_project inválido")
+            items = manifest.get('items') or []
+            if not isinstance(items, list):
+                raise MultipartError("items do manifesto deve ser uma lista")
+            batch.update(manifest=manifest, items=items, project=sanitize_project_name(manifest['projectName']))
+
+        index = len(batch["results"])
+        result = {"index": index, "field": field_name, "filename": filename}
+        batch["results"].append(result)
+        if index >= BATCH_UPLOAD_MAX_FILES:
+            raise MultipartError(f"Lote excede {BATCH_UPLOAD_MAX_FILES} arquivos", 413)
+        reason = None
+        if not filename or not secure_filename(filename):
+            reason = "Nome de arquivo inválido"
+        elif not allowed_file(filename):
+            reason = "Tipo de arquivo não permitido"
+        if reason:
+            # parte recusada: os bytes são lidos e descartados, o resto do lote segue
+            result.update(status="rejected", message=reason)
+            return open(os.devnull, "wb")
+
+        video_id = str(uuid.uuid4())
+        original_filename = secure_filename(filename)
+        file_path = storage.item_path(authenticated_user_id_filter, batch["project"], video_id,
+                                      f"{video_id}_{original_filename}", volume)
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        except OSError:
+            logger.exception("Erro ao criar diretório (lote)")
+            raise MultipartError("Erro no servidor ao preparar armazenamento", 500)
+        writer = HashingWriter(open(file_path, "wb"))
+        batch["saved"].append({"result": result, "video_id": video_id, "filename": original_filename,
+                               "file": file_path, "writer": writer})
+        return writer
+
+    def discard_saved():
+        for saved in batch["saved"]:
+            try:
+                os.remove(saved["file"])
+            except OSError:
+                pass
+
+    batch_limit = MAX_BATCH_UPLOAD_SIZE if limits["remaining"] is None else min(MAX_BATCH_UPLOAD_SIZE, limits["remaining"])
+    try:
+        parse_multipart_stream(request.stream, boundary, open_batch_target,
+                               max_file_size=limits["file"], chunk_size=CHUNK_SIZE, max_total_size=batch_limit)
+    except UploadTooLarge as e:
+        discard_saved()
+        if e.max_size == limits["file"]:
+            message = _upload_limit_error(limits, e.max_size + 1)
+        elif e.max_size == MAX_BATCH_UPLOAD_SIZE:
+            message = f"Lote excede o tamanho máximo permitido ({MAX_BATCH_UPLOAD_SIZE} bytes)"
+        else:
+            message = f"Cota de armazenamento excedida ({limits['remaining']} bytes disponíveis)"
+        logger.warning(f"[BATCH] Multipart recusado: {message}")
+        return jsonify({"message": message}), 413
+    except MultipartError as e:
+        discard_saved()
+        logger.warning(f"[BATCH] Multipart recusado: {e.message}")
+        return jsonify({"message": e.message}), e.status
+    except Exception:
+        logger.exception("Erro ao salvar arquivos do lote")
+        discard_saved()
+        return jsonify({"message": "Erro ao salvar arquivos no servidor"}), 500
+
+    if 'manifest' not in batch:
+        return jsonify({"message": "Nenhum arquivo enviado"}), 400
+
+    manifest = batch["manifest"]
+    project_name = manifest['projectName']
+    safe_project_name_filter = sanitize_project_name(project_name)
+    type_project = manifest.get('type_project', 'video')
+    common_metadata = {k: v for k, v in manifest.items() if k != 'items'}
+
+    videos = {}
+    adopted = []
+    try:
+        for saved in batch["saved"]:
+            item_metadata = batch["items"][saved["result"]["index"]] if saved["result"]["index"] < len(batch["items"]) else {}
+            metadata = {**common_metadata, **(item_metadata if isinstance(item_metadata, dict) else {}),
+                        "type_project": type_project}
+            content_hash = _adopt_blob(authenticated_user_id_filter, safe_project_name_filter, saved["video_id"],
+                                       saved["file"], saved["writer"].hexdigest())
+            if content_hash:
+                adopted.append(saved["video_id"])
+            videos[saved["video_id"]] = _uploaded_item_data(saved["video_id"], saved["filename"], saved["file"],
+                                                            metadata, content_hash)
+        project_data = None
+        if videos and type_project == "files" and not project_exists(authenticated_user_id_filter, safe_project_name_filter):
+            project_data = {"name": project_name, "createdAt": datetime.now().isoformat()}
+        if videos:
+            _register_videos(authenticated_user_id_filter, safe_project_name_filter, videos, project_data=project_data)
+    except Exception as e:
+        logger.exception("Erro ao atualizar metadados do lote no Firebase")
+        if adopted:
+            _release_blobs(authenticated_user_id_filter, safe_project_name_filter, adopted)
+        discard_saved()
+        return jsonify({"message": f"Erro interno do servidor: {str(e)}"}), 500
+
+    for saved in batch["saved"]:
+        saved["result"].update(status="created", video_id=saved["video_id"], filename=saved["filename"],
+                               size=videos[saved["video_id"]].get("size"))
+    created = len(batch["saved"])
+    rejected = len(batch["results"]) - created
+    logger.info(f"[BATCH] {created} arquivo(s) gravado(s) em {authenticated_user_id_filter}/{safe_project_name_filter}"
+                f" ({rejected} recusado(s))")
+    payload = {
+        "project_name": project_name,
+        "type_project": type_project,
+        "created": created,
+        "rejected": rejected,
+        "results": batch["results"],
+    }
+    if not created:
+        return jsonify(payload), 400
+    return jsonify(payload), 201 if not rejected else 207
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    """
+    Cria uma sessão de upload retomável.
+    Corpo JSON: {"filename": str, "size": int, "metadata": {... mesmos campos do /api/upload-video},
+                 "part_size": int (opcional, para envio em partes paralelas)}
+    """
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
+
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename')
+    metadata = data.get('metadata')
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({"message": "Tamanho do arquivo (size) é obrigatório"}), 400
+    try:
+        part_size = int(data.get('part_size') or DEFAULT_PART_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({"message": "part_size inválido"}), 400
+    if not UPLOAD_MIN_PART_SIZE <= part_size <= UPLOAD_MAX_PART_SIZE:
+        return jsonify({"message": f"part_size deve estar entre {UPLOAD_MIN_PART_SIZE} e {UPLOAD_MAX_PART_SIZE} bytes"}), 400
+
+    if not filename or not secure_filename(filename):
+        return jsonify({"message": "Nome de arquivo inválido"}), 400
+    if not allowed_file(filename):
+        return jsonify({"message": "Tipo de arquivo não permitido"}), 400
+    if not isinstance(metadata, dict):
+        return jsonify({"message": "Nenhum metadado enviado"}), 400
+    if not metadata.get('projectName') or not sanitize_project_name(metadata.get('projectName')):
+        return jsonify({"message": "Nome do projeto é obrigatório nos metadados"}), 400
+    if not _valid_type_project(metadata):
+        return jsonify({"message": "type_project inválido"}), 400
+    if size < 0:
+        return jsonify({"message": "Tamanho do arquivo inválido"}), 400
+    limit_error = _upload_limit_error(_upload_limits(authenticated_user_id_filter), size)
+    if limit_error:
+        return jsonify({"message": limit_error}), 413
+
+    try:
+        session_data = upload_sessions.create(authenticated_user_id_filter, secure_filename(filename), size, metadata,
+                                              part_size=part_size)
+    except OSError as e:
+        logger.exception("[UPLOAD-SESSION] Erro ao criar sessão")
+        return jsonify({"message": "Erro no servidor ao preparar armazenamento"}), 507 if e.errno == errno.ENOSPC else 500
+
+    logger.info(f"[UPLOAD-SESSION] Sessão {session_data['id']} criada ({size} bytes) para {authenticated_user_id_filter}")
+    response = jsonify(_upload_session_payload(session_data))
+    response.headers['Location'] = url_for('upload_session_status', upload_id=session_data['id'])
+    response.headers['Upload-Offset'] = '0'
+    return response, 201
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_session_status(upload_id):
+    """Estado da sessão (HEAD devolve só os cabeçalhos Upload-Offset/Upload-Length)."""
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
+    try:
+        session_data = upload_sessions.get(upload_id, authenticated_user_id_filter)
+    except UploadSessionError as e:
+        return jsonify({"message": e.message}), e.status
+    return _upload_session_response(session_data)
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+def upload_session_write(upload_id):
+    """
+    Envia um bloco do arquivo. O offset vem em Upload-Offset ou em Content-Range
+    (bytes inicio-fim/total); blocos podem chegar fora de ordem e ser reenviados.
+    """
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
+
+    offset = request.headers.get('Upload-Offset')
+    content_range = request.headers.get('Content-Range')
+    if offset is None and content_range:
+        match = re.match(r'^bytes (\d+)-(\d+)/(\d+|\*)$', content_range.strip())
+        if not match:
+            return jsonify({"message": "Content-Range inválido"}), 400
+        offset = match.group(1)
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return jsonify({"message": "Cabeçalho Upload-Offset ausente ou inválido"}), 400
+
+    try:
+        session_data = upload_sessions.write(upload_id, authenticated_user_id_filter, offset, request.stream,
+                                             length=request.content_length, chunk_size=CHUNK_SIZE)
+    except UploadSessionError as e:
+        return jsonify({"message": e.message}), e.status
+    except OSError:
+        logger.exception(f"[UPLOAD-SESSION] Erro ao gravar bloco da sessão {upload_id}")
+        return jsonify({"message": "Erro ao salvar arquivo de vídeo no servidor"}), 500
+    return _upload_session_response(session_data)
+
+
+@app.route('/api/uploads/<upload_id>/parts/<int:part_number>', methods=['PUT'])
+def upload_session_part(upload_id, part_number):
+    """
+    Envia a parte part_number (0, 1, ...) de part_size bytes; as partes podem ser enviadas em
+    paralelo e reenviadas. X-Part-Sha256 (hex) é verificado antes de a parte ser aceita.
+    """
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
+
+    try:
+        session_data, digest = upload_sessions.write_part(upload_id, authenticated_user_id_filter, part_number,
+                                                          request.stream,
+                                                          sha256=request.headers.get('X-Part-Sha256'),
+                                                          chunk_size=CHUNK_SIZE)
+    except UploadSessionError as e:
+        body = {"message": e.message}
+        body.update(e.extra)
+        return jsonify(body), e.status
+    except OSError:
+        logger.exception(f"[UPLOAD-SESSION] Erro ao gravar parte {part_number} da sessão {upload_id}")
+        return jsonify({"message": "Erro ao salvar arquivo de vídeo no servidor"}), 500
+
+    response = _upload_session_response(session_data)
+    response.headers['X-Part-Sha256'] = digest
+    return response
+
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """Finaliza a sessão: move o arquivo para o projeto e grava os metadados (mesma resposta do /api/upload-video)."""
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
+
+    def finalize(session_data, part_path):
+        metadata = session_data['metadata']
+        project_name = metadata.get('projectName')
+        safe_project_name_filter = sanitize_project_name(project_name)
+        video_id = str(uuid.uuid4())
+        original_filename = session_data['filename']
+        # rename a partir de .uploads: o destino fica no volume principal
+        file_path = storage.item_path(authenticated_user_id_filter, safe_project_name_filter, video_id,
+                                      f"{video_id}_{original_filename}")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # blocos chegaram fora de ordem: o hash é calculado numa leitura sequencial do arquivo montado
+        content_hash = hash_file(part_path, CHUNK_SIZE) if blob_store else None
+        os.replace(part_path, file_path)
+        try:
+            payload, status_code = _commit_uploaded_file(authenticated_user_id_filter, project_name,
+                                                         safe_project_name_filter, video_id, original_filename,
+                                                         file_path, metadata, content_hash=content_hash)
+        except Exception:
+            # devolve o arquivo à sessão para que o complete possa ser repetido
+            os.replace(file_path, part_path)
+            raise
+        return {"payload": payload, "status": status_code}
+
+    try:
+        result = upload_sessions.complete(upload_id, authenticated_user_id_filter, finalize)
+    except UploadSessionError as e:
+        body = {"message": e.message}
+        body.update(e.extra)
+        return jsonify(body), e.status
+    except Exception as e:
+        logger.exception(f"[UPLOAD-SESSION] Erro ao finalizar sessão {upload_id}")
+        return jsonify({"message": f"Erro interno do servidor: {str(e)}"}), 500
+
+    logger.info(f"[UPLOAD-SESSION] Sessão {upload_id} finalizada")
+    return jsonify(result['payload']), result['status']
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload_session(upload_id):
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
+    try:
+        upload_sessions.abort(upload_id, authenticated_user_id_filter)
+    except UploadSessionError as e:
+        return jsonify({"message": e.message}), e.status
+    return jsonify({"message": "Sessão de upload cancelada", "upload_id": upload_id}), 200
 
 
 @app.route('/api/projects/<project_name>/videos/<video_id>/download', methods=['GET'])
@@ -1032,54 +1879,30 @@ def download_video_optimized(project_name, video_id):
     project_name_safe = secure_filename(project_name).replace("-", "").replace("....", "").replace("...", "").replace("..", "").replace(".", "").replace("... - ", "").replace('"????????"', '').replace("...__", "_")
     logger.info(f"[DOWNLOAD] for {project_name_safe}")
 
-    cache_key = f"{authenticated_user_id_filter}_{project_name_safe}_{video_id}"
-    now = time.time()
-
-    # 1) Tenta cache em memória
-    if cache_key in video_path_cache:
-        cached_data, timestamp = video_path_cache[cache_key]
-        if now - timestamp < CACHE_TTL:
-            video_found_path = cached_data['path']
-            video_filename = cached_data['filename']
-            logger.info(f"[DOWNLOAD] Cache HIT para vídeo {video_id} no projeto {project_name_safe}")
-        else:
-            del video_path_cache[cache_key]
-            video_found_path = None
-            video_filename = None
-    else:
-        video_found_path = None
-        video_filename = None
-
-    # 2) Se não tem no cache, busca diretamente no Firebase sem varredura
-    if not video_found_path:
-        video_found_path, video_filename = find_video_optimized_direct(authenticated_user_id_filter, project_name_safe, video_id)
-        if video_found_path and video_filename:
-            video_path_cache[cache_key] = ({'path': video_found_path, 'filename': video_filename}, now)
-            logger.info(f"[DOWNLOAD] Cache MISS - dados salvos para {video_id}")
+    # 1) Cache compartilhado; 2) se não tem no cache, busca diretamente no Firebase sem varredura
+    video_found_path, video_filename = resolve_project_file(authenticated_user_id_filter, project_name_safe, video_id, "DOWNLOAD")
 
     if not video_found_path or not video_filename:
         logger.info(f"[DOWNLOAD] Vídeo '{video_id}' no projeto '{project_name_safe}' não encontrado.")
         return jsonify({"message": "Vídeo não encontrado ou não autorizado"}), 404
 
     # 3) Monta caminho no disco e envia o arquivo (com tratamento de desconexão)
-    full_file_path = os.path.join(VIDEO_BASE_DIR, video_found_path)
-    if not os.path.exists(full_file_path):
+    full_file_path = storage.resolve(video_found_path)
+    try:
+        file_stat = os.stat(full_file_path) if full_file_path else None
+    except OSError:
+        file_stat = None
+    if file_stat is None:
         logger.warning(f"[DOWNLOAD] Arquivo original não encontrado no disco: {full_file_path}")
         return jsonify({"message": "Arquivo original não encontrado"}), 404
 
-    directory = os.path.dirname(full_file_path)
     actual_filename_on_disk = os.path.basename(full_file_path)
 
-    logger.info(f"[DOWNLOAD] Iniciando envio: '{actual_filename_on_disk}' para usuário {authenticated_user_id}")
+    logger.info(f"[DOWNLOAD] Iniciando envio: '{actual_filename_on_disk}' para usuário {authenticated_user_id} (Range: {request.headers.get('Range')})")
 
     try:
-        # Usamos send_from_directory para manter compatibilidade (Flask >=2.2 suporta download_name)
-        return send_from_directory(directory, 
-                                   actual_filename_on_disk, 
-                                   as_attachment=True, 
-                                   download_name=video_filename,
-                                   conditional=False
-                                )
+        # Range (RFC 7233, um ou vários intervalos) e GET condicional (ETag forte / If-Modified-Since -> 304)
+        return send_media_file(full_file_path, video_filename, as_attachment=True, st=file_stat)
     except (ConnectionResetError, BrokenPipeError) as e:
         logger.warning(f"Cliente desconectou durante o envio do arquivo {video_filename}: {e}")
         return Response(status=499)
@@ -1097,32 +1920,20 @@ def download_video(video_id):
         return jsonify({"message": "Autenticação necessária"}), 401
 
     try:
-        user_projects_ref = db.reference(f'projects/{authenticated_user_id_filter}/', app=app_instance)
-        user_projects_data = user_projects_ref.get()
-        
-        video_found_path = None
-        video_filename = None
-
-        if user_projects_data:
-            for project_key, project_details in user_projects_data.items():
-                if 'videos' in project_details and video_id in project_details['videos']:
-                    video_data = project_details['videos'][video_id]
-                    video_found_path = video_data.get('serverFilePath')
-                    video_filename = video_data.get('filename')
-                    break
+        # Resolve pelo índice video_index (cache compartilhado ou uma leitura pontual)
+        video_found_path, video_filename = resolve_video_by_id(authenticated_user_id_filter, video_id, "Download")
 
         if not video_found_path or not video_filename:
             logger.info(f"DEBUG: Vídeo ID '{video_id}' não encontrado ou não autorizado para user '{authenticated_user_id}'.")
             return jsonify({"message": "Vídeo não encontrado ou não autorizado"}), 404
 
-        full_file_path = os.path.join(VIDEO_BASE_DIR, video_found_path)
+        full_file_path = storage.resolve(video_found_path)
 
-        if os.path.exists(full_file_path):
-            directory = os.path.dirname(full_file_path)
+        if full_file_path and os.path.exists(full_file_path):
             actual_filename_on_disk = os.path.basename(full_file_path)
             logger.info(f"[Download] '{actual_filename_on_disk}' ")
             try:
-                return send_from_directory(directory, actual_filename_on_disk, as_attachment=True, download_name=video_filename)
+                return send_media_file(full_file_path, video_filename, as_attachment=True)
             except (ConnectionResetError, BrokenPipeError) as e:
                 # Cliente desconectou antes de terminar o download
                 logger.warning(f"Cliente desconectou durante o envio do arquivo {video_filename}: {e}")
@@ -1153,59 +1964,45 @@ def preview_video_optimized(project_name, video_id):
     # Sanitiza o nome do projeto para segurança
     project_name_safe = secure_filename(project_name).replace("-", "").replace("....", "").replace("...", "").replace("..", "").replace(".", "").replace("... - ", "").replace('"????????"', '').replace("...__", "_")
     
-    cache_key = f"{authenticated_user_id_filter}_{project_name_safe}_{video_id}"
-    
     try:
-        # 1. Verifica cache primeiro
-        now = time.time()
-        if cache_key in video_path_cache:
-            cached_data, timestamp = video_path_cache[cache_key]
-            if now - timestamp < CACHE_TTL:
-                video_found_path = cached_data['path']
-                video_filename = cached_data['filename']
-                logger.info(f"[PREVIEW] Cache HIT para vídeo {video_id} no projeto {project_name_safe}")
-            else:
-                # Cache expirado
-                del video_path_cache[cache_key]
-                video_found_path = None
-                video_filename = None
-        else:
-            video_found_path = None
-            video_filename = None
-
-        # 2. Se não está em cache, busca de forma otimizada no Firebase
-        if not video_found_path:
-            # A busca otimizada agora é direta, sem loops
-            video_found_path, video_filename = find_video_optimized_direct(
-                authenticated_user_id_filter,
-                project_name_safe,
-                video_id
-            )
-            
-            # Armazena no cache se encontrou
-            if video_found_path and video_filename:
-                video_path_cache[cache_key] = (
-                    {'path': video_found_path, 'filename': video_filename},
-                    now
-                )
-                logger.info(f"[PREVIEW] Cache MISS - dados salvos para {video_id}")
+        # Cache compartilhado primeiro; se não estiver lá, busca direta no Firebase
+        video_found_path, video_filename = resolve_project_file(
+            authenticated_user_id_filter,
+            project_name_safe,
+            video_id,
+            "PREVIEW"
+        )
         
         if not video_found_path or not video_filename:
             logger.info(f"[PREVIEW] Vídeo '{video_id}' no projeto '{project_name_safe}' não encontrado.")
             return jsonify({"message": "Vídeo não encontrado ou não autorizado"}), 404
 
         # Resto da lógica para servir o arquivo permanece igual
-        full_file_path = os.path.join(VIDEO_BASE_DIR, video_found_path)
-        if not os.path.exists(full_file_path):
+        full_file_path = storage.resolve(video_found_path)
+        if not full_file_path or not os.path.exists(full_file_path):
             return jsonify({"message": "Arquivo original não encontrado"}), 404
 
         scheme = "https" if request.headers.get("X-Forwarded-Proto", "http") == "https" else "http"
-        preview_url = url_for('serve_static_video', path=video_found_path, _external=True, _scheme=scheme)
+        if not STREAM_URL_SECRET:
+            # sem segredo: URL sem assinatura, cada requisição do player autentica por X-User-Id
+            preview_url = url_for('serve_static_video', path=video_found_path, _external=True, _scheme=scheme)
+            logger.info(f"[PREVIEW] preview_url sem assinatura gerada: '{preview_url}'")
+            return jsonify({
+                "preview_url": preview_url.replace('http://', 'https://'),
+                "filename": video_filename,
+                "expires_at": None
+            }), 200
+        # URL assinada: o player pode fazer quantos Range quiser sem reautenticar no Firebase
+        expires, signature = sign_stream_path(STREAM_URL_SECRET, authenticated_user_id_filter, video_found_path, STREAM_URL_TTL)
+        preview_url = url_for('serve_static_video', path=video_found_path,
+                              u=authenticated_user_id_filter, exp=expires, sig=signature,
+                              _external=True, _scheme=scheme)
         
         logger.info(f"[PREVIEW] preview_url gerada: '{preview_url}'")
         return jsonify({
             "preview_url": preview_url.replace('http://', 'https://'),
-            "filename": video_filename
+            "filename": video_filename,
+            "expires_at": expires
         }), 200
 
     except Exception as e:
@@ -1226,41 +2023,21 @@ def serve_file_content(project_name, file_id):
     # Sanitização do nome do projeto
     project_name_safe = secure_filename(project_name).replace("-", "").replace("....", "").replace("...", "").replace("..", "").replace(".", "").replace("... - ", "").replace('"????????"', '').replace("...__", "_")
 
-    cache_key = f"{authenticated_user_id_filter}_{project_name_safe}_{file_id}"
-    now = time.time()
-
     try:
-        # 1) Verifica cache
-        if cache_key in video_path_cache:
-            cached_data, timestamp = video_path_cache[cache_key]
-            if now - timestamp < CACHE_TTL:
-                file_found_path = cached_data['path']
-                file_filename = cached_data['filename']
-            else:
-                del video_path_cache[cache_key]
-                file_found_path, file_filename = None, None
-        else:
-            file_found_path, file_filename = None, None
-
-        # 2) Busca otimizada no Firebase se não está em cache
-        if not file_found_path:
-            file_found_path, file_filename = find_video_optimized_direct(
-                authenticated_user_id_filter,
-                project_name_safe,
-                file_id
-            )
-            if file_found_path and file_filename:
-                video_path_cache[cache_key] = (
-                    {'path': file_found_path, 'filename': file_filename},
-                    now
-                )
+        # 1) Cache compartilhado; 2) busca otimizada no Firebase se não está em cache
+        file_found_path, file_filename = resolve_project_file(
+            authenticated_user_id_filter,
+            project_name_safe,
+            file_id,
+            "CONTENT"
+        )
 
         if not file_found_path or not file_filename:
             return jsonify({"message": "Arquivo não encontrado ou não autorizado"}), 404
 
         # 3) Monta caminho físico
-        full_file_path = os.path.join(VIDEO_BASE_DIR, file_found_path)
-        if not os.path.exists(full_file_path):
+        full_file_path = storage.resolve(file_found_path)
+        if not full_file_path or not os.path.exists(full_file_path):
             return jsonify({"message": "Arquivo não encontrado no servidor"}), 404
 
         # 4) Se for texto/JSON/Markdown, retorna conteúdo
@@ -1279,9 +2056,7 @@ def serve_file_content(project_name, file_id):
                 return jsonify({"message": f"Erro ao ler conteúdo: {str(e)}"}), 500
 
         # 5) Caso contrário, força download
-        directory = os.path.dirname(full_file_path)
-        actual_filename_on_disk = os.path.basename(full_file_path)
-        return send_from_directory(directory, actual_filename_on_disk, as_attachment=True, download_name=file_filename)
+        return send_media_file(full_file_path, file_filename, as_attachment=True)
 
     except Exception as e:
         logger.error(f"ERRO em serve_file_content: {e}", exc_info=True)
@@ -1299,12 +2074,11 @@ def delete_project(project_name):
         safe_project_name = secure_filename(project_name).replace("-", "").replace("....", "").replace("...", "").replace("..", "").replace(".", "").replace("... - ", "").replace('"????????"', '').replace("...__", "_")
         safe_project_name_filter = re.sub(r'[^0-9A-Za-z_-]', '', safe_project_name)
 
-        # Caminhos no disco
-        user_dir = os.path.join(VIDEO_BASE_DIR, authenticated_user_id_filter)
-        project_dir = os.path.join(user_dir, safe_project_name_filter)
+        # Pasta do projeto no disco (em cada volume onde ele tem arquivos)
+        project_dir = f"{authenticated_user_id_filter}/{safe_project_name_filter}"
 
         # 1) Remover arquivos do projeto no disco
-        fs_deleted, fs_reason = _remove_directory_safe(project_dir)
+        fs_deleted, fs_reason = _remove_project_dirs(authenticated_user_id_filter, safe_project_name_filter)
         if fs_deleted:
             logger.info(f"[delete-project] Arquivos do projeto removidos: {project_dir}")
         elif fs_reason == "not_found":
@@ -1317,19 +2091,22 @@ def delete_project(project_name):
             # Prossegue para remover do DB, mas informa falha parcial
 
         # 2) Remover referência no Firebase RTDB
-        ref = db.reference(f'projects/{authenticated_user_id_filter}/{safe_project_name_filter}', app=app_instance)
-        existed_in_db = ref.get() is not None
+        existed_in_db = project_exists(authenticated_user_id_filter, safe_project_name_filter)
         if existed_in_db:
-            ref.delete()
+            # ids dos vídeos (só as chaves) para remover também as entradas do índice video_index
+            video_ids = _read_project_video_ids(authenticated_user_id_filter, safe_project_name_filter)
+            _unregister_videos(authenticated_user_id_filter, safe_project_name_filter, video_ids, remove_project=True)
             logger.info(f"[delete-project] Projeto '{safe_project_name_filter}' excluído do Firebase com sucesso!")
         else:
             logger.info(f"[delete-project] Projeto '{safe_project_name_filter}' não existia no Firebase.")
 
         # 3) Limpar entradas de cache relacionadas ao projeto
         _clear_project_cache_entries(authenticated_user_id_filter, safe_project_name_filter)
+        _release_blobs(authenticated_user_id_filter, safe_project_name_filter)
 
         # 4) Limpeza opcional do diretório do usuário se vazio
-        _cleanup_user_dir_if_empty(user_dir)
+        for user_dir in storage.user_dirs(authenticated_user_id_filter):
+            _cleanup_user_dir_if_empty(user_dir)
 
         # Monta mensagem de retorno, incluindo status do FS
         resp_msg_parts = []
@@ -1367,10 +2144,9 @@ def delete_single_video(project_name, video_id):
         safe_project_name = secure_filename(project_name).replace("-", "").replace("....", "").replace("...", "").replace("..", "").replace(".", "").replace("... - ", "").replace('"????????"', '').replace("...__", "_")
         safe_project_name_filter = re.sub(r'[^0-9A-Za-z_-]', '', safe_project_name)
 
-        # Referência ao item no Firebase
+        # Item no projeto (espelho local ou Firebase)
         video_ref_path = f'projects/{authenticated_user_id_filter}/{safe_project_name_filter}/videos/{video_id}'
-        video_ref = db.reference(video_ref_path, app=app_instance)
-        video_data = video_ref.get()
+        video_data = _read_video(authenticated_user_id_filter, safe_project_name_filter, video_id)
 
         if not video_data:
             logger.info(f"[delete-single-video] Vídeo {video_id} não encontrado em {video_ref_path}")
@@ -1384,20 +2160,21 @@ def delete_single_video(project_name, video_id):
         fs_reason = None
 
         if server_file_path:
-            # Monta caminho absoluto e garante segurança (não permite sair de VIDEO_BASE_DIR)
-            full_file_path = os.path.join(VIDEO_BASE_DIR, server_file_path)
-            abs_base = os.path.abspath(VIDEO_BASE_DIR)
-            abs_target = os.path.abspath(full_file_path)
+            # Monta caminho absoluto e garante segurança (não permite sair do volume)
+            full_file_path = storage.resolve(server_file_path)
 
-            if not abs_target.startswith(abs_base + os.sep):
-                logger.warning(f"[delete-single-video] Caminho inseguro detectado: {abs_target}")
+            if not full_file_path:
+                logger.warning(f"[delete-single-video] Caminho inseguro detectado: {server_file_path}")
                 return jsonify({"message": "Falha: caminho de arquivo inseguro."}), 400
 
             if os.path.exists(full_file_path):
                 try:
-                    os.remove(full_file_path)
+                    _discard_path(full_file_path)
                     fs_deleted = True
                     logger.info(f"[delete-single-video] Arquivo removido do disco: {full_file_path}")
+                except FileNotFoundError:
+                    fs_reason = "Arquivo não existe no disco"
+                    logger.info(f"[delete-single-video] Arquivo já não existia no disco: {full_file_path}")
                 except Exception as e:
                     fs_reason = f"Erro ao remover arquivo do disco: {str(e)}"
                     logger.error(f"[delete-single-video] {fs_reason}", exc_info=True)
@@ -1410,22 +2187,29 @@ def delete_single_video(project_name, video_id):
 
         # Remove o nó do Firebase (metadados)
         try:
-            video_ref.delete()
+            size = video_data.get('size')
+            _unregister_videos(authenticated_user_id_filter, safe_project_name_filter, [video_id],
+                               removed_bytes=size if isinstance(size, (int, float)) else 0)
             firebase_deleted = True
             logger.info(f"[delete-single-video] Nó Firebase removido: {video_ref_path}")
         except Exception as e:
             firebase_deleted = False
             logger.error(f"[delete-single-video] Falha ao remover nó no Firebase: {e}", exc_info=True)
 
-        # Limpa cache referente ao projeto
+        if firebase_deleted:
+            _release_blobs(authenticated_user_id_filter, safe_project_name_filter, [video_id])
+
+        # Limpa o cache do item, inclusive a entrada por id usada nas rotas legacy (vale para todos os workers)
         try:
-            _clear_project_cache_entries(authenticated_user_id_filter, safe_project_name_filter)
+            video_path_cache.delete((authenticated_user_id_filter, safe_project_name_filter, video_id))
+            video_path_cache.delete((authenticated_user_id_filter, None, video_id))
         except Exception:
             pass
 
         # Limpa diretório do usuário se vazio (opcional)
         try:
-            _cleanup_user_dir_if_empty(os.path.join(VIDEO_BASE_DIR, authenticated_user_id_filter))
+            for user_dir in storage.user_dirs(authenticated_user_id_filter):
+                _cleanup_user_dir_if_empty(user_dir)
         except Exception:
             pass
 
@@ -1457,33 +2241,195 @@ def mark_project_utilizado(project_name):
         safe_project_name_filter = re.sub(r'[^0-9A-Za-z_-]', '', safe_project_name)
     
         logger.info(f"[mark-utilizado] safe_project_name_filter '{safe_project_name_filter}' ")
-        ref = db.reference(f'projects/{authenticated_user_id_filter}/{safe_project_name_filter}', app=app_instance)
+        project_path = f'projects/{authenticated_user_id_filter}/{safe_project_name_filter}'
         timestamp_now = datetime.utcnow().isoformat() + 'Z'  # formato ISO UTC
-        ref.update({
-            "used": utilizado,
-            "last_used_timestamp": timestamp_now
+        _db_update({
+            f'{project_path}/used': utilizado,
+            f'{project_path}/last_used_timestamp': timestamp_now,
+            **_change_updates(authenticated_user_id_filter, [
+                _change_entry("project", "upsert", safe_project_name_filter,
+                              data={"used": utilizado, "last_used_timestamp": timestamp_now}),
+            ]),
         })
+        _bump_user_version(authenticated_user_id_filter, 'projects')
         logger.info(f"[mark-utilizado] marcado como {utilizado} com sucesso! ")
         return jsonify({"message": f"Projeto {'marcado como utilizado' if utilizado else 'não utilizado'} com sucesso!"})
     except Exception as e:
         logger.error(f"Erro ao atualizar utilizado: {e}", exc_info=True)
         return jsonify({"message": "Erro ao atualizar utilizado"}), 500
 
-# A rota para servir o arquivo permanece inalterada
-@app.route('/api/files/stream/<path:path>', methods=['GET'])
-def serve_static_video(path):
+@app.route('/api/metadata/consistency', methods=['GET'])
+def check_metadata_consistency():
+    """
+    Compara o espelho local com projects/{usuario} e user_settings/{usuario} no Firebase.
+    ?repair=1 recarrega o usuário do Firebase quando há diferenças.
+    """
     authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
     if not authenticated_user_id:
         return jsonify({"message": "Autenticação necessária"}), 401
+    if metadata_mirror is None:
+        return jsonify({"message": "Espelho local desativado (METADATA_SOURCE=firebase)"}), 404
+
+    try:
+        projects_tree = db.reference(f'projects/{authenticated_user_id_filter}', app=app_instance).get() or {}
+        settings = db.reference(f'user_settings/{authenticated_user_id_filter}', app=app_instance).get()
+        synced = metadata_mirror.is_synced(authenticated_user_id_filter)
+        differences = metadata_mirror.diff_user(authenticated_user_id_filter, projects_tree) if synced else []
+        found, local_settings = metadata_mirror.settings(authenticated_user_id_filter)
+        if found and (local_settings or None) != (settings or None):
+            differences.append(f"user_settings/{authenticated_user_id_filter}")
+
+        repaired = False
+        if differences and request.args.get('repair') == '1':
+            metadata_mirror.load_user(authenticated_user_id_filter, projects_tree)
+            metadata_mirror.set_settings(authenticated_user_id_filter, settings)
+            _bump_user_version(authenticated_user_id_filter, 'projects', 'settings')
+            repaired = True
+        if differences:
+            logger.warning(f"[MIRROR] {len(differences)} divergências para {authenticated_user_id_filter} "
+                           f"(reparado: {repaired}): {differences[:20]}")
+    except Exception as e:
+        logger.error(f"[MIRROR] Erro ao verificar espelho: {e}", exc_info=True)
+        return jsonify({"message": f"Erro ao verificar espelho: {str(e)}"}), 500
+
+    return jsonify({
+        "synced": synced,
+        "consistent": not differences,
+        "differences": differences,
+        "repaired": repaired
+    }), 200
+
+@app.route('/api/projects/changes', methods=['GET'])
+def get_project_changes():
+    """
+    Alterações de projetos e itens posteriores ao cursor (sincronização incremental).
+      - since: next_cursor da resposta anterior; sem since, devolve só o cursor atual
+        (o cliente faz a carga completa por GET /api/projects e continua a partir dele)
+      - limit: alterações por página (padrão e máximo PROJECT_CHANGES_PAGE_MAX)
+    Cada entidade aparece uma vez por página, com o estado acumulado: "upsert" traz em data os
+    campos alterados (mesclar no objeto local) e "delete" é um tombstone. O tombstone de um
+    projeto vale para todos os seus itens. 410 se o cursor é anterior ao log retido.
+    """
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
+
+    since = request.args.get('since') or None
+    if since is not None and not re.fullmatch(r'[-0-9A-Za-z_]{20}', since):
+        return jsonify({"message": "since inválido"}), 400
+    try:
+        limit = int(request.args.get('limit', PROJECT_CHANGES_PAGE_MAX))
+    except ValueError:
+        return jsonify({"message": "limit inválido"}), 400
+    limit = max(1, min(limit, PROJECT_CHANGES_PAGE_MAX))
+
+    try:
+        _maybe_compact_project_changes(authenticated_user_id_filter)
+        # chaves mais novas que o intervalo de acomodação ficam para a próxima página
+        upper = _change_key(int(time.time() * 1000) - PROJECT_CHANGES_SETTLE_MS, _PUSH_CHARS[0] * 12)
+        if since is None:
+            return jsonify({"changes": [], "next_cursor": upper, "has_more": False}), 200
+
+        compacted_before = db.reference(f'project_changes_meta/{authenticated_user_id_filter}/compactedBefore',
+                                        app=app_instance).get()
+        if compacted_before and since < compacted_before:
+            return jsonify({"message": "Cursor anterior ao histórico retido; faça a sincronização completa",
+                            "compactedBefore": compacted_before}), 410
+        if since >= upper:
+            return jsonify({"changes": [], "next_cursor": since, "has_more": False}), 200
+
+        # start_at é inclusivo e since costuma ser uma chave existente (o next_cursor anterior):
+        # limit + 2 garante, sem o since, a página inteira e mais uma chave para o has_more
+        entries = (db.reference(f'project_changes/{authenticated_user_id_filter}', app=app_instance)
+                   .order_by_key().start_at(since).end_at(upper).limit_to_first(limit + 2).get()) or {}
+        keys = [key for key in sorted(entries) if key != since]
+        has_more = len(keys) > limit
+        keys = keys[:limit]
+        items = [(key, entries[key]) for key in keys if isinstance(entries[key], dict)]
+        next_cursor = keys[-1] if has_more else upper
+    except Exception as e:
+        logger.error(f"[CHANGES] Erro ao ler alterações de {authenticated_user_id_filter}: {e}", exc_info=True)
+        return jsonify({"message": f"Erro ao buscar alterações: {str(e)}"}), 500
+
+    return jsonify({
+        "changes": _coalesce_project_changes(items),
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }), 200
+
+@app.route('/api/projects/events', methods=['GET'])
+def project_events_stream():
+    """
+    Stream SSE (text/event-stream) das alterações nos projetos do usuário: criação, status,
+    progress_percent, used, vídeos adicionados/removidos e exclusão.
+    Autenticação por X-User-Id ou pela URL assinada de /api/projects/events/url (EventSource
+    não envia cabeçalhos). Reconexões com Last-Event-ID (ou ?lastEventId=) recebem os eventos perdidos.
+    """
+    if not PROJECT_EVENTS_ENABLED:
+        return jsonify({"message": "Eventos de projetos desativados"}), 404
+
+    signature = request.args.get('sig')
+    if signature:
+        user_key = request.args.get('u')
+        ok, reason = verify_stream_signature(STREAM_URL_SECRET, user_key, 'projects/events',
+                                             request.args.get('exp'), signature)
+        if not ok:
+            message = {"expired": "Link de eventos expirado",
+                       "disabled": "URLs de eventos assinadas desativadas"}.get(reason, "Assinatura inválida")
+            return jsonify({"message": message}), 403
+    else:
+        authenticated_user_id, user_key = authenticate_user(request)
+        if not authenticated_user_id:
+            return jsonify({"message": "Autenticação necessária"}), 401
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if request.environ.get(OFFLOAD_ENVIRON_KEY) == "1":
+        # o middleware ASGI mantém a conexão aberta no event loop; esta thread é liberada agora
+        headers.update(events_offload_headers(user_key, last_event_id))
+        return Response(b"", mimetype="text/event-stream", headers=headers)
+    return Response(project_events.iter_events(user_key, last_event_id, heartbeat=PROJECT_EVENTS_HEARTBEAT),
+                    mimetype="text/event-stream", headers=headers, direct_passthrough=True)
+
+@app.route('/api/projects/events/url', methods=['GET'])
+def project_events_url():
+    """
+    URL assinada de /api/projects/events para o EventSource do navegador. Sem STREAM_URL_SECRET,
+    a URL sem assinatura (o cliente autentica por X-User-Id, ex.: com um polyfill de EventSource).
+    """
+    authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+    if not authenticated_user_id:
+        return jsonify({"message": "Autenticação necessária"}), 401
+    if not STREAM_URL_SECRET:
+        return jsonify({"url": url_for('project_events_stream'), "expires_at": None}), 200
+    expires, signature = sign_stream_path(STREAM_URL_SECRET, authenticated_user_id_filter, 'projects/events', STREAM_URL_TTL)
+    return jsonify({
+        "url": url_for('project_events_stream', u=authenticated_user_id_filter, exp=expires, sig=signature),
+        "expires_at": expires
+    }), 200
 
-    full_file_path = os.path.join(VIDEO_BASE_DIR, path)
-    if not os.path.exists(full_file_path):
+@app.route('/api/files/stream/<path:path>', methods=['GET'])
+def serve_static_video(path):
+    signature = request.args.get('sig')
+    if signature:
+        # URL assinada pelo preview: verificação local (HMAC + expiração), sem leitura no Firebase
+        ok, reason = verify_stream_signature(STREAM_URL_SECRET, request.args.get('u'), path,
+                                             request.args.get('exp'), signature)
+        if not ok:
+            logger.info(f"[STREAM] Assinatura recusada ({reason}) para '{path}'")
+            message = {"expired": "Link de streaming expirado",
+                       "disabled": "URLs de streaming assinadas desativadas"}.get(reason, "Assinatura inválida")
+            return jsonify({"message": message}), 403
+    else:
+        authenticated_user_id, authenticated_user_id_filter = authenticate_user(request)
+        if not authenticated_user_id:
+            return jsonify({"message": "Autenticação necessária"}), 401
+
+    full_file_path = storage.resolve(path)
+    if not full_file_path or not os.path.isfile(full_file_path):
         return jsonify({"message": "Arquivo não encontrado"}), 404
 
-    directory = os.path.dirname(full_file_path)
-    filename = os.path.basename(full_file_path)
-    
-    return send_from_directory(directory, filename, as_attachment=False)
+    return send_media_file(full_file_path, os.path.basename(full_file_path), as_attachment=False)
 
 @app.route('/api/videos/<video_id>/preview/file', methods=['GET'])
 def serve_video_preview(video_id):
@@ -1492,47 +2438,304 @@ def serve_video_preview(video_id):
     if not authenticated_user_id:
         return jsonify({"message": "Autenticação necessária"}), 401
 
-    user_projects_ref = db.reference(f'projects/{authenticated_user_id_filter}/', app=app_instance)
-    user_projects_data = user_projects_ref.get()
-
-    video_found_path = None
-    if user_projects_data:
-        for project_key, project_details in user_projects_data.items():
-            if 'videos' in project_details and video_id in project_details['videos']:
-                video_data = project_details['videos'][video_id]
-                video_found_path = video_data.get('serverFilePath')
-                break
+    video_found_path, _ = resolve_video_by_id(authenticated_user_id_filter, video_id, "PREVIEW")
 
     if not video_found_path:
         return jsonify({"message": "Vídeo não encontrado ou não autorizado"}), 404
 
-    full_file_path = os.path.join(VIDEO_BASE_DIR, video_found_path)
-    if not os.path.exists(full_file_path):
+    full_file_path = storage.resolve(video_found_path)
+    if not full_file_path or not os.path.exists(full_file_path):
         return jsonify({"message": "Arquivo original não encontrado"}), 404
 
-    directory = os.path.dirname(full_file_path)
-    filename = os.path.basename(full_file_path)
-    return send_from_directory(directory, filename, as_attachment=False)
+    return send_media_file(full_file_path, os.path.basename(full_file_path), as_attachment=False)
+
+def send_media_file(full_file_path, download_name, as_attachment=True, st=None):
+    """
+    Envia um arquivo do VIDEO_BASE_DIR com Range/GET condicional. Sob o uvicorn o corpo é
+    entregue pelo MediaStreamMiddleware (zerocopysend/pathsend ou leitura em blocos), sem
+    passar pela ponte de threads do WsgiToAsgi.
+    """
+    return send_file_ranged(full_file_path,
+                            request.headers,
+                            download_name=download_name,
+                            as_attachment=as_attachment,
+                            chunk_size=CHUNK_SIZE,
+                            st=st,
+                            on_event=download_metrics.incr,
+                            offload=request.environ.get(OFFLOAD_ENVIRON_KEY) == "1")
+
+def _commit_uploaded_file(user_id_filter, project_name, project_name_safe, video_id, original_filename, file_path, metadata,
+                          content_hash=None):
+    """
+    Grava no Firebase os metadados de um arquivo já salvo em file_path (upload direto ou sessão
+    retomável finalizada). Com content_hash (SHA-256), o arquivo entra no armazenamento
+    deduplicado antes da gravação. Retorna (payload, status_code) da resposta de upload; fora de
+    2xx o arquivo e a referência ao blob são descartados.
+    """
+    content_hash = _adopt_blob(user_id_filter, project_name_safe, video_id, file_path, content_hash)
+    try:
+        payload, status_code = _write_uploaded_metadata(user_id_filter, project_name, project_name_safe, video_id,
+                                                        original_filename, file_path, metadata, content_hash)
+    except Exception:
+        # o arquivo fica com quem chamou (a sessão retomável o recupera para repetir o complete)
+        if blob_store and content_hash:
+            blob_store.release([(user_id_filter, project_name_safe, video_id)])
+        raise
+    if not 200 <= status_code < 300:
+        if blob_store and content_hash:
+            blob_store.release([(user_id_filter, project_name_safe, video_id)])
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+    return payload, status_code
+
+def _adopt_blob(user_id_filter, project_name_safe, video_id, file_path, content_hash):
+    """Registra o arquivo no armazenamento deduplicado. Retorna content_hash, ou None se o registro falhou."""
+    # .blobs fica no volume principal; nos demais volumes o hardlink não é possível
+    if blob_store and content_hash and storage.volume_of(file_path) == PRIMARY_VOLUME:
+        try:
+            if blob_store.adopt(file_path, content_hash, (user_id_filter, project_name_safe, video_id)):
+                logger.info(f"[DEDUP] Conteúdo {content_hash[:12]} já existia; {video_id} aponta para o mesmo blob")
+        except Exception:
+            logger.exception(f"[DEDUP] Falha ao registrar blob de {video_id}; arquivo mantido sem deduplicação")
+            return None
+    return content_hash
+
+UPLOAD_TYPE_PROJECTS = ("video", "files")
+
+def _valid_type_project(metadata):
+    return metadata.get('type_project', 'video') in UPLOAD_TYPE_PROJECTS
+
+def _uploaded_item_data(video_id, original_filename, file_path, metadata, content_hash):
+    """Metadados do item em projects/.../videos/{video_id} conforme o type_project (None se inválido)."""
+    type_project = metadata.get('type_project', 'video')
+    if type_project == "video":
+        update_data = {
+            "filename": original_filename,
+            "serverFilePath": storage.server_path(file_path),
+            "uploadedAt": datetime.now().isoformat(),
+            "status": "UPLOADED",
+            "progress_percent": "100",
+            "size": os.path.getsize(file_path),
+        }
+        if content_hash:
+            update_data["contentHash"] = content_hash
+        update_data.update({
+            "type_project": "video",
+            "title": metadata.get('title', original_filename),
+            "descricao": metadata.get('description', ''),
+            "hashtags": metadata.get('hashtags', []),
+            "minutagemdeInicio": metadata.get('minutagemdeInicio', '00:00'),
+            "minutagemdeFim": metadata.get('minutagemdeFim', 'Fim'),
+            "urltumbnail": metadata.get('urltumbnail', ''),
+            "justificativa": metadata.get('justificativa', ''),
+            "sentimento_principal": metadata.get('sentimento_principal', ''),
+            "potencial_de_viralizacao": metadata.get('potencial_de_viralizacao', ''),
+        })
+        if isinstance(update_data["hashtags"], str):
+            update_data["hashtags"] = [tag.strip() for tag in update_data["hashtags"].split(',') if tag.strip()]
+        return update_data
+
+    if type_project == "files":
+        video_metadata_for_firebase = {
+            "type_project": "files",
+            "id": video_id,
+            "filename": original_filename,
+            "serverFilePath": storage.server_path(file_path),
+            "uploadedAt": datetime.now().isoformat(),
+            "size": os.path.getsize(file_path),
+            "status": "ready"
+        }
+        if content_hash:
+            video_metadata_for_firebase["contentHash"] = content_hash
+        return video_metadata_for_firebase
+
+    return None
+
+def _write_uploaded_metadata(user_id_filter, project_name, project_name_safe, video_id, original_filename, file_path,
+                             metadata, content_hash):
+    type_project = metadata.get('type_project', 'video')
+    item_data = _uploaded_item_data(video_id, original_filename, file_path, metadata, content_hash)
+    if item_data is None:
+        return {"message": "type_project inválido"}, 400
+
+    if type_project == "video":
+        _register_video(user_id_filter, project_name_safe, video_id, item_data)
+
+        return {
+            "message": f"{'Vídeo' if type_project == 'video' else 'Arquivo'} e metadados atualizados com sucesso!",
+            "item_id": video_id,
+            "video_id": video_id,
+            "filename": original_filename,
+            "project_name": project_name,
+            "type_project": type_project
+        }, 200
+
+    if not project_exists(user_id_filter, project_name_safe):
+        _create_project_node(user_id_filter, project_name_safe, {
+            "name": project_name,
+            "createdAt": datetime.now().isoformat(),
+            "videos": {}
+        })
+    _register_video(user_id_filter, project_name_safe, video_id, item_data)
+
+    return {
+        "message": "Vídeo e metadados enviados com sucesso!",
+        "video_id": video_id,
+        "filename": original_filename,
+        "project_name": project_name
+    }, 201
+
+def _upload_session_payload(session_data):
+    return {
+        "upload_id": session_data['id'],
+        "filename": session_data['filename'],
+        "size": session_data['size'],
+        "offset": contiguous_offset(session_data['ranges']),
+        "missing": missing_ranges(session_data['ranges'], session_data['size']),
+        "part_size": session_data['partSize'],
+        "part_count": upload_sessions.part_count(session_data),
+        "parts": session_data['parts'],
+        "status": session_data['status'],
+        "expires_at": int(session_data['expiresAt']),
+    }
+
+def _upload_session_response(session_data):
+    response = jsonify(_upload_session_payload(session_data))
+    response.headers['Upload-Offset'] = str(contiguous_offset(session_data['ranges']))
+    response.headers['Upload-Length'] = str(session_data['size'])
+    response.headers['Upload-Expires'] = http_date(session_data['expiresAt'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def _encode_projects_cursor(created_at, key):
+    raw = json.dumps([created_at, key], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_projects_cursor(cursor):
+    """Cursor opaco -> (createdAt, chave) ou None se inválido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, key = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(key, str) or not (created_at is None or isinstance(created_at, str)):
+        return None
+    return created_at, key
+
+def _project_sort_key(created_at, key):
+    # mesma ordem do Realtime DB em order_by_child: sem createdAt primeiro, depois valor e chave
+    return (created_at is not None, created_at or "", key)
+
+def _fetch_projects_page(user_id_filter, limit, cursor=None):
+    """
+    Lê só a página pedida de projects/{usuario}: query por createdAt com limit_to_first, a partir
+    do createdAt do cursor. Empates de createdAt são resolvidos pela chave (a query é ampliada
+    se muitos itens empatados já tiverem sido entregues). Retorna ([(chave, dados)], next_cursor).
+    """
+    after = _project_sort_key(*cursor) if cursor else None
+    if _mirror_ready(user_id_filter):
+        items = metadata_mirror.projects_page(user_id_filter, after, limit + 1)
+        return _projects_page_result(items, limit)
+
+    ref = db.reference(f'projects/{user_id_filter}', app=app_instance)
+    batch = limit + 1
+    while True:
+        query = ref.order_by_child('createdAt')
+        if cursor and cursor[0] is not None:
+            query = query.start_at(cursor[0])
+        data = query.limit_to_first(batch).get() or {}
+        items = sorted(
+            ((key, details) for key, details in data.items() if isinstance(details, dict)),
+            key=lambda item: _project_sort_key(item[1].get('createdAt'), item[0]),
+        )
+        if after is not None:
+            items = [item for item in items if _project_sort_key(item[1].get('createdAt'), item[0]) > after]
+        if len(items) > limit or len(data) < batch:
+            break
+        batch *= 2
+    return _projects_page_result(items, limit)
+
+def _projects_page_result(items, limit):
+    page = items[:limit]
+    next_cursor = None
+    if len(items) > limit:
+        last_key, last_details = page[-1]
+        next_cursor = _encode_projects_cursor(last_details.get('createdAt'), last_key)
+    return page, next_cursor
+
+def _format_project_entry(key, project_details, fields=None, videos_mode='full'):
+    entry = {"id": key}
+    for field in (fields or PROJECT_LIST_FIELDS):
+        entry[field] = project_details.get(field, key if field == "name" else None)
+    videos = project_details.get('videos') or {}
+    if videos_mode == 'full':
+        entry["videos"] = [
+            dict({k: v for k, v in video_data.items() if k != 'serverFilePath'}, id=video_id)
+            for video_id, video_data in videos.items() if isinstance(video_data, dict)
+        ]
+    elif videos_mode == 'summary':
+        entry["videoCount"] = len(videos)
+        upload_times = [v.get('uploadedAt') for v in videos.values() if isinstance(v, dict) and v.get('uploadedAt')]
+        entry["lastUploadAt"] = max(upload_times) if upload_times else None
+    return entry
+
+def sanitize_project_name(raw):
+    """Nome do projeto como usado no Firebase e no disco (mesma sanitização das rotas de upload)."""
+    safe_project_name = secure_filename(raw or "")
+    safe_project_name = safe_project_name.replace("-", "").replace("....", "").replace("...", "").replace("..", "").replace(".", "").replace("... - ", "").replace('"????????"', '').replace("...__", "_")
+    return re.sub(r'[^0-9A-Za-z_-]', '', safe_project_name)
+
+
+def _discard_path(path):
+    """
+    Tira o arquivo/diretório do lugar na hora: rename para a lixeira (apagada em segundo plano)
+    ou, sem lixeira disponível, remoção direta. FileNotFoundError se path não existe.
+    """
+    if trash_bin is not None and trash_bin.move(path):
+        return
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
 
 def _remove_directory_safe(path_to_remove: str):
     """Remove diretório e conteúdo com verificação de segurança para evitar path traversal.
+    O conteúdo vai para a lixeira (rename) e é apagado em segundo plano.
     Retorna (ok: bool, reason: str)
     """
     try:
-        abs_base = os.path.abspath(VIDEO_BASE_DIR)
         abs_target = os.path.abspath(path_to_remove)
-        if not abs_target.startswith(abs_base + os.sep):
-            logger.warning(f"[delete-project] Tentativa de remoção fora do VIDEO_BASE_DIR: {abs_target}")
+        if storage.volume_of(abs_target) is None:
+            logger.warning(f"[delete-project] Tentativa de remoção fora dos volumes de armazenamento: {abs_target}")
             return False, "unsafe_path"
         if not os.path.exists(abs_target):
             return False, "not_found"
-        shutil.rmtree(abs_target)
+        _discard_path(abs_target)
         return True, "deleted"
+    except FileNotFoundError:
+        return False, "not_found"
     except Exception as e:
         logger.error(f"[delete-project] Falha ao remover diretório '{path_to_remove}': {e}", exc_info=True)
         return False, f"error:{e}"
 
 
+def _remove_project_dirs(user_id_filter, project_name_safe):
+    """_remove_directory_safe na pasta do projeto em cada volume. Retorna (ok, reason) do mesmo jeito."""
+    project_dirs = storage.project_dirs(user_id_filter, project_name_safe)
+    if not project_dirs:
+        return False, "not_found"
+    results = [_remove_directory_safe(path) for path in project_dirs]
+    failed = [reason for ok, reason in results if not ok and reason != "not_found"]
+    if failed:
+        return False, failed[0]
+    if not any(ok for ok, _ in results):
+        return False, "not_found"
+    return True, "deleted"
+
+
 def _cleanup_user_dir_if_empty(user_dir: str):
     try:
         if os.path.isdir(user_dir) and len(os.listdir(user_dir)) == 0:
@@ -1541,14 +2744,777 @@ def _cleanup_user_dir_if_empty(user_dir: str):
         logger.warning(f"[delete-project] Não foi possível remover diretório de usuário vazio '{user_dir}': {e}")
 
 
+def _release_blobs(user_id_filter, project_name_safe, video_ids=None):
+    """Solta as referências ao armazenamento deduplicado (do projeto inteiro se video_ids for None)."""
+    if not blob_store:
+        return
+    try:
+        if video_ids is None:
+            removed = blob_store.release_project(user_id_filter, project_name_safe)
+        else:
+            removed = blob_store.release([(user_id_filter, project_name_safe, vid) for vid in video_ids])
+        if removed:
+            logger.info(f"[DEDUP] {removed} blob(s) sem referências removido(s)")
+    except Exception:
+        logger.exception(f"[DEDUP] Falha ao liberar blobs de {user_id_filter}/{project_name_safe}")
+
 def _clear_project_cache_entries(user_key: str, project_name_safe: str):
-    prefix = f"{user_key}_{project_name_safe}_"
-    to_delete = [k for k in list(video_path_cache.keys()) if str(k).startswith(prefix)]
-    for k in to_delete:
+    # índice secundário por (usuario, projeto): não varre as demais chaves do cache
+    video_path_cache.invalidate_group((user_key, project_name_safe))
+
+def resolve_project_file(user_id_filter, project_name_safe, video_id, log_tag="CACHE"):
+    """
+    Resolve (serverFilePath, filename) de um item do projeto passando pelo cache de caminhos
+    compartilhado entre os workers e, em caso de miss, pela leitura direta no Firebase.
+    Retorna (serverFilePath, filename) ou (None, None)
+    """
+    cache_key = (user_id_filter, project_name_safe, video_id)
+    cached_data = video_path_cache.get(cache_key)
+    if cached_data:
+        logger.info(f"[{log_tag}] Cache HIT para {video_id} no projeto {project_name_safe}")
+        return cached_data['path'], cached_data['filename']
+
+    video_path, video_filename = find_video_optimized_direct(user_id_filter, project_name_safe, video_id)
+    if video_path and video_filename:
+        video_path_cache.set(
+            cache_key,
+            {'path': video_path, 'filename': video_filename},
+            group=(user_id_filter, project_name_safe)
+        )
+        logger.info(f"[{log_tag}] Cache MISS - dados salvos para {video_id}")
+    return video_path, video_filename
+
+def _create_project_node(user_id_filter, project_name_safe, project_data):
+    """
+    Cria o nó do projeto, o resumo project_stats/{usuario}/{projeto} e a entrada no log
+    project_changes numa única atualização multi-caminho.
+    """
+    _db_update(_project_node_updates(user_id_filter, project_name_safe, project_data))
+    video_path_cache.set(_project_exists_key(user_id_filter, project_name_safe), True,
+                         group=(user_id_filter, project_name_safe))
+    _bump_user_version(user_id_filter, 'projects')
+
+def _project_node_updates(user_id_filter, project_name_safe, project_data, videos=None):
+    """Caminhos da criação do projeto (nó, resumo e log), já contando os itens de videos={id: dados}."""
+    videos = videos or {}
+    upload_times = [v.get("uploadedAt") for v in videos.values() if v.get("uploadedAt")]
+    return {
+        **_expiry_index_updates(user_id_filter, project_name_safe, project_data.get("delete_after")),
+        f'projects/{user_id_filter}/{project_name_safe}': project_data,
+        f'project_stats/{user_id_filter}/{project_name_safe}': {
+            "name": project_data.get("name", project_name_safe),
+            "fileCount": len(videos),
+            "totalBytes": sum(v.get("size") or 0 for v in videos.values()),
+            "lastUploadAt": max(upload_times) if upload_times else None,
+        },
+        **_change_updates(user_id_filter, [
+            _change_entry("project", "upsert", project_name_safe,
+                          data={k: v for k, v in project_data.items() if k != "videos"}),
+        ]),
+    }
+
+def _expiry_index_updates(user_id_filter, project_name_safe, delete_after):
+    """
+    Entrada project_expiry/{chave} do projeto com delete_after. A chave segue o formato de
+    _change_key com o tempo da expiração: a ordem das chaves é a ordem de vencimento.
+    """
+    try:
+        expires_ms = int(datetime.fromisoformat(delete_after).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return {}
+    return {f'project_expiry/{_change_key(expires_ms)}': {
+        "user": user_id_filter,
+        "project": project_name_safe,
+        "deleteAfter": delete_after,
+    }}
+
+def _fetch_expired_projects(after_key, limit):
+    """Entradas vencidas de project_expiry (chave > after_key), em ordem de vencimento."""
+    now_key = _change_key(int(time.time() * 1000), _PUSH_CHARS[-1] * 12)
+    query = db.reference('project_expiry', app=app_instance).order_by_key().end_at(now_key)
+    if after_key:
+        query = query.start_at(after_key)
+    items = query.limit_to_first(limit + 1).get() or {}
+    return [(key, entry) for key, entry in sorted(items.items())
+            if (after_key is None or key > after_key) and isinstance(entry, dict)][:limit]
+
+def _backfill_expiry_index(user_id_filter):
+    """
+    Entradas de project_expiry para os projetos do usuário criados antes do índice. A consulta
+    por delete_after traz só os projetos que expiram; um projeto que já tinha entrada ganha uma
+    segunda, tratada pelo reaper como obsoleta depois da primeira.
+    """
+    projects = db.reference(f'projects/{user_id_filter}', app=app_instance) \
+        .order_by_child('delete_after').start_at('').get() or {}
+    updates = {}
+    for project_key, project_details in projects.items():
+        if isinstance(project_details, dict):
+            updates.update(_expiry_index_updates(user_id_filter, project_key, project_details.get('delete_after')))
+    if updates:
+        _db_update(updates)
+    return len(updates)
+
+def _read_project_delete_after(user_id_filter, project_name_safe):
+    # leitura direta: o reaper não carrega usuários no espelho nem abre listeners (ver _stored_items)
+    return db.reference(f'projects/{user_id_filter}/{project_name_safe}/delete_after', app=app_instance).get()
+
+def _directory_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+def _reap_expired_project(entry, dry_run):
+    """
+    Remove um projeto vencido do índice project_expiry: arquivos (lixeira), nó do projeto,
+    video_index, resumo, blobs e caches, como o DELETE do projeto. Retorna (status, bytes).
+    """
+    user_id_filter, project_name_safe = entry.get("user"), entry.get("project")
+    if not user_id_filter or not project_name_safe:
+        return "stale", 0
+    # projeto já excluído ou recriado com o mesmo nome (outro delete_after): só a entrada sai
+    if _read_project_delete_after(user_id_filter, project_name_safe) != entry.get("deleteAfter"):
+        return "stale", 0
+
+    reclaimed = sum(_directory_size(path) for path in storage.project_dirs(user_id_filter, project_name_safe))
+    if dry_run:
+        logger.info(f"[EXPIRY][DRY-RUN] {user_id_filter}/{project_name_safe} venceu em {entry.get('deleteAfter')} "
+                    f"({reclaimed} bytes)")
+        return "reaped", reclaimed
+
+    fs_deleted, fs_reason = _remove_project_dirs(user_id_filter, project_name_safe)
+    if not fs_deleted and fs_reason != "not_found":
+        logger.warning(f"[EXPIRY] Arquivos de {user_id_filter}/{project_name_safe} não removidos ({fs_reason})")
+        return "skipped", 0
+    video_ids = list((db.reference(f'projects/{user_id_filter}/{project_name_safe}/videos',
+                                   app=app_instance).get(shallow=True) or {}).keys())
+    _unregister_videos(user_id_filter, project_name_safe, video_ids, remove_project=True)
+    _clear_project_cache_entries(user_id_filter, project_name_safe)
+    _release_blobs(user_id_filter, project_name_safe)
+    for user_dir in storage.user_dirs(user_id_filter):
+        _cleanup_user_dir_if_empty(user_dir)
+    logger.info(f"[EXPIRY] Projeto {user_id_filter}/{project_name_safe} removido (venceu em {entry.get('deleteAfter')})")
+    return "reaped", reclaimed
+
+def _metadata_user_keys():
+    """Usuários com projetos (leitura rasa: só as chaves de projects/)."""
+    return list(db.reference('projects', app=app_instance).get(shallow=True) or {})
+
+def _stored_items(user_id_filter):
+    """
+    Itens do usuário com arquivo no disco: [(projeto, video_id, serverFilePath)], numa leitura
+    direta no Firebase. Os jobs em segundo plano passam por todos os usuários: ler pelo espelho
+    carregaria cada um no SQLite compartilhado e abriria um listener por usuário (derrubando os
+    listeners dos usuários ativos).
+    """
+    items = []
+    projects_tree = db.reference(f'projects/{user_id_filter}', app=app_instance).get() or {}
+    for project_key, project_details in projects_tree.items():
+        if not isinstance(project_details, dict):
+            continue
+        for vid, video_data in (project_details.get('videos') or {}).items():
+            if isinstance(video_data, dict) and video_data.get('serverFilePath'):
+                items.append((project_key, vid, video_data['serverFilePath']))
+    return items
+
+def _repair_orphan_file(path, entry):
+    """Descarta um arquivo órfão (lixeira) e solta a referência ao blob se o item não existe mais."""
+    user_id_filter, project_name_safe, video_id = entry["user"], entry.get("project"), entry.get("video_id")
+    video_data = _read_video_direct(user_id_filter, project_name_safe, video_id) if project_name_safe and video_id else None
+    if isinstance(video_data, dict) and storage.resolve(video_data.get('serverFilePath')) == path:
+        # o item foi gravado depois da listagem
+        return False
+    try:
+        _discard_path(path)
+    except FileNotFoundError:
+        return False
+    if project_name_safe and video_id and not isinstance(video_data, dict):
+        _release_blobs(user_id_filter, project_name_safe, [video_id])
+    logger.info(f"[SCAN] Arquivo órfão descartado: {entry['path']} ({entry.get('size')} bytes)")
+    return True
+
+def _repair_missing_item(entry):
+    """Remove o item cujo arquivo não existe mais, como o DELETE do item. False se algo mudou desde a listagem."""
+    user_id_filter, project_name_safe, video_id = entry["user"], entry["project"], entry["video_id"]
+    video_data = _read_video_direct(user_id_filter, project_name_safe, video_id)
+    if not isinstance(video_data, dict) or video_data.get('serverFilePath') != entry["serverFilePath"]:
+        return False
+    path = storage.resolve(entry["serverFilePath"])
+    if not path or os.path.exists(path):
+        return False
+    size = video_data.get('size')
+    _unregister_videos(user_id_filter, project_name_safe, [video_id],
+                       removed_bytes=size if isinstance(size, (int, float)) else 0)
+    _release_blobs(user_id_filter, project_name_safe, [video_id])
+    video_path_cache.delete((user_id_filter, project_name_safe, video_id))
+    video_path_cache.delete((user_id_filter, None, video_id))
+    logger.info(f"[SCAN] Item sem arquivo removido: {user_id_filter}/{project_name_safe}/{video_id}")
+    return True
+
+def _flat_layout_items(user_id_filter):
+    """
+    Itens do usuário que ainda não estão no caminho com fan-out: [(projeto, video_id, serverFilePath)].
+    A migração passa por todos os usuários uma vez: lê direto do Firebase (_stored_items), sem o espelho.
+    """
+    items = []
+    for project_key, vid, server_file_path in _stored_items(user_id_filter):
+        path = storage.resolve(server_file_path)
+        if path and path != storage.item_path(user_id_filter, project_key, vid, os.path.basename(path),
+                                               storage.volume_of(path)):
+            items.append((project_key, vid, server_file_path))
+    return items
+
+def _commit_item_path(user_id_filter, project_name_safe, video_id, server_file_path):
+    """Grava o novo serverFilePath do item (projeto + video_index). False se o item não existe mais."""
+    video_data = _read_video_direct(user_id_filter, project_name_safe, video_id)
+    if not isinstance(video_data, dict):
+        return False
+    _db_update({
+        f'projects/{user_id_filter}/{project_name_safe}/videos/{video_id}/serverFilePath': server_file_path,
+        f'video_index/{user_id_filter}/{video_id}': {
+            "project": project_name_safe,
+            "serverFilePath": server_file_path,
+            "filename": video_data.get('filename'),
+        },
+    })
+    video_path_cache.delete((user_id_filter, project_name_safe, video_id))
+    video_path_cache.delete((user_id_filter, None, video_id))
+    return True
+
+def _project_exists_key(user_id_filter, project_name_safe):
+    return ("exists", user_id_filter, project_name_safe)
+
+def project_exists(user_id_filter, project_name_safe):
+    """
+    Verifica se o projeto existe sem baixar o nó (que inclui os metadados de todos os itens):
+    bit de existência no cache compartilhado -> espelho local -> leitura rasa no Firebase
+    (só as chaves filhas do projeto, tamanho constante). Só a existência é guardada no cache;
+    delete_project remove o bit junto com o grupo (usuario, projeto), em todos os workers.
+    """
+    cache_key = _project_exists_key(user_id_filter, project_name_safe)
+    if video_path_cache.get(cache_key):
+        return True
+    if _mirror_ready(user_id_filter):
+        exists = metadata_mirror.project_exists(user_id_filter, project_name_safe)
+    else:
+        exists = db.reference(f'projects/{user_id_filter}/{project_name_safe}',
+                              app=app_instance).get(shallow=True) is not None
+    if exists:
+        video_path_cache.set(cache_key, True, group=(user_id_filter, project_name_safe))
+    return exists
+
+def _read_project_video_ids(user_id_filter, project_name_safe):
+    if _mirror_ready(user_id_filter):
+        return metadata_mirror.project_video_ids(user_id_filter, project_name_safe)
+    return list((db.reference(f'projects/{user_id_filter}/{project_name_safe}/videos',
+                              app=app_instance).get(shallow=True) or {}).keys())
+
+def _update_project_stats(user_id_filter, project_name_safe, count_delta, bytes_delta, uploaded_at=None):
+    """
+    Ajusta o resumo do projeto por transação (uploads/deletes concorrentes não se perdem).
+    Se o resumo ainda não existe (projeto anterior aos contadores), nada é gravado: o
+    list_projects o calcula na primeira leitura.
+    """
+    def apply(current):
+        if not isinstance(current, dict):
+            return current
+        current["fileCount"] = max(0, (current.get("fileCount") or 0) + count_delta)
+        current["totalBytes"] = max(0, (current.get("totalBytes") or 0) + bytes_delta)
+        if uploaded_at and (not current.get("lastUploadAt") or uploaded_at > current["lastUploadAt"]):
+            current["lastUploadAt"] = uploaded_at
+        return current
+
+    try:
+        db.reference(f'project_stats/{user_id_filter}/{project_name_safe}', app=app_instance).transaction(apply)
+    except Exception as e:
+        logger.warning(f"[STATS] Falha ao atualizar resumo de {user_id_filter}/{project_name_safe}: {e}")
+    _adjust_usage(user_id_filter, count_delta, bytes_delta)
+
+def _adjust_usage(user_id_filter, count_delta, bytes_delta):
+    """
+    Ajusta usage/{usuario} por transação. Enquanto o nó não existe (usuário ainda não
+    recalculado), nada é gravado: _read_user_usage o calcula a partir dos resumos por projeto.
+    """
+    def apply(current):
+        if not isinstance(current, dict):
+            return current
+        current["files"] = max(0, (current.get("files") or 0) + count_delta)
+        current["bytes"] = max(0, (current.get("bytes") or 0) + bytes_delta)
+        return current
+
+    if not count_delta and not bytes_delta:
+        return
+    try:
+        db.reference(f'usage/{user_id_filter}', app=app_instance).transaction(apply)
+    except Exception as e:
+        logger.warning(f"[USAGE] Falha ao atualizar uso de {user_id_filter}: {e}")
+
+def _reconcile_user_usage(user_id_filter):
+    """Recalcula usage/{usuario} somando os resumos project_stats (mantém quotaBytes)."""
+    stats = _load_project_stats(user_id_filter)
+    totals = {
+        "files": sum(s.get("fileCount") or 0 for _, s in stats),
+        "bytes": sum(s.get("totalBytes") or 0 for _, s in stats),
+        "reconciledAt": datetime.now().isoformat(),
+    }
+
+    previous = {}
+
+    def apply(current):
+        current = current if isinstance(current, dict) else {}
+        previous["bytes"] = current.get("bytes")
+        return {**current, **totals}
+
+    usage = db.reference(f'usage/{user_id_filter}', app=app_instance).transaction(apply)
+    if previous.get("bytes") is not None and previous["bytes"] != totals["bytes"]:
+        logger.info(f"[USAGE] Uso de {user_id_filter} corrigido: {previous['bytes']} -> {totals['bytes']} bytes")
+    usage_reconciled.set(user_id_filter, True)
+    return usage
+
+def _read_user_usage(user_id_filter):
+    """usage/{usuario} ({files, bytes, quotaBytes?}), recalculado a cada USAGE_RECONCILE_INTERVAL por worker."""
+    if usage_reconciled.get(user_id_filter) is None:
+        return _reconcile_user_usage(user_id_filter)
+    usage = db.reference(f'usage/{user_id_filter}', app=app_instance).get()
+    if not isinstance(usage, dict) or "bytes" not in usage:
+        return _reconcile_user_usage(user_id_filter)
+    return usage
+
+def _upload_limits(user_id_filter):
+    """
+    Limites de upload do usuário: {"file": maior arquivo aceito, "remaining": bytes livres na
+    cota ou None sem cota}. maxFileSize (MB) vem das preferências salvas em /api/settings.
+    """
+    file_limit = MAX_UPLOAD_SIZE
+    try:
+        preferences = (_read_user_settings(user_id_filter) or {}).get('preferences') or {}
+        max_file_size_mb = preferences.get('maxFileSize')
+        if isinstance(max_file_size_mb, (int, float)) and max_file_size_mb > 0:
+            file_limit = min(file_limit, int(max_file_size_mb * 1024 * 1024))
+    except Exception as e:
+        logger.warning(f"[USAGE] Preferências de {user_id_filter} indisponíveis ({e}); usando MAX_UPLOAD_SIZE")
+
+    remaining = None
+    try:
+        usage = _read_user_usage(user_id_filter) or {}
+        quota = usage.get("quotaBytes") or USER_STORAGE_QUOTA
+        if quota:
+            remaining = max(0, quota - (usage.get("bytes") or 0))
+    except Exception as e:
+        # sem leitura do uso, o upload segue só com o limite por arquivo
+        logger.warning(f"[USAGE] Uso de {user_id_filter} indisponível ({e}); cota não verificada")
+    return {"file": file_limit, "remaining": remaining}
+
+def _upload_stream_limit(limits):
+    """Bytes que podem ser gravados para um arquivo antes de o upload ser interrompido."""
+    if limits["remaining"] is None:
+        return limits["file"]
+    return min(limits["file"], limits["remaining"])
+
+def _upload_limit_error(limits, size):
+    """Mensagem do 413 para um arquivo de size bytes, ou None se ele cabe nos limites."""
+    if size > limits["file"]:
+        return f"Arquivo excede o tamanho máximo permitido ({limits['file']} bytes)"
+    if limits["remaining"] is not None and size > limits["remaining"]:
+        return f"Cota de armazenamento excedida ({limits['remaining']} bytes disponíveis)"
+    return None
+
+def _register_video(user_id_filter, project_name_safe, video_id, video_data):
+    """
+    Grava os metadados do item no projeto, a entrada correspondente no índice global
+    video_index/{usuario}/{video_id} e a entrada no log project_changes numa única
+    atualização multi-caminho, e soma o item ao resumo project_stats do projeto.
+    """
+    _register_videos(user_id_filter, project_name_safe, {video_id: video_data})
+
+def _register_videos(user_id_filter, project_name_safe, videos, project_data=None):
+    """
+    Mesmo que _register_video para vários itens {video_id: dados} numa única atualização
+    multi-caminho. Com project_data, o nó do projeto é criado na mesma atualização (com o
+    resumo já contando os itens); senão os itens são somados ao resumo numa só transação.
+    """
+    updates = {}
+    if project_data is not None:
+        # os itens vão dentro do nó do projeto: o Firebase recusa uma atualização multi-caminho
+        # com um caminho dentro de outro (projects/u/p e projects/u/p/videos/id)
+        project_data = dict(project_data, videos=dict(videos))
+        updates.update(_project_node_updates(user_id_filter, project_name_safe, project_data, videos))
+    for video_id, video_data in videos.items():
+        if project_data is None:
+            updates[f'projects/{user_id_filter}/{project_name_safe}/videos/{video_id}'] = video_data
+        updates[f'video_index/{user_id_filter}/{video_id}'] = {
+            "project": project_name_safe,
+            "serverFilePath": video_data.get("serverFilePath"),
+            "filename": video_data.get("filename"),
+        }
+    updates.update(_change_updates(user_id_filter, [
+        _change_entry("video", "upsert", project_name_safe, video_id,
+                      data={k: v for k, v in video_data.items() if k != "serverFilePath"})
+        for video_id, video_data in videos.items()
+    ]))
+    _db_update(updates)
+    if project_data is not None:
+        video_path_cache.set(_project_exists_key(user_id_filter, project_name_safe), True,
+                             group=(user_id_filter, project_name_safe))
+        _adjust_usage(user_id_filter, len(videos), sum(v.get("size") or 0 for v in videos.values()))
+    elif videos:
+        upload_times = [v.get("uploadedAt") for v in videos.values() if v.get("uploadedAt")]
+        _update_project_stats(user_id_filter, project_name_safe, len(videos),
+                              sum(v.get("size") or 0 for v in videos.values()),
+                              max(upload_times) if upload_times else None)
+    _bump_user_version(user_id_filter, 'projects')
+
+def _unregister_videos(user_id_filter, project_name_safe, video_ids, remove_project=False, removed_bytes=0):
+    """
+    Remove itens do projeto (ou o projeto inteiro) e as entradas do índice video_index
+    numa única atualização multi-caminho, registrando as exclusões (tombstones) no log
+    project_changes. removed_bytes (soma dos "size" dos itens) é descontado do resumo project_stats.
+    """
+    updates = {f'video_index/{user_id_filter}/{video_id}': None for video_id in video_ids}
+    project_stats = None
+    if remove_project:
+        # o resumo sai junto com o projeto: o que ele contava é descontado do uso do usuário
+        project_stats = db.reference(f'project_stats/{user_id_filter}/{project_name_safe}', app=app_instance).get()
+        updates[f'projects/{user_id_filter}/{project_name_safe}'] = None
+        updates[f'project_stats/{user_id_filter}/{project_name_safe}'] = None
+        # um tombstone do projeto vale para todos os seus itens
+        updates.update(_change_updates(user_id_filter, [_change_entry("project", "delete", project_name_safe)]))
+    else:
+        for video_id in video_ids:
+            updates[f'projects/{user_id_filter}/{project_name_safe}/videos/{video_id}'] = None
+        updates.update(_change_updates(user_id_filter, [
+            _change_entry("video", "delete", project_name_safe, video_id) for video_id in video_ids
+        ]))
+    if updates:
+        _db_update(updates)
+    if video_ids and not remove_project:
+        _update_project_stats(user_id_filter, project_name_safe, -len(video_ids), -removed_bytes)
+    if isinstance(project_stats, dict):
+        _adjust_usage(user_id_filter, -(project_stats.get("fileCount") or 0), -(project_stats.get("totalBytes") or 0))
+    _bump_user_version(user_id_filter, 'projects')
+
+_PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+def _change_key(timestamp_ms=None, suffix=None):
+    """
+    Chave no formato dos push ids do Firebase (8 caracteres de tempo + 12 aleatórios), gerada
+    localmente: a ordem das chaves é a ordem temporal, sem uma ida ao banco para o push().
+    """
+    if timestamp_ms is None:
+        timestamp_ms = int(time.time() * 1000)
+    prefix = []
+    for _ in range(8):
+        prefix.append(_PUSH_CHARS[timestamp_ms % 64])
+        timestamp_ms //= 64
+    if suffix is None:
+        suffix = ''.join(_PUSH_CHARS[b % 64] for b in os.urandom(12))
+    return ''.join(reversed(prefix)) + suffix
+
+def _change_entry(entity_type, op, project_name_safe, item_id=None, data=None):
+    entry = {"type": entity_type, "op": op, "project": project_name_safe,
+             "changedAt": datetime.utcnow().isoformat() + 'Z'}
+    if item_id is not None:
+        entry["id"] = item_id
+    if data is not None:
+        entry["data"] = data
+    return entry
+
+def _change_updates(user_id_filter, entries):
+    """Caminhos de project_changes/{usuario} para entrar na mesma atualização multi-caminho da alteração."""
+    return {f'project_changes/{user_id_filter}/{_change_key()}': entry for entry in entries}
+
+def _coalesce_project_changes(items):
+    """
+    Junta as entradas [(chave, entrada)] por entidade, na ordem da última alteração: upserts
+    seguidos são mesclados; um delete substitui o que veio antes; um upsert depois de um delete
+    (entidade recriada) recomeça o estado.
+    """
+    state = {}
+    for key, entry in items:
+        entity = (entry.get("type"), entry.get("project"), entry.get("id"))
+        current = state.pop(entity, None)
+        if entry.get("op") == "upsert" and current is not None and current["op"] == "upsert":
+            current = dict(current, data={**current.get("data", {}), **(entry.get("data") or {})},
+                           changedAt=entry.get("changedAt"))
+        else:
+            current = {k: v for k, v in entry.items() if k != "data"}
+            if entry.get("op") == "upsert":
+                current["data"] = dict(entry.get("data") or {})
+        state[entity] = current  # reinserido: a ordem do dict segue a última alteração
+    return list(state.values())
+
+def _maybe_compact_project_changes(user_id_filter):
+    """
+    Remove do log as entradas mais antigas que PROJECT_CHANGES_RETENTION_DAYS (no máximo uma vez
+    por PROJECT_CHANGES_COMPACT_INTERVAL por usuário e worker) e grava em
+    project_changes_meta/{usuario}/compactedBefore a maior chave removida.
+    """
+    if changes_compacted.get(user_id_filter):
+        return
+    changes_compacted.set(user_id_filter, True)
+    cutoff_ms = int(time.time() * 1000) - PROJECT_CHANGES_RETENTION_DAYS * 86400 * 1000
+    cutoff = _change_key(cutoff_ms, _PUSH_CHARS[0] * 12)
+    try:
+        old = (db.reference(f'project_changes/{user_id_filter}', app=app_instance)
+               .order_by_key().end_at(cutoff).limit_to_first(PROJECT_CHANGES_PAGE_MAX).get()) or {}
+        if not old:
+            return
+        updates = {f'project_changes/{user_id_filter}/{key}': None for key in old}
+        updates[f'project_changes_meta/{user_id_filter}/compactedBefore'] = max(old)
+        db.reference('/', app=app_instance).update(updates)
+        logger.info(f"[CHANGES] {len(old)} alterações antigas removidas do log de {user_id_filter}")
+        if len(old) >= PROJECT_CHANGES_PAGE_MAX:
+            # ainda há entradas antigas: a próxima chamada continua
+            changes_compacted.delete(user_id_filter)
+    except Exception as e:
+        logger.warning(f"[CHANGES] Falha ao compactar log de {user_id_filter}: {e}")
+
+def _db_update(updates):
+    """Atualização multi-caminho no Firebase (fonte da verdade) repetida no espelho local."""
+    db.reference('/', app=app_instance).update(updates)
+    if metadata_mirror is not None:
         try:
-            del video_path_cache[k]
-        except Exception:
-            pass
+            metadata_mirror.apply_updates(updates)
+        except Exception as e:
+            # o listener e a reconciliação corrigem o espelho depois
+            logger.warning(f"[MIRROR] Falha ao aplicar escrita no espelho local: {e}")
+
+_metadata_reconcile_lock = threading.Lock()
+_metadata_reconcile_next = 0
+
+def _mirror_ready(user_id_filter):
+    """
+    True se as leituras do usuário podem vir do espelho local; na primeira leitura o usuário é
+    carregado do Firebase. False com METADATA_SOURCE=firebase ou se o espelho falhar.
+    """
+    if metadata_mirror is None:
+        return False
+    _maybe_reconcile_metadata()
+    try:
+        if not metadata_mirror.touch(user_id_filter):
+            _sync_user_metadata(user_id_filter)
+        # o estado inicial do listener recarrega o usuário, cobrindo alterações entre a leitura e o listen
+        project_events.ensure_listener(user_id_filter)
+        return True
+    except Exception as e:
+        logger.warning(f"[MIRROR] Espelho indisponível para {user_id_filter} ({e}); lendo do Firebase")
+        return False
+
+def _sync_user_metadata(user_id_filter):
+    """Carrega (ou recarrega) projects/{usuario} e user_settings/{usuario} do Firebase no espelho."""
+    projects_tree = db.reference(f'projects/{user_id_filter}', app=app_instance).get() or {}
+    settings = db.reference(f'user_settings/{user_id_filter}', app=app_instance).get()
+    metadata_mirror.load_user(user_id_filter, projects_tree)
+    metadata_mirror.set_settings(user_id_filter, settings)
+    logger.info(f"[MIRROR] {user_id_filter} sincronizado com o Firebase ({len(projects_tree)} projetos)")
+    return projects_tree
+
+def _release_user_metadata(user_id_filter):
+    """Listener do usuário fechado neste worker: a próxima leitura recarrega o usuário do Firebase."""
+    if metadata_mirror is not None:
+        metadata_mirror.forget(user_id_filter)
+
+def _maybe_reconcile_metadata():
+    """
+    No máximo uma vez por minuto por worker, numa thread: recarrega os usuários lidos e não
+    sincronizados há mais de METADATA_RECONCILE_INTERVAL segundos (rede de segurança dos listeners).
+    """
+    global _metadata_reconcile_next
+    if time.time() < _metadata_reconcile_next or not _metadata_reconcile_lock.acquire(blocking=False):
+        return
+    _metadata_reconcile_next = time.time() + 60
+
+    def run():
+        try:
+            for user_key in metadata_mirror.claim_reconcile(METADATA_RECONCILE_INTERVAL):
+                try:
+                    _sync_user_metadata(user_key)
+                except Exception as e:
+                    logger.warning(f"[MIRROR] Falha ao reconciliar {user_key}: {e}")
+        except Exception as e:
+            logger.warning(f"[MIRROR] Falha na reconciliação do espelho: {e}")
+        finally:
+            _metadata_reconcile_lock.release()
+
+    threading.Thread(target=run, name="metadata-reconcile", daemon=True).start()
+
+def _read_user_projects(user_id_filter):
+    if _mirror_ready(user_id_filter):
+        return metadata_mirror.user_projects(user_id_filter)
+    return db.reference(f'projects/{user_id_filter}', app=app_instance).get() or {}
+
+def _read_project(user_id_filter, project_name_safe):
+    if _mirror_ready(user_id_filter):
+        return metadata_mirror.project(user_id_filter, project_name_safe)
+    return db.reference(f'projects/{user_id_filter}/{project_name_safe}', app=app_instance).get()
+
+def _read_video(user_id_filter, project_name_safe, video_id):
+    if _mirror_ready(user_id_filter):
+        return metadata_mirror.video(user_id_filter, project_name_safe, video_id)
+    return db.reference(f'projects/{user_id_filter}/{project_name_safe}/videos/{video_id}', app=app_instance).get()
+
+def _read_video_direct(user_id_filter, project_name_safe, video_id):
+    """Leitura pontual no Firebase, sem o espelho (jobs em segundo plano, ver _stored_items)."""
+    return db.reference(f'projects/{user_id_filter}/{project_name_safe}/videos/{video_id}', app=app_instance).get()
+
+def _read_user_settings(user_id_filter):
+    if _mirror_ready(user_id_filter):
+        found, settings = metadata_mirror.settings(user_id_filter)
+        if found:
+            return settings
+        settings = db.reference(f'user_settings/{user_id_filter}', app=app_instance).get()
+        metadata_mirror.set_settings(user_id_filter, settings)
+        return settings
+    return db.reference(f'user_settings/{user_id_filter}', app=app_instance).get()
+
+def _bump_user_version(user_id_filter, *scopes):
+    """Invalida ETags e corpos em cache dos escopos do usuário (em todos os workers)."""
+    if user_versions is None:
+        return
+    try:
+        user_versions.bump(user_id_filter, *scopes)
+    except Exception as e:
+        logger.warning(f"[ETAG] Falha ao atualizar carimbo de {user_id_filter} {scopes}: {e}")
+
+def _versioned_json(user_id_filter, scope, variant, build):
+    """
+    Resposta JSON condicional pelo carimbo de versão do escopo:
+      - If-None-Match igual ao carimbo atual -> 304, sem chamar build();
+      - senão reutiliza o corpo já serializado desta variante, se gerado no mesmo carimbo;
+      - senão build() -> (payload, status); só respostas 200 são guardadas.
+    O carimbo é lido antes de build(), então um corpo em cache nunca é mais antigo que seu ETag.
+    """
+    if user_versions is None:
+        payload, status = build()
+        return jsonify(payload), status
+    try:
+        version = user_versions.get(user_id_filter, scope)
+    except Exception as e:
+        logger.warning(f"[ETAG] Carimbo indisponível para {user_id_filter}: {e}")
+        payload, status = build()
+        return jsonify(payload), status
+
+    etag = f"{scope}-{version}"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        cache_key = (user_id_filter, scope, variant)
+        cached = response_cache.get(cache_key)
+        if cached is not None and cached[0] == version:
+            body = cached[1]
+        else:
+            payload, status = build()
+            if status != 200:
+                return jsonify(payload), status
+            body = jsonify(payload).get_data()
+            response_cache.set(cache_key, (version, body), size=len(body))
+        response = app.response_class(body, status=200, mimetype=app.json.mimetype)
+    response.set_etag(etag, weak=True)
+    # o navegador pode guardar, mas sempre revalida (a revalidação é barata)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def _project_stats_from_node(project_key, project_details):
+    videos = [v for v in (project_details.get("videos") or {}).values() if isinstance(v, dict)]
+    upload_times = [v.get("uploadedAt") for v in videos if v.get("uploadedAt")]
+    return {
+        "name": project_details.get("name", project_key),
+        "fileCount": len(videos),
+        "totalBytes": sum(v.get("size") or 0 for v in videos if isinstance(v.get("size"), (int, float))),
+        "lastUploadAt": max(upload_times) if upload_times else None,
+    }
+
+def _load_project_stats(user_id_filter):
+    """
+    Resumos de todos os projetos do usuário: lê project_stats/{usuario} e as chaves de
+    projects/{usuario} (leitura rasa). Projetos sem resumo são calculados uma única vez e
+    gravados; resumos de projetos que não existem mais são removidos.
+    Com o espelho local, os resumos são calculados nele, sem leitura no Firebase.
+    Retorna [(chave, resumo)] na ordem das chaves.
+    """
+    if _mirror_ready(user_id_filter):
+        return metadata_mirror.project_stats(user_id_filter)
+    stats = db.reference(f'project_stats/{user_id_filter}', app=app_instance).get() or {}
+    project_keys = list((db.reference(f'projects/{user_id_filter}', app=app_instance).get(shallow=True) or {}).keys())
+
+    updates = {}
+    for key in project_keys:
+        if not isinstance(stats.get(key), dict):
+            details = db.reference(f'projects/{user_id_filter}/{key}', app=app_instance).get()
+            if isinstance(details, dict):
+                stats[key] = _project_stats_from_node(key, details)
+                updates[f'project_stats/{user_id_filter}/{key}'] = stats[key]
+    for key in set(stats) - set(project_keys):
+        updates[f'project_stats/{user_id_filter}/{key}'] = None
+    if updates:
+        logger.info(f"[STATS] Resumos recalculados/removidos para {user_id_filter}: {len(updates)}")
+        db.reference('/', app=app_instance).update(updates)
+    return [(key, stats[key]) for key in project_keys if isinstance(stats.get(key), dict)]
+
+def _backfill_video_index(user_id_filter):
+    """
+    Popula video_index/{usuario} a partir de projects/{usuario} para itens enviados antes do índice.
+    Executado uma única vez por usuário (marcado em video_index_backfill/{usuario}).
+    """
+    projects_data = db.reference(f'projects/{user_id_filter}', app=app_instance).get() or {}
+    updates = {}
+    for project_key, project_details in projects_data.items():
+        if not isinstance(project_details, dict):
+            continue
+        for vid, video_data in (project_details.get('videos') or {}).items():
+            if isinstance(video_data, dict):
+                updates[f'video_index/{user_id_filter}/{vid}'] = {
+                    "project": project_key,
+                    "serverFilePath": video_data.get('serverFilePath'),
+                    "filename": video_data.get('filename'),
+                }
+    updates[f'video_index_backfill/{user_id_filter}'] = datetime.utcnow().isoformat()
+    db.reference('/', app=app_instance).update(updates)
+    logger.info(f"[VIDEO-INDEX] Índice reconstruído para {user_id_filter} ({len(updates) - 1} itens)")
+    return updates
+
+def resolve_video_by_id(user_id_filter, video_id, log_tag="VIDEO-INDEX"):
+    """
+    Resolve (serverFilePath, filename) só pelo id do vídeo: cache compartilhado -> espelho local ou
+    leitura pontual em video_index/{usuario}/{video_id}. Usuários com dados anteriores ao índice passam por uma
+    reconstrução única do índice.
+    Retorna (serverFilePath, filename) ou (None, None)
+    """
+    cache_key = (user_id_filter, None, video_id)
+    cached_data = video_path_cache.get(cache_key)
+    if cached_data:
+        logger.info(f"[{log_tag}] Cache HIT para {video_id}")
+        return cached_data['path'], cached_data['filename']
+
+    try:
+        if _mirror_ready(user_id_filter):
+            # o espelho tem os itens indexados por (usuario, video_id): dispensa o video_index
+            project, video_data = metadata_mirror.video_by_id(user_id_filter, video_id)
+            entry = dict(video_data, project=project) if video_data else None
+        else:
+            entry = db.reference(f'video_index/{user_id_filter}/{video_id}', app=app_instance).get()
+            if not entry:
+                backfilled = db.reference(f'video_index_backfill/{user_id_filter}', app=app_instance).get()
+                if not backfilled:
+                    entry = _backfill_video_index(user_id_filter).get(f'video_index/{user_id_filter}/{video_id}')
+    except Exception as e:
+        logger.error(f"[{log_tag}] Erro ao consultar video_index: {e}", exc_info=True)
+        return None, None
+
+    if not entry or not entry.get('serverFilePath') or not entry.get('filename'):
+        return None, None
+
+    video_path_cache.set(
+        cache_key,
+        {'path': entry['serverFilePath'], 'filename': entry['filename'], 'project': entry.get('project')},
+        group=(user_id_filter, entry.get('project'))
+    )
+    logger.info(f"[{log_tag}] Cache MISS - dados salvos para {video_id}")
+    return entry['serverFilePath'], entry['filename']
 
 def find_video_optimized_direct(user_id_filter, project_name_safe, video_id):
     """
@@ -1556,8 +3522,7 @@ def find_video_optimized_direct(user_id_filter, project_name_safe, video_id):
     Retorna (serverFilePath, filename) ou (None, None)
     """
     try:
-        video_ref = db.reference(f'projects/{user_id_filter}/{project_name_safe}/videos/{video_id}', app=app_instance)
-        video_data = video_ref.get()
+        video_data = _read_video(user_id_filter, project_name_safe, video_id)
 
         if video_data:
             video_path = video_data.get('serverFilePath')